@@ -1,7 +1,14 @@
+import os
+import hmac
+import uuid
 import streamlit as st
 import pandas as pd
-from data_loader import load_data
-from generator import generate_blog_post
+from data_loader import load_data, get_data_status, get_dentist_index
+from generator import get_near_duplicate_index, warm_near_duplicate_index
+from jobs import JobQueue, JobLimitError, stream_job, QUEUED, RUNNING, DONE, FAILED
+from near_duplicate import DUPLICATE_THRESHOLD
+from metrics import metrics, start_http_server
+from compliance import audit_corpus
 
 # Page Config
 st.set_page_config(
@@ -114,7 +121,195 @@ footer {visibility: hidden;}
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def start_metrics_server(port):
+    """Serves Prometheus metrics on METRICS_PORT, once per process."""
+    return start_http_server(port)
+
+def is_admin():
+    """
+    True when the ?admin= query parameter matches ADMIN_TOKEN in secrets.toml.
+    Without a configured token the admin panel is off.
+    """
+    try:
+        token = st.secrets.get("ADMIN_TOKEN")
+    except FileNotFoundError:
+        return False
+    given = st.query_params.get("admin")
+    return bool(token) and given is not None and hmac.compare_digest(given.encode(), str(token).encode())
+
+def render_admin_panel():
+    """Recent latency percentiles and counters of this process (open the app with ?admin=<ADMIN_TOKEN>)."""
+    snapshot = metrics.snapshot()
+    with st.expander("📊 성능 지표 (관리자)"):
+        if snapshot["spans"]:
+            st.dataframe(pd.DataFrame([
+                {
+                    "구간": name,
+                    "횟수": span["count"],
+                    "오류": span["errors"],
+                    "p50 (ms)": round(span["p50"] * 1000, 1),
+                    "p90 (ms)": round(span["p90"] * 1000, 1),
+                    "p99 (ms)": round(span["p99"] * 1000, 1),
+                }
+                for name, span in snapshot["spans"].items()
+            ]), hide_index=True, use_container_width=True)
+        else:
+            st.caption("아직 기록된 지표가 없습니다.")
+        if snapshot["counters"]:
+            st.dataframe(pd.DataFrame([
+                {
+                    "지표": counter["name"],
+                    "라벨": ", ".join(f"{k}={v}" for k, v in counter["labels"].items()),
+                    "값": counter["value"],
+                }
+                for counter in snapshot["counters"]
+            ]), hide_index=True, use_container_width=True)
+        st.download_button("Prometheus 형식으로 내려받기", metrics.prometheus_text(), file_name="metrics.txt")
+
+        if st.button("전체 글 의료법 표현 점검"):
+            corpus = get_dentist_index().corpus
+            report = audit_corpus(corpus.contents(range(len(corpus))))
+            st.caption(f"전체 {report['posts']:,}개 중 {report['flagged']:,}개 글에서 문제 표현이 발견되었습니다.")
+            if report["by_term"]:
+                st.dataframe(pd.DataFrame(list(report["by_term"].items()), columns=["표현", "건수"]), hide_index=True)
+
+        if st.button("전체 글 중복 묶음 찾기"):
+            corpus = get_dentist_index().corpus
+            duplicates = get_near_duplicate_index()
+            duplicates.update(corpus)
+            corpus = duplicates.corpus  # The corpus the cluster positions refer to
+            clusters = duplicates.clusters()
+            st.caption(f"전체 {len(corpus):,}개 중 {sum(len(c) for c in clusters):,}개 글이 {len(clusters):,}개 묶음으로 겹칩니다.")
+            if clusters:
+                st.dataframe(pd.DataFrame([
+                    {
+                        "글 수": len(cluster),
+                        "예시": ", ".join(f"{corpus.dentists[p]} / {corpus.topic(p)}" for p in cluster[:3]),
+                    }
+                    for cluster in clusters[:50]
+                ]), hide_index=True, use_container_width=True)
+
+# Seconds between status checks of a running generation job
+POLL_SECONDS = 1.0
+
+STATUS_LABELS = {QUEUED: "대기 중", RUNNING: "작성 중", DONE: "완료", FAILED: "실패"}
+LIMIT_MESSAGES = {
+    "queue_full": "지금은 요청이 많아 대기열이 가득 찼습니다. 잠시 후 다시 시도해주세요.",
+    "active": "이미 진행 중인 작업이 있습니다. 작업이 끝난 뒤 다시 시도해주세요.",
+    "rate": "1시간 동안 생성할 수 있는 글 수를 넘었습니다. 잠시 후 다시 시도해주세요.",
+}
+
+@st.cache_resource
+def get_job_queue():
+    """Process-wide background generation queue (see jobs.JobQueue)."""
+    return JobQueue(stream_job)
+
+def session_key():
+    """
+    Server-side ID of this user's jobs and job limits, kept in st.session_state.
+    A refreshed tab starts a new session; it resumes the session that owns the
+    job in its URL (only the job ID is kept there), else it gets a new one.
+    """
+    if "session_key" not in st.session_state:
+        owner = get_job_queue().owner(st.query_params.get("job"))
+        st.session_state["session_key"] = owner or uuid.uuid4().hex
+    return st.session_state["session_key"]
+
+def select_job(job_id):
+    st.session_state["job_id"] = job_id
+    st.query_params["job"] = job_id
+
+def render_job_panel(queue, job_id, session):
+    """Shows a job; while it is unfinished the panel re-renders itself every POLL_SECONDS."""
+    polling = not queue.get(job_id, session).done
+    st.fragment(_job_fragment, run_every=POLL_SECONDS if polling else None)(queue, job_id, session, polling)
+
+def _job_fragment(queue, job_id, session, polling):
+    job = queue.get(job_id, session)
+    if job is None:
+        return
+    render_job(queue, job)
+    if polling and job.done:
+        st.rerun()  # Render the final result once more without polling
+
+def render_job(queue, job):
+    dentist = job.params["dentist"]
+
+    # Result Card
+    if job.status == QUEUED:
+        title, message = "⏳ 대기 중...", f"앞에 {queue.position(job)}건의 작업이 있습니다. 곧 작성을 시작합니다."
+    elif job.status == RUNNING:
+        title, message = "✍️ 작성 중...", f"{dentist} 원장님 스타일로 작성하고 있습니다."
+    elif job.status == DONE:
+        title, message = "🎉 작성 완료", f"{dentist} 원장님 스타일로 작성되었습니다."
+    else:
+        st.error("글 생성에 실패했습니다. 잠시 후 다시 시도해주세요.")
+        st.caption(job.error)
+        return
+    st.markdown(f"""
+    <div class="apple-card">
+        <h3 style="margin-top: 0;">{title}</h3>
+        <p style="color: #86868b; font-size: 14px;">{message}</p>
+    </div>
+    """, unsafe_allow_html=True)
+    if job.status == QUEUED:
+        return
+
+    # Layout: 2 columns (Content vs Info)
+    col1, col2 = st.columns([3, 1])
+
+    with col2:
+        # References are known before the first token arrives
+        st.markdown('<div class="apple-card">', unsafe_allow_html=True)
+        st.markdown("#### 💡 참고한 글")
+        if job.references:
+            for idx, ref in enumerate(job.references, 1):
+                preview = ref[:50] + "..." if len(ref) > 50 else ref
+                st.caption(f"**RefereniCE #{idx}**")
+                st.caption(preview)
+                st.markdown("---")
+        else:
+            st.caption("참고할 데이터가 부족하여 일반적인 스타일로 작성되었습니다.")
+        if job.info.get("prompt_tokens"):
+            st.caption(f"참고 글 {job.info['tokens']:,} / {job.info['budget']:,} 토큰 · 프롬프트 {job.info['prompt_tokens']:,} 토큰")
+        if job.status == DONE and "similar" in job.info:
+            similar = job.info["similar"]
+            st.markdown("#### 🔁 기존 글과 겹침")
+            if similar:
+                for post in similar:
+                    st.caption(f"{post['dentist']} · {post['topic']} — 유사도 {post['similarity']:.0%}")
+                if similar[0]["similarity"] >= DUPLICATE_THRESHOLD:
+                    st.warning("기존 글과 많이 겹칩니다. 중복 문서로 보일 수 있으니 새로 생성하거나 내용을 고쳐주세요.")
+            else:
+                st.caption("크게 겹치는 기존 글이 없습니다.")
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    with col1:
+        st.markdown('<div class="apple-card">', unsafe_allow_html=True)
+        st.subheader("블로그 본문")
+        st.markdown(job.text)
+        if job.status == DONE:
+            compliance = job.info.get("compliance")
+            if compliance and compliance["violations"]:
+                st.caption(f"⚖️ 의료법상 문제 표현 {compliance['violations']}건을 찾아 문단 {compliance['rewritten']}개를 고쳤습니다.")
+                if compliance["remaining"]:
+                    st.warning("다음 표현은 직접 확인해주세요: " + ", ".join(compliance["remaining"]))
+            if job.cached:
+                st.caption("⚡ 같은 조건으로 생성된 글을 불러왔습니다. 새 글이 필요하면 '새로 생성하기'를 선택해주세요.")
+            elif job.info.get("input_tokens"):
+                st.caption(f"입력 {job.info['input_tokens']:,} 토큰 중 {job.info.get('cached_tokens') or 0:,} 토큰 캐시 재사용")
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        if job.status == DONE:
+            # Copy Helper
+            with st.expander("📝 텍스트 복사하기 (클릭)"):
+                st.code(job.text, language='markdown')
+
 def main():
+    if os.environ.get("METRICS_PORT"):
+        start_metrics_server(int(os.environ["METRICS_PORT"]))
+
     # Header Section
     st.markdown("<h1 style='text-align: center; margin-bottom: 40px;'>🦷 치과 블로그 포스팅 생성기</h1>", unsafe_allow_html=True)
 
@@ -126,6 +321,9 @@ def main():
         st.error("데이터를 불러오지 못했습니다. .streamlit/secrets.toml 설정을 확인해주세요.")
         return
 
+    if get_data_status().offline:
+        st.info("구글 시트에 연결할 수 없어 저장된 데이터로 실행 중입니다. (읽기 전용)")
+
     # Layout using columns for a centered card-like feel for inputs if needed, 
     # but sidebar is good for controls in this "app-like" feel.
     
@@ -136,8 +334,9 @@ def main():
         
         # 1. Dentist Selection
         st.write("작성자 선택")
-        dentists = df['DentistName'].unique().tolist()
-        dentist_list = sorted([str(d) for d in dentists])
+        dentist_index = get_dentist_index()
+        dentist_list = dentist_index.dentists
+        warm_near_duplicate_index(dentist_index)  # Sign new posts before the next similarity check needs them
         selected_dentist = st.selectbox("치과(원장님) 선택", dentist_list, label_visibility="collapsed")
         
         st.markdown("---")
@@ -169,53 +368,35 @@ def main():
         st.markdown("---")
         
         # 3. Generate Button
+        force_fresh = st.checkbox("새로 생성하기 (저장된 결과 무시)", value=False)
         generate_btn = st.button("글 생성하기 ✨")
 
+        # 4. Recent jobs of this user (kept in memory by the job queue)
+        history = get_job_queue().jobs(session_key())
+        if history:
+            with st.expander("🕘 최근 작업"):
+                for job in history:
+                    if st.button(f"{job.params['topic']} · {STATUS_LABELS[job.status]}", key=f"job_{job.id}"):
+                        select_job(job.id)
+
     # Main Area
+    queue = get_job_queue()
+    session = session_key()
     if generate_btn:
         if not topic or not keyword:
             st.warning("주제와 핵심 키워드를 모두 입력해주세요!")
         else:
-            with st.spinner(f"Creating content for {selected_dentist} ({selected_style_name})..."):
-                # Call Gemini Logic
-                generated_content, references = generate_blog_post(selected_dentist, topic, keyword, selected_style, context_input)
-            
-            if generated_content:
-                # Result Card
-                st.markdown(f"""
-                <div class="apple-card">
-                    <h3 style="margin-top: 0;">🎉 작성 완료</h3>
-                    <p style="color: #86868b; font-size: 14px;">{selected_dentist} 원장님 스타일로 작성되었습니다.</p>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Layout: 2 columns (Content vs Info)
-                col1, col2 = st.columns([3, 1])
-                
-                with col1:
-                    st.markdown('<div class="apple-card">', unsafe_allow_html=True)
-                    st.subheader("블로그 본문")
-                    st.markdown(generated_content)
-                    st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    # Copy Helper
-                    with st.expander("📝 텍스트 복사하기 (클릭)"):
-                        st.code(generated_content, language='markdown')
-
-                with col2:
-                    st.markdown('<div class="apple-card">', unsafe_allow_html=True)
-                    st.markdown("#### 💡 참고한 글")
-                    if references:
-                        for idx, ref in enumerate(references, 1):
-                            preview = ref[:50] + "..." if len(ref) > 50 else ref
-                            st.caption(f"**RefereniCE #{idx}**")
-                            st.caption(preview)
-                            st.markdown("---")
-                    else:
-                        st.caption("참고할 데이터가 부족하여 일반적인 스타일로 작성되었습니다.")
-                    st.markdown('</div>', unsafe_allow_html=True)
-            else:
-                st.error("글 생성에 실패했습니다. 잠시 후 다시 시도해주세요.")
+            # Runs on the shared worker pool; reruns and refreshes only poll the job
+            params = {"dentist": selected_dentist, "topic": topic, "keyword": keyword, "style": selected_style,
+                      "style_name": selected_style_name, "context": context_input, "fresh": force_fresh}
+            try:
+                select_job(queue.submit(session, params))
+            except JobLimitError as e:
+                st.warning(LIMIT_MESSAGES[e.reason])
+
+    job_id = st.session_state.get("job_id") or st.query_params.get("job")
+    if job_id and queue.get(job_id, session) is not None:
+        render_job_panel(queue, job_id, session)
     else:
         # Empty State / Landing View
         st.markdown("""
@@ -225,6 +406,9 @@ def main():
         </div>
         """, unsafe_allow_html=True)
 
+    if is_admin():
+        render_admin_panel()
+
     # Debug: Hidden by default
     # with st.expander("🔍 디버그 모드"):
     #     st.write(df)
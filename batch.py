@@ -0,0 +1,186 @@
+"""
+Batch generation: many blog posts from a JSONL/CSV file of jobs.
+
+Each job has the fields dentist, topic, keyword and optionally style,
+context and id. Results are appended to the output JSONL as soon as each
+job finishes, so a crashed run can simply be started again: jobs that
+already have a successful result are skipped.
+
+Usage:
+    python batch.py jobs.jsonl -o results.jsonl --workers 4 --rpm 30
+"""
+import os
+import csv
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from data_loader import get_dentist_index
+from generator import generate_post
+
+JOB_FIELDS = ("dentist", "topic", "keyword", "style", "context")
+
+# HTTP status codes worth retrying (rate limit / server side errors)
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+def job_id(job):
+    """Stable ID of a job: its explicit 'id', or a hash of the job fields."""
+    if job.get("id"):
+        return str(job["id"])
+    key = json.dumps([job.get(field, "") for field in JOB_FIELDS], ensure_ascii=False)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+def read_jobs(path):
+    """Reads jobs from a .jsonl or .csv file (header row with the JOB_FIELDS names)."""
+    jobs = []
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            job = {k: (v or "").strip() if isinstance(v, str) else v for k, v in row.items()}
+            job["style"] = job.get("style") or "Standard"
+            job["context"] = job.get("context") or ""
+            job["id"] = job_id(job)
+            jobs.append(job)
+    return jobs
+
+def load_done_ids(output_path):
+    """IDs of jobs that already have a successful result in the output file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # Partially written line from a crash
+            if not result.get("error"):
+                done.add(result["id"])
+    return done
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+class RateLimiter:
+    """Allows at most `per_minute` calls in any 60 second window (blocking)."""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self._calls = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._calls = [t for t in self._calls if now - t < 60]
+                if len(self._calls) < self.per_minute:
+                    self._calls.append(now)
+                    return
+                wait = 60 - (now - self._calls[0])
+            time.sleep(wait)
+
+def is_retryable(error):
+    """
+    True for rate limit (429) and 5xx errors from the Gemini API, judged by the
+    error's HTTP status code or its google.api_core exception type (never by
+    the message, which may well contain numbers like "5000 tokens").
+    """
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_CODES
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return False
+    return isinstance(error, (exceptions.TooManyRequests, exceptions.ResourceExhausted, exceptions.InternalServerError,
+                              exceptions.BadGateway, exceptions.ServiceUnavailable, exceptions.GatewayTimeout,
+                              exceptions.DeadlineExceeded))
+
+def call_with_retry(fn, limiter=None, retries=4, base_delay=2.0):
+    """Calls fn(), retrying retryable errors with exponential backoff and jitter."""
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            time.sleep(base_delay * (2 ** attempt) + random.uniform(0, base_delay))
+
+def run_batch(jobs, output_path, workers=4, rpm=60, retries=4, model=None, index=None, generate=None):
+    """
+    Runs jobs through a bounded thread pool and appends one JSON line per job
+    to `output_path` as it finishes. Jobs with a successful result already in
+    the output are skipped. `generate(job)` must return (text, references, info);
+    it defaults to generator.generate_post with one shared DentistIndex, and a
+    stub can be passed in for testing.
+    `rpm` caps the model calls per minute. generate_post takes a permit before
+    each of its calls (the post and the compliance rewrite); a stub `generate`
+    counts as one call per attempt.
+    Returns a summary dict.
+    """
+    limiter = RateLimiter(rpm)
+    attempt_limiter = limiter
+    if generate is None:
+        if index is None:
+            index = get_dentist_index()  # Loaded once and shared by every job
+        attempt_limiter = None
+
+        def generate(job):
+            return generate_post(job["dentist"], job["topic"], job["keyword"], job["style"], job["context"],
+                                 model=model, index=index, limiter=limiter)
+
+    done = load_done_ids(output_path)
+    pending = [job for job in jobs if job["id"] not in done]
+    summary = {"total": len(jobs), "skipped": len(jobs) - len(pending), "ok": 0, "failed": 0}
+
+    def run(job):
+        started = time.time()
+        try:
+            text, references, info = call_with_retry(lambda: generate(job), attempt_limiter, retries)
+            return {**job, "content": text, "references": references, "info": info, "error": None,
+                    "seconds": round(time.time() - started, 3)}
+        except Exception as e:
+            return {**job, "content": "", "references": [], "error": str(e),
+                    "seconds": round(time.time() - started, 3)}
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        if out.tell() and not _ends_with_newline(output_path):
+            out.write("\n")  # Close a line cut off by a crash, so the next result isn't glued to it
+        futures = [pool.submit(run, job) for job in pending]
+        for future in as_completed(futures):
+            result = future.result()
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            summary["failed" if result["error"] else "ok"] += 1
+            print(f"[{summary['ok'] + summary['failed']}/{len(pending)}] {result['id']} "
+                  f"{'FAILED: ' + result['error'] if result['error'] else 'ok'} ({result['seconds']}s)")
+
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate many blog posts from a JSONL/CSV file of jobs.")
+    parser.add_argument("jobs", help="Input .jsonl or .csv file")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="Output .jsonl file (appended)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent generations")
+    parser.add_argument("--rpm", type=int, default=60, help="Max model calls per minute")
+    parser.add_argument("--retries", type=int, default=4, help="Retries on 429/5xx errors")
+    args = parser.parse_args()
+
+    jobs = read_jobs(args.jobs)
+    summary = run_batch(jobs, args.output, workers=args.workers, rpm=args.rpm, retries=args.retries)
+    print(f"Done: {summary}")
+
+if __name__ == "__main__":
+    main()
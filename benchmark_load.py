@@ -1,15 +1,283 @@
+"""
+Offline benchmarks for the blog post pipeline.
+
+Runs against synthetic Korean corpora (fakes.make_corpus) served by a fake
+worksheet and a fake Gemini model with injectable latency, so the numbers are
+reproducible and need no credentials. For each corpus size it measures:
+
+- load_full / load_incremental: sheet read + DataFrame construction (what load_data does)
+- memory: plain object DataFrame vs compact frame + corpus store
+- index_build: DentistIndex construction
+- references_cold / references: get_dentist_references on first use of a dentist / afterwards
+- prompt: reference packing + prompt assembly
+- near_duplicate_build / near_duplicate_query: MinHash/LSH index over the corpus / scoring one post
+- generation: generate_post end to end, `--workers` at a time
+
+Timings are reported as percentiles in milliseconds, with peak traced memory,
+as JSON. Pass `--baseline old.json` to compare p50s against an earlier run.
+
+With `--startup` it measures app startup instead, each sample in a fresh
+interpreter: `import app`, and the first paint of the landing page (app.py run
+through Streamlit's AppTest on a fake corpus), plus which heavy SDKs
+(HEAVY_MODULES) had been imported by then.
+
+Usage:
+    python benchmark_load.py --sizes 1000,10000,100000 -o bench.json
+    python benchmark_load.py --startup --repeat 5
+    python benchmark_load.py --live    # get_all_records vs get_all_values on the real sheet
+"""
+import gc
+import os
+import sys
+import json
 import time
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import pandas as pd
-import toml
+import random
+import argparse
+import platform
+import subprocess
+import statistics
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from fakes import TOPICS, FakeModel, FakeWorksheet, make_corpus
+
+# SDKs the landing page should render without
+HEAVY_MODULES = ["google.generativeai", "gspread", "google.oauth2", "oauth2client", "langchain_core"]
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Child scripts: each prints one JSON line with the seconds taken and the heavy modules loaded
+_IMPORT_SCRIPT = """
+import sys, json, time
+started = time.perf_counter()
+import app
+seconds = time.perf_counter() - started
+print(json.dumps({"seconds": seconds, "loaded": [m for m in HEAVY if m in sys.modules]}))
+"""
+_FIRST_PAINT_SCRIPT = """
+import sys, json, time
+started = time.perf_counter()
+import data_loader
+from fakes import FakeWorksheet, make_corpus
+from streamlit.testing.v1 import AppTest
+
+# Seed the shared state as a fresh snapshot would, so no sheet (or secrets) is needed
+state = data_loader.SheetSyncState()
+data_loader.sync_sheet(FakeWorksheet(make_corpus(POSTS)), state)
+state.synced_at = time.time()
+data_loader._get_sync_state = lambda: state
+seeded = time.perf_counter() - started
+
+at = AppTest.from_file("app.py", default_timeout=120)
+at.run()
+seconds = time.perf_counter() - started
+print(json.dumps({"seconds": seconds - seeded, "loaded": [m for m in HEAVY if m in sys.modules],
+                  "landing": any("환영합니다" in element.value for element in at.markdown),
+                  "errors": [element.value for element in at.error]}))
+"""
+
+def summarize(samples):
+    """Percentiles of a list of durations in seconds, in milliseconds."""
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3)
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": pct(50),
+        "p90_ms": pct(90),
+        "p99_ms": pct(99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+def measure(fn, repeat, setup=None):
+    """Runs fn(setup()) `repeat` times; only fn is timed."""
+    samples = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        gc.collect()
+        started = time.perf_counter()
+        fn(arg) if setup else fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def peak_memory_mb(fn):
+    """Peak memory traced while running fn once (a separate, slower run)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024 / 1024, 2)
+
+def bench_size(posts, args):
+    import pandas as pd
+    from data_loader import COLUMN_MAP, SheetSyncState, sync_sheet, DentistIndex
+    from generator import (REFERENCE_CANDIDATES, get_dentist_references, get_prompt_prefix,
+                           build_prompt_suffix, generate_post, get_near_duplicate_index)
+    from near_duplicate import NearDuplicateIndex
+    from reference_packing import pack_references
+    from cache import LRUCache
+
+    rng = random.Random(args.seed)
+    rows = make_corpus(posts, dentists=args.dentists, chars=args.post_chars, seed=args.seed)
+    sheet = FakeWorksheet(rows, latency=args.sheet_latency)
+    result = {"posts": posts}
+
+    # 1. load_data: full read, then incremental sync of 1% new rows
+    def full_load():
+        state = SheetSyncState()
+        sync_sheet(sheet, state)
+        return state
+
+    result["load_full"] = summarize(measure(full_load, args.repeat))
+    result["load_full"]["peak_mb"] = peak_memory_mb(full_load)
+
+    appended = max(1, posts // 100)
+
+    def stale_state():
+        state = SheetSyncState()
+        sync_sheet(FakeWorksheet(rows[:-appended]), state)
+        return state
+
+    result["load_incremental"] = summarize(measure(lambda state: sync_sheet(sheet, state), args.repeat, stale_state))
+    result["load_incremental"]["rows"] = appended
+
+    # What the same rows cost as a plain DataFrame of Python strings
+    state = full_load()
+    plain = pd.DataFrame(rows[1:], columns=rows[0], dtype=object).rename(columns=COLUMN_MAP)
+    plain_mb = plain.memory_usage(deep=True).sum() / 1024 / 1024
+    frame_mb = state.frame.memory_usage(deep=True).sum() / 1024 / 1024
+    corpus_mb = sum(state.corpus.nbytes().values()) / 1024 / 1024
+    result["memory"] = {
+        "plain_frame_mb": round(plain_mb, 2),
+        "frame_mb": round(frame_mb, 2),
+        "corpus_mb": round(corpus_mb, 2),
+        "saving_pct": round((1 - (frame_mb + corpus_mb) / plain_mb) * 100, 1),
+    }
+    del plain
+
+    # 2. DentistIndex
+    corpus = state.corpus
+    result["index_build"] = summarize(measure(lambda: DentistIndex(corpus, 1), args.repeat))
+    result["index_build"]["peak_mb"] = peak_memory_mb(lambda: DentistIndex(corpus, 1))
+    index = DentistIndex(corpus, 1)
 
-SCOPE = [
-    "https://spreadsheets.google.com/feeds",
-    "https://www.googleapis.com/auth/drive",
-]
+    # 3. Reference lookup: the first search per dentist builds its lexical index
+    lookups = [(rng.choice(index.dentists), rng.choice(TOPICS)) for _ in range(args.lookups)]
+
+    def lookup(dentist, topic):
+        return get_dentist_references(dentist, n=REFERENCE_CANDIDATES, index=index, query=topic)
+
+    cold = []
+    for dentist in index.dentists[:args.lookups]:
+        started = time.perf_counter()
+        lookup(dentist, rng.choice(TOPICS))
+        cold.append(time.perf_counter() - started)
+    result["references_cold"] = summarize(cold)
+
+    warm = []
+    for dentist, topic in lookups:
+        started = time.perf_counter()
+        lookup(dentist, topic)
+        warm.append(time.perf_counter() - started)
+    result["references"] = summarize(warm)
+
+    # 4. Prompt assembly
+    candidates = [(dentist, topic, lookup(dentist, topic)) for dentist, topic in lookups[:50]]
+
+    def assemble():
+        for dentist, topic, refs in candidates:
+            references, _ = pack_references(refs)
+            get_prompt_prefix("Story") + build_prompt_suffix(dentist, topic, topic, "Story", "에피소드", references)
+
+    samples = [s / len(candidates) for s in measure(assemble, args.repeat)]
+    result["prompt"] = summarize(samples)
+
+    # 5. Near-duplicate index: signing the corpus once, then scoring generated posts
+    result["near_duplicate_build"] = summarize(measure(lambda: NearDuplicateIndex().update(corpus), args.repeat))
+    duplicates = get_near_duplicate_index()
+    duplicates.update(corpus)  # Shared with generate_post below
+    texts = [FakeModel(latency=0, seed=seed).generate_content("").text for seed in range(20)]
+    samples = []
+    for _ in range(max(1, args.lookups // len(texts))):
+        for text in texts:
+            started = time.perf_counter()
+            duplicates.query(text)
+            samples.append(time.perf_counter() - started)
+    result["near_duplicate_query"] = summarize(samples)
+
+    # 6. End-to-end generation under concurrency
+    model = FakeModel(latency=args.model_latency, jitter=args.model_latency / 2, seed=args.seed)
+    jobs = [(rng.choice(index.dentists), rng.choice(TOPICS)) for _ in range(args.requests)]
+
+    def generate(job):
+        started = time.perf_counter()
+        generate_post(job[0], job[1], job[1], model=model, fresh=True, cache=LRUCache(), index=index)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        latencies = list(pool.map(generate, jobs))
+    wall = time.perf_counter() - started
+    result["generation"] = summarize(latencies)
+    result["generation"].update({
+        "workers": args.workers,
+        "model_latency_s": args.model_latency,
+        "throughput_rps": round(len(jobs) / wall, 2),
+    })
+    return result
+
+def compare(results, baseline_path):
+    """Prints the p50 of every stage next to the same stage in a previous run."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["posts"]: r for r in json.load(f)["results"]}
+    for result in results:
+        old = baseline.get(result["posts"])
+        if old is None:
+            continue
+        for stage, stats in result.items():
+            if isinstance(stats, dict) and isinstance(old.get(stage), dict) and "p50_ms" in stats:
+                before, after = old[stage]["p50_ms"], stats["p50_ms"]
+                change = (after - before) / before * 100 if before else 0.0
+                print(f"{result['posts']:>7} {stage:<18} {before:>10.3f} -> {after:>10.3f} ms ({change:+.1f}%)",
+                      file=sys.stderr)
+
+def _run_child(script, posts=0):
+    code = f"HEAVY = {HEAVY_MODULES!r}\nPOSTS = {posts}\n" + script
+    result = subprocess.run([sys.executable, "-c", code], cwd=_HERE, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "child failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def startup_benchmark(args):
+    """
+    Import time of app.py and time to the first paint of its landing page,
+    each sample in a new interpreter so nothing is already imported.
+    """
+    posts = int(args.sizes.split(",")[0])
+    result = {}
+    for stage, script in (("import", _IMPORT_SCRIPT), ("first_paint", _FIRST_PAINT_SCRIPT)):
+        print(f"Measuring {stage}...", file=sys.stderr)
+        runs = [_run_child(script, posts) for _ in range(args.repeat)]
+        result[stage] = summarize([run["seconds"] for run in runs])
+        result[stage]["heavy_modules_loaded"] = runs[-1]["loaded"]
+        if "landing" in runs[-1]:
+            result[stage]["landing_rendered"] = runs[-1]["landing"]
+            result[stage]["errors"] = runs[-1]["errors"]
+    result["posts"] = posts
+    return result
+
+def live_benchmark():
+    """The original check: get_all_records() vs get_all_values() on the real sheet."""
+    import toml
+    from connections import SheetsConnection
+    from data_loader import SCOPE, SPREADSHEET_NAME
 
-def benchmark():
     print("Loading secrets...")
     try:
         with open(".streamlit/secrets.toml", "r", encoding="utf-8") as f:
@@ -19,24 +287,26 @@ def benchmark():
         print(f"Error loading secrets: {e}")
         return
 
-    print("Authenticating...")
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, SCOPE)
-    client = gspread.authorize(creds)
-
-    print("Opening spreadsheet...")
-    spreadsheet = client.open("블로그 포스팅 DB")
-    sheet = spreadsheet.sheet1
+    print("Authenticating and opening spreadsheet...")
+    start_time = time.time()
+    connection = SheetsConnection(creds_dict, SCOPE)
+    sheet = connection.worksheet(SPREADSHEET_NAME)
+    print(f"Time taken: {time.time() - start_time:.4f} seconds")
+    # The handle is memoized, so opening again costs nothing
+    start_time = time.time()
+    connection.worksheet(SPREADSHEET_NAME)
+    print(f"Opening again: {time.time() - start_time:.6f} seconds")
 
     print("Benchmarking get_all_records()...")
     start_time = time.time()
     data = sheet.get_all_records()
     end_time = time.time()
-    
+
     print(f"Time taken: {end_time - start_time:.4f} seconds")
     print(f"Number of records: {len(data)}")
 
     print("-" * 20)
-    
+
     print("Benchmarking get_all_values()...")
     start_time = time.time()
     data_values = sheet.get_all_values()
@@ -44,5 +314,55 @@ def benchmark():
     print(f"Time taken: {end_time - start_time:.4f} seconds")
     print(f"Number of rows (including header): {len(data_values)}")
 
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks with synthetic corpora and fake sheet/model.")
+    parser.add_argument("--sizes", default="1000,10000", help="Comma separated corpus sizes (posts)")
+    parser.add_argument("--dentists", type=int, default=50, help="Dentists in the corpus")
+    parser.add_argument("--post-chars", type=int, default=1200, help="Approximate characters per post")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions of the load/index/prompt stages")
+    parser.add_argument("--lookups", type=int, default=200, help="Reference lookups per size")
+    parser.add_argument("--requests", type=int, default=40, help="Generations per size")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent generations")
+    parser.add_argument("--sheet-latency", type=float, default=0.0, help="Seconds added to every sheet call")
+    parser.add_argument("--model-latency", type=float, default=0.2, help="Seconds per fake model call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare p50s against")
+    parser.add_argument("--live", action="store_true", help="Run the old benchmark against the real sheet")
+    parser.add_argument("--startup", action="store_true",
+                        help="Measure import and first paint time of app.py instead (first size = corpus)")
+    args = parser.parse_args()
+
+    if args.live:
+        live_benchmark()
+        return
+
+    results = []
+    if args.startup:
+        results.append(startup_benchmark(args))
+    else:
+        for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+            print(f"Benchmarking {size} posts...", file=sys.stderr)
+            results.append(bench_size(size, args))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "live")},
+        },
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        compare(results, args.baseline)
+
 if __name__ == "__main__":
-    benchmark()
+    main()
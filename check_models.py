@@ -1,6 +1,4 @@
-import google.generativeai as genai
-import streamlit as st
-import os
+from model_registry import ModelRegistry, model_config
 
 # Load secrets directly or handle if not present (assuming we run this in the env where secrets are or we might need to parse toml manually if running as script)
 # easier to just parse the toml file manually for this script since streamlits secrets management works best inside streamlit app
@@ -9,12 +7,17 @@ import toml
 try:
     with open(".streamlit/secrets.toml", "r", encoding="utf-8") as f:
         secrets = toml.load(f)
-        api_key = secrets["GOOGLE_API_KEY"]
-        genai.configure(api_key=api_key)
-        
+        registry = ModelRegistry(secrets["GOOGLE_API_KEY"], model_config(secrets.get("gemini")))
+
         print("Listing available models...")
-        for m in genai.list_models():
-            if 'generateContent' in m.supported_generation_methods:
-                print(m.name)
+        available = registry.list_models()
+        for name in available:
+            print(name)
+
+        # Check the configured models against what the key can actually use
+        print()
+        for role, name in [("primary", registry.model_name)] + [("fallback", n) for n in registry.fallback_models]:
+            status = "ok" if f"models/{name}" in available else "NOT AVAILABLE"
+            print(f"{role}: {name} ({status})")
 except Exception as e:
     print(f"Error: {e}")
@@ -0,0 +1,150 @@
+"""
+Medical advertising compliance scanner (의료법 제56조).
+
+The rule lists below are the same ones the generation prompt forbids
+(generator renders them into the prompt), compiled once into a single regex
+so a post is scanned in one pass. Every match is reported with its offsets
+and the paragraph it falls in, so only those paragraphs need rewriting.
+
+Usage (audit the local snapshot of the whole corpus):
+    python compliance.py [--snapshot .cache/blog_posts.parquet] [-o flagged.jsonl]
+"""
+import re
+import json
+import argparse
+from collections import Counter
+
+# Absolute / guarantee expressions
+BANNED_TERMS = ["최고", "최상", "유일", "100%", "완치", "재발 없음", "전혀 아프지 않은", "무통", "특효", "약속합니다"]
+# Comparisons with other clinics
+COMPARISON_PHRASES = ["다른 곳보다", "다른 치과보다", "다른 병원보다", "타 병원", "타 치과"]
+# Markdown symbols that must not appear in the plain-text post
+MARKDOWN_MARKERS = ["**", "##"]
+
+RULES = {
+    "banned": BANNED_TERMS,
+    "comparison": COMPARISON_PHRASES,
+    "markdown": MARKDOWN_MARKERS,
+}
+
+def _compact(term):
+    return re.sub(r"\s+", "", term)
+
+def paragraph_spans(text):
+    """(start, end) offsets of the non-empty paragraphs (separated by blank lines)."""
+    spans = []
+    start = 0
+    for gap in re.finditer(r"\n\s*\n", text):
+        if text[start:gap.start()].strip():
+            spans.append((start, gap.start()))
+        start = gap.end()
+    if text[start:].strip():
+        spans.append((start, len(text)))
+    return spans
+
+class ComplianceScanner:
+    """
+    All rule terms compiled into one alternation (longest first), so the regex
+    engine walks the text once. Spaces inside a term match any whitespace,
+    including none ("재발 없음" also catches "재발없음").
+    """
+
+    def __init__(self, rules=RULES):
+        self.categories = {}
+        for category, terms in rules.items():
+            for term in terms:
+                self.categories[_compact(term)] = (category, term)
+        patterns = [r"\s*".join(re.escape(part) for part in term.split())
+                    for term in sorted((t for terms in rules.values() for t in terms), key=len, reverse=True)]
+        self.pattern = re.compile("|".join(patterns))
+
+    def scan(self, text):
+        """
+        Returns the violations in `text`, in order: dicts with term, category,
+        the matched text, its start/end offsets and the paragraph number.
+        """
+        violations = []
+        spans = None
+        for match in self.pattern.finditer(text):
+            if spans is None:
+                spans = paragraph_spans(text)
+            category, term = self.categories[_compact(match.group())]
+            paragraph = next((i for i, (start, end) in enumerate(spans) if start <= match.start() < end), None)
+            violations.append({
+                "term": term,
+                "category": category,
+                "match": match.group(),
+                "start": match.start(),
+                "end": match.end(),
+                "paragraph": paragraph,
+            })
+        return violations
+
+    def is_clean(self, text):
+        return self.pattern.search(text) is None
+
+scanner = ComplianceScanner()
+
+def scan(text):
+    return scanner.scan(text)
+
+def strip_markdown(text):
+    """Removes markdown emphasis/heading markers locally (no model call needed)."""
+    # Single "#" is left alone: the post ends with hashtags
+    return re.sub(r"#{2,}[ \t]*", "", text.replace("**", ""))
+
+def audit_corpus(texts, scanner=scanner):
+    """
+    Scans every post. Returns a summary with counts per term and category
+    and the flagged posts as (position, violations) pairs.
+    """
+    by_term = Counter()
+    by_category = Counter()
+    flagged = []
+    for position, text in enumerate(texts):
+        violations = scanner.scan(text or "")
+        if violations:
+            flagged.append((position, violations))
+            by_term.update(v["term"] for v in violations)
+            by_category.update(v["category"] for v in violations)
+    return {
+        "posts": len(texts),
+        "flagged": len(flagged),
+        "by_term": dict(by_term.most_common()),
+        "by_category": dict(by_category),
+        "flagged_posts": flagged,
+    }
+
+def main():
+    import time
+    import pandas as pd
+    from data_loader import SNAPSHOT_DIR, SNAPSHOT_NAME
+
+    parser = argparse.ArgumentParser(description="Audit the post corpus for 의료법 제56조 expressions.")
+    parser.add_argument("--snapshot", default=f"{SNAPSHOT_DIR}/{SNAPSHOT_NAME}.parquet", help="Parquet snapshot to audit")
+    parser.add_argument("-o", "--output", help="Write flagged posts as JSONL")
+    args = parser.parse_args()
+
+    frame = pd.read_parquet(args.snapshot)
+    texts = frame["Content"].fillna("").tolist()
+    started = time.perf_counter()
+    report = audit_corpus(texts)
+    seconds = time.perf_counter() - started
+
+    print(f"{report['flagged']}/{report['posts']} posts flagged ({seconds * 1000:.1f} ms)")
+    for term, count in report["by_term"].items():
+        print(f"  {term}: {count}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for position, violations in report["flagged_posts"]:
+                row = frame.iloc[position]
+                f.write(json.dumps({
+                    "dentist": str(row.get("DentistName", "")),
+                    "topic": str(row.get("Topic", "")),
+                    "link": str(row.get("Link", "")),
+                    "violations": violations,
+                }, ensure_ascii=False) + "\n")
+
+if __name__ == "__main__":
+    main()
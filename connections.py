@@ -0,0 +1,115 @@
+"""
+Shared Google Sheets connection.
+
+One authorized gspread client per service account and process, instead of
+authenticating again on every sheet refresh:
+- credentials are built once; the access token is refreshed in the
+  background shortly before it expires (one refresh for every caller)
+- requests go through one keep-alive HTTP session with a connection pool
+  sized for the concurrent readers (see rag_bot.INGEST_WORKERS)
+- opened spreadsheets and their first worksheet are memoized by name
+
+gspread and google-auth are only imported when the first connection is made,
+so importing this module (and data_loader) stays cheap.
+"""
+import threading
+
+# Scope for Google Sheets and Drive API
+SCOPE = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/drive",
+]
+# Keep-alive connections kept open per host
+POOL_SIZE = 16
+
+class SheetsConnection:
+    """
+    Lazily authorized gspread client for one service account, safe to share
+    between threads and sessions (see data_loader.get_sheets_connection).
+    """
+
+    def __init__(self, credentials_info, scope=SCOPE, pool_size=POOL_SIZE):
+        self.credentials_info = dict(credentials_info)
+        self.scope = list(scope)
+        self.pool_size = pool_size
+        self._client = None
+        self._spreadsheets = {}  # name -> gspread Spreadsheet
+        self._worksheets = {}    # name -> first worksheet of that spreadsheet
+        self._lock = threading.Lock()
+
+    def _authorize(self):
+        import gspread
+        from google.oauth2.service_account import Credentials
+        from google.auth.transport.requests import AuthorizedSession
+        from requests.adapters import HTTPAdapter
+
+        credentials = Credentials.from_service_account_info(self.credentials_info, scopes=self.scope)
+        if hasattr(credentials, "with_non_blocking_refresh"):
+            # Stale tokens stay in use while a single background refresh runs
+            credentials.with_non_blocking_refresh()
+        session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        return gspread.authorize(None, session=session)
+
+    def client(self):
+        """The authorized gspread client, created on first use."""
+        with self._lock:
+            if self._client is None:
+                self._client = self._authorize()
+            return self._client
+
+    def spreadsheet(self, name):
+        """Spreadsheet by title, opened once."""
+        client = self.client()
+        with self._lock:
+            spreadsheet = self._spreadsheets.get(name)
+        if spreadsheet is None:
+            # Opening looks the title up in Drive; done outside the lock so other names are not held up
+            spreadsheet = client.open(name)
+            with self._lock:
+                spreadsheet = self._spreadsheets.setdefault(name, spreadsheet)
+        return spreadsheet
+
+    def worksheet(self, name):
+        """First worksheet of a spreadsheet, opened once."""
+        with self._lock:
+            worksheet = self._worksheets.get(name)
+        if worksheet is None:
+            worksheet = self.spreadsheet(name).sheet1
+            with self._lock:
+                worksheet = self._worksheets.setdefault(name, worksheet)
+        return worksheet
+
+    def forget(self, name=None):
+        """Drops memoized handles (all, or those of `name`) so they are opened again."""
+        with self._lock:
+            if name is None:
+                self._spreadsheets.clear()
+                self._worksheets.clear()
+            else:
+                self._spreadsheets.pop(name, None)
+                self._worksheets.pop(name, None)
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+def shared_connection(credentials_info, scope=SCOPE):
+    """
+    Process-wide connection per service account, for code that runs outside
+    Streamlit (rag_bot, scripts). The app caches its own with st.cache_resource.
+    """
+    key = (credentials_info.get("client_email"), tuple(scope))
+    with _connections_lock:
+        connection = _connections.get(key)
+        if connection is None:
+            connection = SheetsConnection(credentials_info, scope)
+            _connections[key] = connection
+        return connection
+
+def is_not_found(error):
+    """True when `error` is gspread's SpreadsheetNotFound (without importing gspread up front)."""
+    if type(error).__name__ != "SpreadsheetNotFound":
+        return False
+    from gspread.exceptions import SpreadsheetNotFound
+    return isinstance(error, SpreadsheetNotFound)
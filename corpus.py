@@ -0,0 +1,109 @@
+import zlib
+import itertools
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# zlib level for post bodies (0 keeps plain UTF-8). Korean text takes 2-3 bytes
+# per character in any uncompressed form, so most of the saving comes from here.
+# Level 1 compresses almost as well as the default level and costs less on reload.
+CONTENT_COMPRESSION = 1
+
+ARROW_STRING = pd.StringDtype("pyarrow")
+
+_lineages = itertools.count(1)
+
+def compact_frame(frame):
+    """DentistName as a categorical and the other text columns as Arrow-backed strings (in place)."""
+    for column in frame.columns:
+        if column == "DentistName":
+            if not isinstance(frame[column].dtype, pd.CategoricalDtype):
+                frame[column] = frame[column].astype(str).astype("category")
+        elif frame[column].dtype == object:
+            frame[column] = frame[column].astype(ARROW_STRING)
+    return frame
+
+class CorpusStore:
+    """
+    Read-only, memory-compact copy of the columns generation needs:
+    - DentistName as a categorical (a small code per post, each name stored once)
+    - Topic as an Arrow-backed string array
+    - Content: every post body in one shared bytes buffer (zlib-compressed per
+      post) addressed by an offsets array, decoded only for the posts used
+    Built once per data version and shared by every session; extend() returns
+    a new store instead of modifying this one. Stores that only differ by
+    appended rows share a `lineage`, so derived data can be updated incrementally.
+    """
+
+    def __init__(self, dentists, topics, buffer, offsets, compression=CONTENT_COMPRESSION, lineage=None):
+        self.dentists = dentists
+        self.topics = topics
+        self.buffer = buffer
+        self.offsets = offsets
+        self.compression = compression
+        self.lineage = lineage or next(_lineages)
+
+    @classmethod
+    def from_frame(cls, frame, compression=CONTENT_COMPRESSION):
+        n = len(frame)
+        dentists = pd.Categorical(frame["DentistName"].astype(str) if "DentistName" in frame.columns else [""] * n)
+        topics = pd.array(frame["Topic"] if "Topic" in frame.columns else [""] * n, dtype=ARROW_STRING)
+
+        contents = frame["Content"] if "Content" in frame.columns else [""] * n
+        blobs = [cls._encode(text, compression) for text in contents]
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(blob) for blob in blobs], out=offsets[1:])
+        return cls(dentists, topics, b"".join(blobs), offsets, compression)
+
+    @staticmethod
+    def _encode(text, compression):
+        data = ("" if text is None else str(text)).encode("utf-8")
+        return zlib.compress(data, compression) if compression else data
+
+    def extend(self, frame):
+        """New store with the rows of `frame` appended."""
+        tail = CorpusStore.from_frame(frame, self.compression)
+        return CorpusStore(
+            union_categoricals([self.dentists, tail.dentists]),
+            pd.array(pd.concat([pd.Series(self.topics), pd.Series(tail.topics)], ignore_index=True),
+                     dtype=ARROW_STRING),
+            self.buffer + tail.buffer,
+            np.concatenate([self.offsets, tail.offsets[1:] + self.offsets[-1]]),
+            self.compression,
+            self.lineage,
+        )
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    def dentist_positions(self):
+        """Dentist name -> array of row positions."""
+        if self.empty:
+            return {}
+        return pd.Series(np.arange(len(self))).groupby(self.dentists, observed=True, sort=False).indices
+
+    def topic(self, position):
+        value = self.topics[position]
+        return "" if pd.isna(value) else value
+
+    def content(self, position):
+        data = self.buffer[self.offsets[position]:self.offsets[position + 1]]
+        if self.compression:
+            data = zlib.decompress(data)
+        return data.decode("utf-8")
+
+    def contents(self, positions):
+        return [self.content(int(position)) for position in positions]
+
+    def nbytes(self):
+        """Approximate memory held, per part, in bytes."""
+        return {
+            "dentists": int(self.dentists.codes.nbytes + sum(len(name) * 4 for name in self.dentists.categories)),
+            "topics": int(self.topics.nbytes),
+            "content": len(self.buffer) + int(self.offsets.nbytes),
+        }
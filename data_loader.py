@@ -1,74 +1,456 @@
+import os
+import json
+import zlib
+import tempfile
+import threading
+import time
+import numpy as np
 import streamlit as st
 import pandas as pd
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from connections import SCOPE, SheetsConnection, is_not_found
+from corpus import CorpusStore, compact_frame
+from lexical_index import BM25Index
+from metrics import metrics
 
-# Scope for Google Sheets and Drive API
-SCOPE = [
-    "https://spreadsheets.google.com/feeds",
-    "https://www.googleapis.com/auth/drive",
-]
+# Name of the source spreadsheet (must be shared with the service account email)
+SPREADSHEET_NAME = "블로그 포스팅 DB"
 
-@st.cache_data(ttl=3600)
+# Edits in the middle of the sheet are not visible to the anchor check of an
+# incremental sync, so a full reload is still forced every so often
+FULL_RESYNC_SECONDS = 6 * 3600
+
+# Local snapshot of the normalized frame, served instantly on cold start
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+SNAPSHOT_NAME = "blog_posts"
+SNAPSHOT_FORMAT = 1  # Bump when the snapshot layout changes
+# Snapshot column with the checksum of each raw sheet row (see SheetSyncState.row_checksums)
+ROW_CHECKSUM_COLUMN = "_RowChecksum"
+
+# How old the served data may get before a background refresh is started
+REFRESH_SECONDS = 600
+# Wait between refresh attempts while the sheet cannot be reached
+RETRY_SECONDS = 120
+
+# Rename columns for internal consistency (Korean -> English)
+# Expected: [날짜, 치과명, 주제, 파일위치, 기존링크, 글본문]
+COLUMN_MAP = {
+    "날짜": "Date",
+    "치과명": "DentistName",
+    "주제": "Topic",
+    "파일 위치": "FilePath",
+    "기존 링크": "Link",
+    "글 본문": "Content"
+}
+
+class SheetSyncState:
+    """
+    Remembers what has already been pulled from the sheet, so the next sync
+    only has to read the rows appended since then.
+    """
+
+    def __init__(self):
+        self.headers = None     # Raw (Korean) header row of the last sync
+        self.row_count = 0      # Number of data rows synced (header excluded)
+        self.last_row = None    # Raw values of the last synced row, used as an anchor
+        self.row_checksums = None  # CRC32 per raw data row, so an unchanged full reload keeps the data
+        self.frame = pd.DataFrame()  # Every column but Content (see corpus)
+        self.corpus = CorpusStore.from_frame(self.frame)
+        self.full_synced_at = 0.0
+        self.version = 0        # Bumped whenever the frame changes
+        self.synced_at = 0.0    # Last successful contact with the sheet
+        self.attempted_at = 0.0  # Start of the last refresh attempt, successful or not
+        self.offline = False    # True when the last refresh attempt failed
+        self.refreshing = False
+        self.lock = threading.Lock()       # Guards the swap of frame/corpus/version for readers
+        self.sync_lock = threading.Lock()  # One sync (sheet read, swap, snapshot write) at a time
+
+def _pad_rows(rows, width):
+    """Pads/truncates rows to the header width (range reads drop trailing empty cells)."""
+    return [(list(row) + [""] * width)[:width] for row in rows]
+
+def build_dataframe(headers, rows):
+    """
+    Builds the normalized DataFrame from raw sheet rows.
+    """
+    df = pd.DataFrame(rows, columns=headers)
+    df.rename(columns=COLUMN_MAP, inplace=True)
+
+    # 'DentistName' is forced to string (avoids PyArrow/Streamlit errors with mixed int/str)
+    # and stored as a categorical; other text columns become Arrow-backed strings
+    return compact_frame(df)
+
+def _split_frame(frame):
+    """(frame without Content, CorpusStore with the post bodies) of a full post frame."""
+    return frame.drop(columns=["Content"], errors="ignore"), CorpusStore.from_frame(frame)
+
+def _store_frame(state, frame):
+    """Post bodies go to the compact corpus store; state.frame keeps the other columns."""
+    state.frame, state.corpus = _split_frame(frame)
+
+def _row_checksums(rows):
+    return np.fromiter((zlib.crc32("\x1f".join(row).encode("utf-8")) for row in rows), dtype=np.uint32,
+                       count=len(rows))
+
+def _full_update(sheet, state):
+    full_synced_at = time.time()
+    # Use get_all_values() instead of get_all_records() for better performance and robustness
+    data = sheet.get_all_values()
+
+    if not data:
+        frame, corpus = _split_frame(pd.DataFrame())
+        return {"mode": "full", "full_synced_at": full_synced_at, "headers": None, "row_count": 0,
+                "last_row": None, "row_checksums": None, "frame": frame, "corpus": corpus}
+
+    headers = data.pop(0)
+    rows = _pad_rows(data, len(headers))
+    checksums = _row_checksums(rows)
+    if (headers == state.headers and state.row_checksums is not None
+            and np.array_equal(checksums, state.row_checksums)):
+        # Same rows: keep the current frame, corpus and version (and everything derived from them)
+        return {"mode": "unchanged", "full_synced_at": full_synced_at}
+    frame, corpus = _split_frame(build_dataframe(headers, rows))
+    return {"mode": "full", "full_synced_at": full_synced_at, "headers": headers, "row_count": len(rows),
+            "last_row": rows[-1] if rows else None, "row_checksums": checksums, "frame": frame, "corpus": corpus}
+
+def fetch_sheet(sheet, state):
+    """
+    Reads what changed in the worksheet since `state` was synced, without
+    modifying `state`: returns an update for apply_sync() with new frame and
+    corpus objects and the sync mode ("full", "incremental" or "unchanged").
+
+    After the first full load, only the header row and the rows from the last
+    synced row onwards are read (a single batch range request). The last synced
+    row doubles as an anchor: if it or the header changed, the existing rows can
+    no longer be trusted and a full reload is done instead.
+
+    `sheet` only needs gspread's `get_all_values()` and `batch_get(ranges)`, so a
+    fake worksheet object can be passed in for testing.
+    """
+    if state.headers is None or time.time() - state.full_synced_at > FULL_RESYNC_SECONDS:
+        return _full_update(sheet, state)
+
+    width = len(state.headers)
+    from gspread.utils import rowcol_to_a1
+
+    last_col = rowcol_to_a1(1, width)[:-1]  # "F1" -> "F"
+    # Row 1 is the header, so the last synced data row lives at row_count + 1
+    anchor_row = state.row_count + 1
+    header_range, tail_range = sheet.batch_get([
+        f"A1:{last_col}1",
+        f"A{anchor_row}:{last_col}",
+    ])
+
+    header = _pad_rows(header_range[:1], width)[0] if header_range else []
+    if header != state.headers:
+        return _full_update(sheet, state)
+
+    tail = _pad_rows(tail_range, width)
+    # The first row of the tail must be the anchor row we already have
+    # (or the header itself when no data rows were synced yet)
+    if state.row_count and (not tail or tail[0] != state.last_row):
+        return _full_update(sheet, state)
+    tail = tail[1:]
+
+    if not tail:
+        return {"mode": "unchanged"}
+
+    new_frame = build_dataframe(state.headers, tail)
+    corpus = state.corpus.extend(new_frame)
+    new_frame = new_frame.drop(columns=["Content"], errors="ignore")
+    if state.frame.empty:
+        frame = new_frame
+    else:
+        # concat turns categoricals with different categories back into objects
+        frame = compact_frame(pd.concat([state.frame, new_frame], ignore_index=True))
+    checksums = None
+    if state.row_checksums is not None:
+        checksums = np.concatenate([state.row_checksums, _row_checksums(tail)])
+    return {"mode": "incremental", "row_count": state.row_count + len(tail), "last_row": tail[-1],
+            "row_checksums": checksums, "frame": frame, "corpus": corpus}
+
+def apply_sync(state, update):
+    """Swaps the results of fetch_sheet() into `state` (cheap; callers hold state.lock if shared)."""
+    for name, value in update.items():
+        if name != "mode":
+            setattr(state, name, value)
+    if update["mode"] != "unchanged":
+        state.version += 1
+
+def sync_sheet(sheet, state):
+    """
+    Brings `state` up to date with the worksheet and returns the sync mode
+    ("full", "incremental" or "unchanged"); see fetch_sheet().
+    """
+    update = fetch_sheet(sheet, state)
+    apply_sync(state, update)
+    return update["mode"]
+
+def save_snapshot(state, directory=None):
+    """
+    Writes the normalized frame to a local Parquet snapshot (in SNAPSHOT_DIR by
+    default), plus a small JSON file with the version stamp and what
+    incremental sync needs to resume.
+    """
+    if state.headers is None:
+        return
+    directory = directory or SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+    data_path = os.path.join(directory, SNAPSHOT_NAME + ".parquet")
+    meta_path = os.path.join(directory, SNAPSHOT_NAME + ".json")
+
+    # Write to temp files first so a crash never leaves a half-written snapshot;
+    # each writer gets its own, so even overlapping writers never share one
+    frame = state.frame.assign(Content=state.corpus.contents(range(len(state.corpus))))
+    if state.row_checksums is not None:
+        frame[ROW_CHECKSUM_COLUMN] = state.row_checksums
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "version": state.version,
+        "synced_at": state.synced_at,
+        "full_synced_at": state.full_synced_at,
+        "headers": state.headers,
+        "row_count": state.row_count,
+        "last_row": state.last_row,
+    }
+    data_tmp = _temp_path(directory)
+    meta_tmp = _temp_path(directory)
+    try:
+        frame.to_parquet(data_tmp, index=False)
+        with open(meta_tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(data_tmp, data_path)
+        os.replace(meta_tmp, meta_path)
+    finally:
+        for path in (data_tmp, meta_tmp):
+            if os.path.exists(path):
+                os.remove(path)
+
+def _temp_path(directory):
+    fd, path = tempfile.mkstemp(prefix=SNAPSHOT_NAME + ".", suffix=".tmp", dir=directory)
+    os.close(fd)
+    return path
+
+def load_snapshot(state, directory=None):
+    """
+    Restores `state` from the local snapshot. Returns False if there is none
+    (or it was written by an incompatible version).
+    """
+    directory = directory or SNAPSHOT_DIR
+    data_path = os.path.join(directory, SNAPSHOT_NAME + ".parquet")
+    meta_path = os.path.join(directory, SNAPSHOT_NAME + ".json")
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != SNAPSHOT_FORMAT:
+            return False
+        frame = compact_frame(pd.read_parquet(data_path))
+    except (OSError, ValueError) as e:
+        print(f"Snapshot not usable: {e}")
+        return False
+
+    if ROW_CHECKSUM_COLUMN in frame.columns:
+        state.row_checksums = frame.pop(ROW_CHECKSUM_COLUMN).to_numpy(dtype=np.uint32)
+    _store_frame(state, frame)
+    state.version = meta["version"]
+    state.synced_at = meta["synced_at"]
+    state.full_synced_at = meta["full_synced_at"]
+    state.headers = meta["headers"]
+    state.row_count = meta["row_count"]
+    state.last_row = meta["last_row"]
+    return True
+
+@st.cache_resource
+def get_sheets_connection():
+    """Process-wide Sheets client for the service account in secrets (see connections.SheetsConnection)."""
+    return SheetsConnection(st.secrets["gcp_service_account"], SCOPE)
+
+def _open_sheet():
+    """First worksheet of the source spreadsheet, through the shared connection."""
+    # Requires the "블로그 포스팅 DB" sheet to be shared with the service account email
+    return get_sheets_connection().worksheet(SPREADSHEET_NAME)
+
+def _forget_sheet():
+    """Drops the memoized sheet handle (it may be stale after an error) so the next refresh reopens it."""
+    try:
+        get_sheets_connection().forget(SPREADSHEET_NAME)
+    except Exception:
+        pass  # No connection could be made in the first place
+
+def refresh_data(state, open_sheet=_open_sheet):
+    """
+    Syncs `state` with the sheet and updates the snapshot if anything changed.
+    Raises on network/auth errors; `state.offline` tells whether the last attempt failed.
+    Syncs are serialized with state.sync_lock.
+    """
+    with state.sync_lock:
+        return _refresh(state, open_sheet)
+
+def _refresh(state, open_sheet):
+    state.attempted_at = time.time()
+    try:
+        with metrics.span("sheet_sync") as fields:
+            sheet = open_sheet()
+            # Network reads and parsing happen outside the lock, into new frame/corpus
+            # objects; readers (get_dentist_index) only wait for the swap
+            update = fetch_sheet(sheet, state)
+            mode = update["mode"]
+            with state.lock:
+                apply_sync(state, update)
+                state.synced_at = time.time()
+                state.offline = False
+            if mode != "unchanged":
+                # sync_lock keeps other syncs out, so the swapped objects stay consistent
+                save_snapshot(state)
+            fields["mode"] = mode
+            fields["rows"] = state.row_count
+        metrics.inc("sheet_sync", mode=mode)
+        return mode
+    except Exception:
+        state.offline = True
+        metrics.inc("sheet_sync", mode="error")
+        if open_sheet is _open_sheet:
+            _forget_sheet()
+        raise
+
+def _background_refresh(state):
+    try:
+        refresh_data(state)
+    except Exception as e:
+        # No script context in this thread, so report to the console instead of st.error
+        print(f"Background refresh failed, serving snapshot (read-only): {e}")
+    finally:
+        state.refreshing = False
+
+def _start_background_refresh(state):
+    with state.lock:
+        if state.refreshing:
+            return
+        state.refreshing = True
+    threading.Thread(target=_background_refresh, args=(state,), daemon=True).start()
+
+@st.cache_resource
+def _get_sync_state():
+    """Process-wide sync state shared by every session, seeded from the local snapshot."""
+    state = SheetSyncState()
+    load_snapshot(state)
+    return state
+
+def get_data_status():
+    """
+    Returns the shared sync state (version, synced_at, offline) for display purposes.
+    """
+    return _get_sync_state()
+
+@metrics.timed("load_data")
 def load_data():
     """
     Loads data from the Google Sheet 'Rawdata'.
     Uses credentials stored in streamlit.secrets.
+
+    The local snapshot is served right away when there is one; a stale copy is
+    refreshed from the sheet in a background thread. Only the very first run
+    (no snapshot yet) waits on the network. If Google is unreachable the app
+    keeps running on the snapshot in read-only mode.
+
+    The same frame is shared by every session, so callers must not modify it.
+    Post bodies are not in the frame; they live in the compact corpus store
+    used through get_dentist_index().
     Returns:
-        pd.DataFrame: DataFrame containing blog post data with standardized columns.
+        pd.DataFrame: DataFrame containing blog post data with standardized columns (except Content).
     """
+    state = _get_sync_state()
+
+    if state.headers is not None:
+        # Serve what we have; refresh in the background when it is stale
+        # (after a failed attempt, not again before RETRY_SECONDS)
+        now = time.time()
+        if (now - state.synced_at > REFRESH_SECONDS and now - state.attempted_at > RETRY_SECONDS
+                and "gcp_service_account" in st.secrets):
+            _start_background_refresh(state)
+        metrics.inc("load_data", source="memory")
+        return state.frame
+
     # 1. Check if secrets are available
     if "gcp_service_account" not in st.secrets:
         st.error("GCP credentials not found in .streamlit/secrets.toml")
+        metrics.inc("load_data", source="error")
         return pd.DataFrame()
 
     try:
-        # 2. Authenticate
-        creds_dict = st.secrets["gcp_service_account"]
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, SCOPE)
-        client = gspread.authorize(creds)
-
-        # 3. Open Spreadsheet
-        # Requires the "블로그 포스팅 DB" sheet to be shared with the service account email
-        spreadsheet = client.open("블로그 포스팅 DB")
-        sheet = spreadsheet.sheet1  # Access the first worksheet
-
-        # 4. Get all records
-        # Use get_all_values() instead of get_all_records() for better performance and robustness
-        data = sheet.get_all_values()
-        
-        if not data:
-            return pd.DataFrame()
-
-        # 5. Create DataFrame (First row is header)
-        headers = data.pop(0)
-        df = pd.DataFrame(data, columns=headers)
-
-        # 6. Rename columns for internal consistency (Korean -> English)
-        # Expected: [날짜, 치과명, 주제, 파일위치, 기존링크, 글본문]
-        column_map = {
-            "날짜": "Date",
-            "치과명": "DentistName",
-            "주제": "Topic",
-            "파일 위치": "FilePath",
-            "기존 링크": "Link",
-            "글 본문": "Content"
-        }
-        df.rename(columns=column_map, inplace=True)
-
-        # Force 'DentistName' to be string to avoid PyArrow/Streamlit errors with mixed types (int/str)
-        if 'DentistName' in df.columns:
-            df['DentistName'] = df['DentistName'].astype(str)
-
-        return df
-
-    except gspread.exceptions.SpreadsheetNotFound:
-        st.error("Spreadsheet 'Rawdata' not found. Please check the name and permissions.")
-        return pd.DataFrame()
+        # 2. No snapshot yet: do the first (full) sync in the foreground. Sessions
+        # arriving meanwhile wait for it instead of reading the sheet again
+        with state.sync_lock:
+            if state.headers is None:
+                _refresh(state, _open_sheet)
+                metrics.inc("load_data", source="sheet")
+            else:
+                metrics.inc("load_data", source="memory")
+        return state.frame
+
     except Exception as e:
-        st.error(f"Error loading data: {str(e)}")
+        if is_not_found(e):
+            st.error("Spreadsheet 'Rawdata' not found. Please check the name and permissions.")
+        else:
+            st.error(f"Error loading data: {str(e)}")
+        metrics.inc("load_data", source="error")
         return pd.DataFrame()
 
+class DentistIndex:
+    """
+    Dentist -> row positions lookup over one version of the corpus,
+    plus the pre-sorted dentist list for the selector.
+    `corpus` is a CorpusStore; a full post DataFrame is converted to one.
+    """
+
+    def __init__(self, corpus, version):
+        if isinstance(corpus, pd.DataFrame):
+            corpus = CorpusStore.from_frame(corpus)
+        self.corpus = corpus
+        self.version = version
+        self.positions = corpus.dentist_positions()
+        self.dentists = sorted(str(d) for d in self.positions)
+        self._search_indexes = {}  # dentist -> BM25Index over their posts, built on first use
+
+    def rows_for(self, dentist_name):
+        """Returns the row positions of a dentist's posts (empty if unknown)."""
+        return self.positions.get(dentist_name, ())
+
+    def search(self, dentist_name, query, k=3):
+        """
+        Returns the row positions of the dentist's posts most relevant to `query`
+        (BM25 over Topic + Content, best first). Empty if nothing matches.
+        """
+        search_index = self._search_indexes.get(dentist_name)
+        if search_index is None:
+            search_index = BM25Index()
+            for position in self.rows_for(dentist_name):
+                position = int(position)
+                # The topic is repeated so it weighs more than a passing mention in the body
+                topic = self.corpus.topic(position)
+                search_index.add(position, f"{topic}\n{topic}\n{self.corpus.content(position)}")
+            self._search_indexes[dentist_name] = search_index
+        results, _ = search_index.search(query, k)
+        return [position for position, _ in results]
+
+@st.cache_resource(max_entries=2)
+def _dentist_index_for(version, _corpus):
+    return DentistIndex(_corpus, version)
+
+def get_dentist_index():
+    """
+    Returns the DentistIndex for the current data version, built once per version
+    and shared by every session.
+    """
+    load_data()
+    state = _get_sync_state()
+    # Version and corpus are read together: a refresh may swap them right after load_data returned
+    with state.lock:
+        loaded = state.headers is not None or state.synced_at > 0
+        # Nothing was ever loaded (missing secrets / errors): the initial empty corpus under its own key
+        version = state.version if loaded else -1
+        corpus = state.corpus
+    return _dentist_index_for(version, corpus)
+
 if __name__ == "__main__":
     # Local verification block
     # Note: Will only work if secrets.toml is set up correctly
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from cache import LRUCache
+
+VECTORS_FILE = "vectors.f32"
+KEYS_FILE = "keys.json"
+
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class VectorCache:
+    """
+    Content hash -> embedding vector, stored on disk as one memory-mapped
+    float32 array (row per vector) plus a JSON list of keys in row order.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.dim = None
+        self.positions = {}  # hash -> row
+        self._matrix = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.directory, VECTORS_FILE)
+
+    @property
+    def _keys_path(self):
+        return os.path.join(self.directory, KEYS_FILE)
+
+    def _load(self):
+        if not os.path.exists(self._keys_path):
+            return
+        with open(self._keys_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.positions = {key: row for row, key in enumerate(meta["keys"])}
+
+        # Drop rows written after the last key checkpoint (crash mid-batch)
+        expected = len(self.positions) * self.dim * 4
+        if os.path.exists(self._vectors_path) and os.path.getsize(self._vectors_path) > expected:
+            with open(self._vectors_path, "r+b") as f:
+                f.truncate(expected)
+        self._remap()
+
+    def _remap(self):
+        if self.positions:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r",
+                                     shape=(len(self.positions), self.dim))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def get(self, key):
+        row = self.positions.get(key)
+        if row is None:
+            return None
+        return self._matrix[row].tolist()
+
+    def add_many(self, items):
+        """
+        Appends (hash, vector) pairs and checkpoints the key index.
+        Vectors are flushed before the keys, so a crash never leaves a key
+        pointing at a missing vector.
+        """
+        with self._lock:
+            items = [(key, vector) for key, vector in items if key not in self.positions]
+            if not items:
+                return
+            if self.dim is None:
+                self.dim = len(items[0][1])
+            block = np.asarray([vector for _, vector in items], dtype=np.float32).reshape(-1, self.dim)
+            with open(self._vectors_path, "ab") as f:
+                f.write(block.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            for key, _ in items:
+                self.positions[key] = len(self.positions)
+            keys = list(self.positions)  # Insertion order is row order
+            with open(self._keys_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "keys": keys}, f)
+            os.replace(self._keys_path + ".tmp", self._keys_path)
+            self._remap()
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings object: documents are embedded in batches of
+    `batch_size`, at most `max_concurrency` batches at a time, and every vector
+    is cached by content hash. Identical texts (across sheets or restarts) are
+    embedded only once, and each finished batch is checkpointed to disk, so a
+    failed run resumes from where it stopped instead of starting over.
+    Query embeddings are memoized in memory (`query_cache`).
+    """
+
+    def __init__(self, inner, cache_dir, batch_size=64, max_concurrency=4, retries=3, base_delay=1.0):
+        self.inner = inner
+        self.cache = VectorCache(cache_dir)
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.base_delay = base_delay
+        self.query_cache = LRUCache(max_entries=1024)
+
+    def _embed_batch(self, texts):
+        for attempt in range(self.retries + 1):
+            try:
+                return self.inner.embed_documents(texts)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.base_delay * (2 ** attempt) + random.uniform(0, self.base_delay))
+
+    def embed_documents(self, texts):
+        hashes = [text_hash(text) for text in texts]
+
+        # Only unique texts that are not cached yet go to the API
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if self.cache.get(key) is None and key not in missing:
+                missing[key] = text
+        keys = list(missing)
+        batches = [keys[i:i + self.batch_size] for i in range(0, len(keys), self.batch_size)]
+
+        if batches:
+            print(f"🧮 임베딩: {len(keys)}개 새로 계산 ({len(texts) - len(keys)}개 캐시 사용), 배치 {len(batches)}개")
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            futures = {pool.submit(self._embed_batch, [missing[k] for k in batch]): batch for batch in batches}
+            for future in as_completed(futures):
+                try:
+                    vectors = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                # Checkpoint every finished batch right away
+                self.cache.add_many(zip(futures[future], vectors))
+
+        if errors:
+            raise RuntimeError(f"{len(errors)}/{len(batches)} embedding batches failed "
+                               f"(finished batches are cached): {errors[0]}") from errors[0]
+
+        return [self.cache.get(key) for key in hashes]
+
+    def embed_query(self, text):
+        key = " ".join(text.split())
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = self.inner.embed_query(text)
+            self.query_cache.set(key, vector)
+        return vector
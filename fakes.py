@@ -0,0 +1,222 @@
+"""
+Local stand-ins for the Google Sheet and Gemini, for benchmarks and offline runs.
+
+make_corpus() builds a reproducible corpus of Korean blog posts in the sheet
+layout, FakeWorksheet serves it through the gspread calls data_loader uses,
+and FakeModel answers generate_content after an injectable latency.
+FakeSheetsClient and FakeEmbeddings stand in for the gspread client and the
+embedding model rag_bot.CompanyBrain uses.
+"""
+import re
+import time
+import random
+import hashlib
+import threading
+
+HEADERS = ["날짜", "치과명", "주제", "파일 위치", "기존 링크", "글 본문"]
+
+TOPICS = [
+    "임플란트", "치아교정", "충치 치료", "신경 치료", "스케일링", "잇몸 치료", "사랑니 발치",
+    "라미네이트", "치아미백", "소아치과", "틀니", "턱관절", "구강검진", "시린이", "치아 크라운",
+]
+
+_GREETINGS = [
+    "안녕하세요, {dentist} 원장입니다.",
+    "안녕하세요! 오늘도 {dentist}에서 인사드립니다.",
+    "반갑습니다. {dentist} 대표원장입니다.",
+]
+_SENTENCES = [
+    "{topic} 때문에 고민하시는 분들이 생각보다 많습니다.",
+    "진료실에서 가장 자주 듣는 질문 중 하나가 바로 {topic}에 관한 것입니다.",
+    "많은 분들이 {topic}는 아프다고 생각하시지만 실제로는 그렇지 않은 경우가 많습니다.",
+    "정확한 진단을 위해서는 엑스레이와 구강 검사를 함께 진행해야 합니다.",
+    "치료 시기를 놓치면 치료 범위가 넓어지고 비용도 늘어날 수 있습니다.",
+    "환자분의 구강 상태에 따라 치료 방법과 기간은 달라질 수 있습니다.",
+    "치료 후에는 올바른 칫솔질과 치실 사용이 무엇보다 중요합니다.",
+    "정기적인 검진을 받으시면 작은 문제를 일찍 발견할 수 있습니다.",
+    "최근에는 장비가 좋아져서 치료 과정이 훨씬 편안해졌습니다.",
+    "궁금한 점이 있으시면 언제든지 편하게 문의해 주세요.",
+    "지난주에 내원하신 환자분도 비슷한 증상으로 걱정이 많으셨습니다.",
+    "{topic} 후 주의사항을 잘 지켜주시면 결과가 오래 유지됩니다.",
+    "무엇보다 환자분이 충분히 이해하고 결정하시는 것이 중요하다고 생각합니다.",
+    "음식을 씹을 때 불편함이 느껴진다면 한 번쯤 점검을 받아보시는 것이 좋습니다.",
+]
+_CLOSINGS = [
+    "오늘 글이 도움이 되셨길 바랍니다. 감사합니다.",
+    "건강한 치아로 웃는 하루 보내세요!",
+    "{dentist}은 언제나 환자분의 편에서 진료하겠습니다.",
+]
+
+def make_post(rng, dentist, topic, chars=1200):
+    """One post of roughly `chars` characters: greeting, body paragraphs, closing."""
+    paragraphs = [rng.choice(_GREETINGS).format(dentist=dentist)]
+    length = len(paragraphs[0])
+    while length < chars:
+        paragraph = " ".join(rng.choice(_SENTENCES).format(topic=topic) for _ in range(rng.randint(2, 4)))
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    paragraphs.append(rng.choice(_CLOSINGS).format(dentist=dentist))
+    return "\n\n".join(paragraphs)
+
+def make_corpus(posts, dentists=50, chars=1200, seed=0):
+    """
+    Sheet rows (header first) for `posts` posts spread over `dentists` dentists.
+    The same arguments always give the same corpus.
+    """
+    rng = random.Random(seed)
+    names = [f"행복{i}치과" for i in range(dentists)]
+    rows = [list(HEADERS)]
+    for i in range(posts):
+        dentist = rng.choice(names)
+        topic = rng.choice(TOPICS)
+        rows.append([
+            f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}",
+            dentist,
+            f"{topic} {rng.choice(['이야기', '안내', 'Q&A', '후기'])}",
+            f"posts/{i}.txt",
+            f"https://blog.example.com/{i}",
+            make_post(rng, dentist, topic, chars),
+        ])
+    return rows
+
+class FakeWorksheet:
+    """
+    In-memory worksheet implementing the gspread calls data_loader uses
+    (get_all_values, get_all_records, batch_get). Every call sleeps `latency`
+    seconds first, to stand in for the network round trip.
+    """
+
+    def __init__(self, rows, latency=0.0, title="Sheet1"):
+        self.rows = rows
+        self.latency = latency
+        self.title = title
+        self.calls = 0
+
+    def _wait(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_all_values(self):
+        self._wait()
+        return [list(row) for row in self.rows]
+
+    def get_all_records(self):
+        self._wait()
+        headers = self.rows[0] if self.rows else []
+        return [dict(zip(headers, row)) for row in self.rows[1:]]
+
+    def batch_get(self, ranges):
+        self._wait()
+        values = []
+        for a1 in ranges:
+            # Only the "A{start}:{col}" / "A{start}:{col}{end}" shapes data_loader asks for
+            match = re.fullmatch(r"A(\d+):[A-Z]+(\d*)", a1)
+            start = int(match.group(1)) - 1
+            end = int(match.group(2)) if match.group(2) else len(self.rows)
+            values.append([list(row) for row in self.rows[start:end]])
+        return values
+
+class FakeUsage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.cached_content_token_count = 0
+
+class FakeChunk:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+class FakeModel:
+    """
+    Gemini-style model: generate_content(prompt, stream=False) returns a post
+    after `latency` seconds (plus up to `jitter` seconds). With stream=True the
+    post comes in `chunks` pieces, the latency spread over them.
+    """
+
+    def __init__(self, latency=0.5, jitter=0.0, chunks=8, chars=1500, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunks = chunks
+        self.chars = chars
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _answer(self, prompt):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            text = make_post(self._rng, "가짜", self._rng.choice(TOPICS), self.chars)
+        return delay, text, FakeUsage(len(prompt), len(text))
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        delay, text, usage = self._answer(prompt)
+        if not stream:
+            time.sleep(delay)
+            return FakeChunk(text, usage)
+        return self._stream(delay, text, usage)
+
+    def _stream(self, delay, text, usage):
+        size = -(-len(text) // self.chunks)
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        for i, piece in enumerate(pieces):
+            time.sleep(delay / len(pieces))
+            yield FakeChunk(piece, usage if i == len(pieces) - 1 else None)
+
+class FakeSpreadsheet:
+    """Spreadsheet of FakeWorksheets (by title), with gspread's worksheets() and values_batch_get()."""
+
+    def __init__(self, tabs, latency=0.0):
+        self.tabs = {title: FakeWorksheet(rows, latency, title) for title, rows in tabs.items()}
+        self.latency = latency
+
+    def worksheets(self):
+        return list(self.tabs.values())
+
+    def values_batch_get(self, ranges):
+        if self.latency:
+            time.sleep(self.latency)
+        # Only the whole-tab "'title'" ranges rag_bot asks for
+        return {"valueRanges": [{"values": [list(row) for row in self.tabs[r.strip("'")].rows]} for r in ranges]}
+
+class FakeSheetsClient:
+    """
+    gspread client stand-in: open(name) returns the FakeSpreadsheet of that
+    name, or raises gspread's SpreadsheetNotFound like the real client.
+    """
+
+    def __init__(self, spreadsheets):
+        self.spreadsheets = spreadsheets  # name -> FakeSpreadsheet
+        self.opened = []
+
+    def open(self, name):
+        self.opened.append(name)
+        if name not in self.spreadsheets:
+            from gspread.exceptions import SpreadsheetNotFound
+            raise SpreadsheetNotFound(name)
+        return self.spreadsheets[name]
+
+class FakeEmbeddings:
+    """
+    Deterministic embedding model: the same text always gets the same vector.
+    `embedded` lists every document text sent to embed_documents.
+    """
+
+    def __init__(self, size=16):
+        self.size = size
+        self.embedded = []
+        self._lock = threading.Lock()
+
+    def _vector(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [digest[i % len(digest)] / 255.0 for i in range(self.size)]
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.embedded.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
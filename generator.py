@@ -1,85 +1,155 @@
-import streamlit as st
-import google.generativeai as genai
-from data_loader import load_data
+import os
+import re
+import time
 import random
+import datetime
+import threading
+import hashlib
+import json
+import streamlit as st
+from data_loader import get_dentist_index, SNAPSHOT_DIR
+from cache import LRUCache, SQLiteCache, TieredCache
+from compliance import BANNED_TERMS, COMPARISON_PHRASES, scan, strip_markdown, paragraph_spans
+from metrics import metrics
+from model_registry import ModelRegistry, model_config
+from near_duplicate import NearDuplicateIndex, DUPLICATE_THRESHOLD
+from reference_packing import pack_references, count_tokens, DEFAULT_TOKEN_BUDGET
+from style_profile import StyleProfiles, format_profile
 
-def configure_genai():
-    """Configures the Gemini API with the key from secrets."""
-    if "GOOGLE_API_KEY" in st.secrets:
-        genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
-    else:
+# Generation cache: small in-memory LRU in front of a SQLite file
+GENERATION_CACHE_PATH = os.path.join(SNAPSHOT_DIR, "generations.sqlite3")
+GENERATION_CACHE_TTL = 7 * 24 * 3600
+GENERATION_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# Reference posts sampled per request; pack_references keeps what fits the token budget
+REFERENCE_CANDIDATES = 8
+# "relevance": posts closest to the topic/keyword first, "random": random sample
+REFERENCE_SELECTION = "relevance"
+
+# "implicit": rely on the provider reusing identical prompt prefixes automatically.
+# "explicit": also create a server-side cached content per style (needs a
+# google-generativeai version with genai.caching and a long enough prefix).
+# Reference blocks are not cached server-side: they are picked per topic
+# (REFERENCE_SELECTION), so a per-dentist block would rarely be reused as is.
+PROMPT_CACHE_MODE = "implicit"
+PROMPT_CACHE_TTL = 3600
+
+# Precomputed style profile of the dentist in the prompt:
+# "off", "alongside" (profile + shorter reference excerpts) or "replace" (profile only)
+STYLE_PROFILE_MODE = "alongside"
+# Reference token budget when a profile is in the prompt
+PROFILE_REFERENCE_BUDGET = 800
+
+# Check generated posts against the 의료법 rules and rewrite only the offending paragraphs
+AUTO_FIX_COMPLIANCE = True
+
+# Existing posts reported as the closest overlaps of a generated post
+SIMILAR_POSTS = 3
+
+def get_model_config():
+    """Model name, fallbacks and generation config from the [gemini] section of secrets (defaults if absent)."""
+    try:
+        section = st.secrets.get("gemini")
+    except Exception:
+        section = None  # No secrets file at all
+    return model_config(section)
+
+@st.cache_resource
+def _model_registry(api_key):
+    return ModelRegistry(api_key, get_model_config())
+
+def get_model_registry():
+    """Process-wide Gemini clients (see model_registry.ModelRegistry), configured once."""
+    if "GOOGLE_API_KEY" not in st.secrets:
         st.error("GOOGLE_API_KEY not found in secrets.")
+    return _model_registry(st.secrets.get("GOOGLE_API_KEY"))
+
+@st.cache_resource
+def get_style_profiles():
+    """Process-wide per-dentist style profiles (see style_profile.StyleProfiles)."""
+    return StyleProfiles()
+
+@st.cache_resource
+def get_near_duplicate_index():
+    """Process-wide MinHash/LSH index over the corpus (see near_duplicate.NearDuplicateIndex)."""
+    return NearDuplicateIndex()
+
+@st.cache_resource
+def get_generation_cache(use_disk=True):
+    """Process-wide cache of generated posts (see cache.TieredCache)."""
+    disk = None
+    if use_disk:
+        disk = SQLiteCache(GENERATION_CACHE_PATH, ttl=GENERATION_CACHE_TTL, max_bytes=GENERATION_CACHE_MAX_BYTES)
+    return TieredCache(LRUCache(max_entries=64), disk)
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", str(text or "")).strip().lower()
 
-def get_dentist_references(dentist_name, n=3):
+def _hash(parts):
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def reference_id(content):
+    """Stable ID of a reference post (content hash, so it survives row reordering)."""
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:12]
+
+@metrics.timed("references")
+def get_dentist_references(dentist_name, n=3, index=None, seed=None, query=None, mode=None):
     """
-    Fetches random past posts for a specific dentist.
+    Fetches past posts for a specific dentist.
+    With mode "relevance" and a `query`, the posts most relevant to it come first;
+    the rest (or everything, in "random" mode or when nothing matches) is sampled at random.
+    `mode` defaults to REFERENCE_SELECTION as set when called.
+    Uses the per-dentist index, so only the selected rows are touched.
+    With a `seed`, the same inputs always pick the same posts.
     """
-    df = load_data()
-    if df.empty:
-        return []
-    
-    # Filter by dentist name
-    dentist_posts = df[df['DentistName'] == dentist_name]
-    
-    if dentist_posts.empty:
+    if index is None:
+        index = get_dentist_index()
+    if mode is None:
+        mode = REFERENCE_SELECTION
+
+    positions = index.rows_for(dentist_name)
+    if not len(positions):
         return []
-    
-    # Select up to n random posts
-    sample_size = min(len(dentist_posts), n)
-    # We use sample to get random rows
-    references = dentist_posts.sample(n=sample_size)
-    
-    # Convert to a list of dicts or strings
+
+    chosen = []
+    if mode == "relevance" and query:
+        chosen = index.search(dentist_name, query, n)
+
+    # Fill up with random posts
+    sample_size = min(len(positions), n) - len(chosen)
+    if sample_size > 0:
+        rng = random.Random(seed) if seed is not None else random
+        taken = set(chosen)
+        rest = [i for i in range(len(positions)) if positions[i] not in taken] if taken else range(len(positions))
+        chosen += [positions[i] for i in rng.sample(rest, sample_size)]
+
     # We'll return a list of content strings
-    return references['Content'].tolist()
+    return index.corpus.contents(chosen)
 
-def generate_blog_post(dentist_name, topic, keyword, style="Standard", context_input=""):
-    """
-    Generates a blog post using Gemini, based on the dentist's past style and selected content type.
-    """
-    try:
-        configure_genai()
-        
-        # 1. Get Reference Data (RAG)
-        references = get_dentist_references(dentist_name)
-        
-        if not references:
-            st.warning(f"No past data found for {dentist_name}. Generating with generic style.")
-            ref_text = "참고할 과거 데이터가 없습니다."
-        else:
-            # Join references with a separator
-            ref_text = "\n\n---\n\n".join(references)
-
-        # Style Specific Instructions
-        style_instruction = ""
-        context_instruction = ""
-
-        if style == "Story":
-            if context_input:
-                context_instruction = f"6. **환자 에피소드 (필수 반영)**: 다음 실화 내용을 바탕으로 글을 재구성하세요.\n   [에피소드]: {context_input}"
-            
-            style_instruction = """
-            **[글 구성: 환자 스토리텔링 (Story)]**
-            - 서론: "지난주 내원하셨던 환자분의 이야기입니다..." 처럼 구체적인 에피소드로 시작하세요.
-            - 본문: 환자가 겪었던 고통과 고민을 생생하게 묘사하고, 치료 후 어떻게 삶이 바뀌었는지 드라마틱하게 서술하세요.
-            """
-        elif style == "Q&A":
-            style_instruction = """
-            **[글 구성: Q&A 질의응답 (FAQ)]**
-            - 글 전체를 '환자분들이 가장 자주 묻는 질문 3가지'로 구성하세요.
-            - Q1. 질문 -> A1. 답변 -> Q2. 질문 -> A2. 답변 형식으로 명확하게 구분하여 작성하세요.
-            """
-        elif style == "MythBust":
-            style_instruction = """
-            **[글 구성: 팩트체크 (MythBust)]**
-            - 서론: "임플란트가 비쌀수록 좋다? 과연 그럴까요?" 와 같이 흔한 오해를 자극적으로 제기하세요.
-            - 본문: 잘못된 상식을 조목조목 반박하며 전문가적인 식견을 뽐내세요. '오해 vs 진실' 구도를 사용하세요.
-            """
-        else:
-            style_instruction = "**[글 구성: 기본 정보성 (Standard)]**: 일반적인 정보 전달과 병원 홍보가 균형 잡힌 구조로 작성하세요."
+# Per-style structure instructions (part of the static prompt prefix)
+STYLE_INSTRUCTIONS = {
+    "Story": """
+    **[글 구성: 환자 스토리텔링 (Story)]**
+    - 서론: "지난주 내원하셨던 환자분의 이야기입니다..." 처럼 구체적인 에피소드로 시작하세요.
+    - 본문: 환자가 겪었던 고통과 고민을 생생하게 묘사하고, 치료 후 어떻게 삶이 바뀌었는지 드라마틱하게 서술하세요.
+    """,
+    "Q&A": """
+    **[글 구성: Q&A 질의응답 (FAQ)]**
+    - 글 전체를 '환자분들이 가장 자주 묻는 질문 3가지'로 구성하세요.
+    - Q1. 질문 -> A1. 답변 -> Q2. 질문 -> A2. 답변 형식으로 명확하게 구분하여 작성하세요.
+    """,
+    "MythBust": """
+    **[글 구성: 팩트체크 (MythBust)]**
+    - 서론: "임플란트가 비쌀수록 좋다? 과연 그럴까요?" 와 같이 흔한 오해를 자극적으로 제기하세요.
+    - 본문: 잘못된 상식을 조목조목 반박하며 전문가적인 식견을 뽐내세요. '오해 vs 진실' 구도를 사용하세요.
+    """,
+    "Standard": "**[글 구성: 기본 정보성 (Standard)]**: 일반적인 정보 전달과 병원 홍보가 균형 잡힌 구조로 작성하세요.",
+}
 
-        # 2. Construct Prompt
-        prompt = f"""
+# Static part of the prompt. It only depends on the style, so it is compiled once
+# per style and comes first: identical leading tokens across requests can be
+# served from the model provider's prefix cache.
+PROMPT_PREFIX_TEMPLATE = """
 # Role: 치과 브랜드 마케팅 및 SEO 글쓰기 최고 전문가
 
 # Context
@@ -87,27 +157,17 @@ def generate_blog_post(dentist_name, topic, keyword, style="Standard", context_i
 아래 제공되는 [참고 문서]를 바탕으로, 실제 원장님이 쓴 것처럼 자연스럽고 신뢰감 있는 블로그 포스팅을 작성해야 합니다.
 **주의: 당신이 AI라는 사실을 절대 들키지 마세요.**
 
-# Input Data
-1. 원장님 성함: {dentist_name}
-2. 글 주제: {topic}
-3. 메인 키워드: {keyword}
-4. **글 작문 스타일**: {style} 모드
-5. 참고 문서(스타일 소스): 
-[
-{ref_text}
-]
-{context_instruction}
-
 # Task Process (반드시 순서대로 수행)
 1. **[초정밀 스타일 해부]**: [참고 문서]에서 다음 3가지 DNA를 추출하여 체화할 것.
    - **시각적 패턴**: 문단 길이, 줄바꿈 호흡, 이모지 사용 빈도 및 위치.
    - **어투(VoicePrint)**: 고유의 종결 어미(예: '~했답니다' vs '~했습니다'), 자주 쓰는 접속사/감탄사.
    - **정서적 태도**: 환자를 대하는 온도(다정한 이웃 vs 냉철한 전문가 vs 열정적인 코치).
+   - [문체 프로필]이 주어지면 시각적 패턴과 어투는 다시 분석하지 말고 프로필의 수치를 그대로 따를 것.
 2. **[페르소나 동기화]**: 당신의 'AI스러운' 기계적 말투를 완전히 버리고, 위에서 추출한 원장님 고유의 영혼을 장착하세요.
 3. **[글 작성]**: 동기화된 페르소나로 **[글 작문 스타일]**의 구조에 맞춰 본문을 작성하세요. 마치 원장님이 직접 타자를 치는 것처럼.
 
 # Critical Guidelines (작성 규칙)
-{style_instruction}
+<<STYLE_INSTRUCTION>>
 
 ## 1. SEO 및 키워드 전략
 - **메인 키워드 배치**: 제목에 1회(가장 앞쪽 권장), 본문 첫 단락, 중간, 마지막 단락에 자연스럽게 총 5회 이상 포함.
@@ -120,8 +180,8 @@ def generate_blog_post(dentist_name, topic, keyword, style="Standard", context_i
 - **가독성 패턴**: 한 줄은 모바일 기준 20~25자를 넘지 않도록 간결하게 끊어칠 것.
 
 ## 3. 의료법 준수 및 신뢰도 확보 (매우 중요/보수적 적용)
-- **절대적 표현 금지 (의료법 제56조)**: '최고', '최상', '유일', '100%', '완치', '재발 없음', '전혀 아프지 않은', '무통', '특효', '약속합니다' 등 치료 효과를 보장하거나 과장하는 단어는 **절대로 사용 불가**. 대신 '도움이 될 수 있습니다', '개선 효과를 기대할 수 있습니다'와 같이 **가능성**을 열어두는 표현을 사용할 것.
-- **비교 및 비방 금지**: 타 치과와 비교하거나 우위를 점하는 표현('다른 곳보다 저렴한', '타 병원에서 포기한') 금지. 오직 해당 병원의 진료 시스템과 철학에만 집중할 것.
+- **절대적 표현 금지 (의료법 제56조)**: <<BANNED_TERMS>> 등 치료 효과를 보장하거나 과장하는 단어는 **절대로 사용 불가**. 대신 '도움이 될 수 있습니다', '개선 효과를 기대할 수 있습니다'와 같이 **가능성**을 열어두는 표현을 사용할 것.
+- **비교 및 비방 금지**: 타 치과와 비교하거나 우위를 점하는 표현(<<COMPARISON_PHRASES>>) 금지. 오직 해당 병원의 진료 시스템과 철학에만 집중할 것.
 - **부작용 및 개인차 명시 (필수)**: 시술의 장점만 나열하지 말고, "환자의 구강 상태에 따라 치료 결과나 기간이 달라질 수 있으며, 드물게 부작용(통증, 감각 이상 등)이 발생할 수 있음"을 본문 하단이나 시술 설명 직후에 반드시 명시하여 법적 안전장치를 마련할 것.
 
 ## 4. 문체 및 톤앤매너
@@ -147,16 +207,442 @@ def generate_blog_post(dentist_name, topic, keyword, style="Standard", context_i
 
 2. **[추천 해시태그]**: (메인 키워드 포함 10개)
 
+"""
+
+def _quoted(terms):
+    return ", ".join(f"'{term}'" for term in terms)
+
+# The rule lists are shared with the compliance scanner, so the prompt and the check never drift apart
+PROMPT_PREFIXES = {
+    style: PROMPT_PREFIX_TEMPLATE.replace("<<STYLE_INSTRUCTION>>", instruction)
+                                 .replace("<<BANNED_TERMS>>", _quoted(BANNED_TERMS))
+                                 .replace("<<COMPARISON_PHRASES>>", _quoted(COMPARISON_PHRASES))
+    for style, instruction in STYLE_INSTRUCTIONS.items()
+}
+
+def get_prompt_prefix(style):
+    """Precompiled static prompt prefix for a style (unknown styles use Standard)."""
+    return PROMPT_PREFIXES.get(style, PROMPT_PREFIXES["Standard"])
+
+def build_prompt_suffix(dentist_name, topic, keyword, style="Standard", context_input="", references=None,
+                        profile_text=None):
+    """
+    Builds the small dynamic part of the prompt. The dentist's style profile and
+    the reference block come first, so requests for the same dentist (and the
+    same references) also share that part of the prefix.
+    """
+    profile_block = ""
+    if profile_text:
+        profile_block = f"[문체 프로필] (원장님의 과거 글에서 미리 계산한 통계)\n{profile_text}\n\n"
+
+    if not references:
+        ref_text = "문체 프로필을 따르세요." if profile_text else "참고할 과거 데이터가 없습니다."
+    else:
+        # Join references with a separator
+        ref_text = "\n\n---\n\n".join(references)
+
+    context_instruction = ""
+    if style == "Story" and context_input:
+        context_instruction = f"6. **환자 에피소드 (필수 반영)**: 다음 실화 내용을 바탕으로 글을 재구성하세요.\n   [에피소드]: {context_input}"
+
+    return f"""
+# Input Data
+{profile_block}1. 참고 문서(스타일 소스): 
+[
+{ref_text}
+]
+2. 원장님 성함: {dentist_name}
+3. 글 주제: {topic}
+4. 메인 키워드: {keyword}
+5. **글 작문 스타일**: {style} 모드
+{context_instruction}
+
 [작성 시작]
 """
 
-        # 3. Call Gemini API
-        # User requested 3.0 Flash. Using 'gemini-3-flash-preview'.
-        model = genai.GenerativeModel('gemini-3-flash-preview')
+def build_prompt(dentist_name, topic, keyword, style="Standard", context_input="", references=None, profile_text=None):
+    """
+    Builds the full generation prompt from the inputs and the reference posts.
+    """
+    return get_prompt_prefix(style) + build_prompt_suffix(dentist_name, topic, keyword, style, context_input, references,
+                                                          profile_text)
+
+class BlogPostStream:
+    """
+    Iterable of text chunks for one generation.
+    `references` is available right away; `text` holds everything streamed so far.
+    `cached` is True when the post was served from the generation cache.
+    `info` holds the token budget and actual token counts of the prompt.
+    """
+
+    def __init__(self, chunks, references, error=None, cached=False, on_complete=None, info=None):
+        self._chunks = chunks
+        self._on_complete = on_complete
+        self.references = references
+        self.text = ""
+        self.error = error
+        self.cached = cached
+        self.info = info or {}
+
+    def __iter__(self):
+        usage = None
+        started = time.perf_counter()
+        try:
+            for chunk in self._chunks:
+                text = chunk if isinstance(chunk, str) else chunk.text
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                self.text += text
+                yield text
+        except Exception as e:
+            self.error = e
+            metrics.observe("generate_stream", time.perf_counter() - started, error=e)
+            metrics.inc("generation_errors")
+            st.error(f"Generation failed: {str(e)}")
+            return
+        if not self.cached:
+            metrics.observe("generate_stream", time.perf_counter() - started, chars=len(self.text))
+
+        # Token usage is reported on the last chunk
+        _record_usage(self.info, usage)
+
+        if self.text and self._on_complete is not None:
+            self._on_complete(self.text)
+
+    def find_similar(self):
+        """Call after the stream is consumed: the existing posts `text` overlaps most (see find_similar_posts)."""
+        if not self.text:
+            return []
+        self.info["similar"] = find_similar_posts(self.text)
+        return self.info["similar"]
+
+    def ensure_compliance(self, model=None):
+        """
+        Call after the stream is consumed: fixes 의료법 violations in `text`
+        (see fix_compliance) and re-stores the fixed post in the cache.
+        Returns the compliance report, or None when nothing was checked.
+        """
+        if self.cached or not self.text or not AUTO_FIX_COMPLIANCE:
+            return None
+        fixed, report = fix_compliance(self.text, model)
+        if fixed != self.text:
+            self.text = fixed
+            if self._on_complete is not None:
+                self._on_complete(fixed)
+        self.info["compliance"] = report
+        return report
+
+def _prepare_generation(dentist_name, topic, keyword, style, context_input, index=None, token_budget=None):
+    # Same normalized inputs -> same reference sample -> same cache key, also for a
+    # fresh generation, so its text replaces the cached one instead of being stored
+    # under a key nothing looks up again
+    inputs_key = _hash([_normalize(x) for x in (dentist_name, topic, keyword, style, context_input)])
+    if index is None:
+        index = get_dentist_index()
+
+    # 1. Style profile (precomputed) + reference data (RAG) fitted into the token budget
+    profile_text = None
+    if STYLE_PROFILE_MODE != "off":
+        profile = get_style_profiles().profile_for(index, dentist_name)
+        if profile is not None:
+            profile_text = format_profile(profile)
+    if token_budget is None:
+        if profile_text is None:
+            token_budget = DEFAULT_TOKEN_BUDGET
+        else:
+            token_budget = 0 if STYLE_PROFILE_MODE == "replace" else PROFILE_REFERENCE_BUDGET
+
+    candidates = get_dentist_references(dentist_name, n=REFERENCE_CANDIDATES, index=index,
+                                        seed=inputs_key, query=f"{topic} {keyword}")
+    if not candidates:
+        st.warning(f"No past data found for {dentist_name}. Generating with generic style.")
+    # Relevance order is kept; random samples have none, so shorter ones go first
+    references, info = pack_references(candidates, token_budget, shortest_first=REFERENCE_SELECTION == "random")
+    info["profile_tokens"] = count_tokens(profile_text) if profile_text else 0
+
+    # 2. Construct Prompt (precompiled static prefix + small dynamic suffix)
+    with metrics.span("prompt", style=style) as fields:
+        prefix = get_prompt_prefix(style)
+        suffix = build_prompt_suffix(dentist_name, topic, keyword, style, context_input, references, profile_text)
+        info["prefix_tokens"] = _count_prefix_tokens(prefix)
+        info["suffix_tokens"] = count_tokens(suffix)
+        info["prompt_tokens"] = info["prefix_tokens"] + info["suffix_tokens"]
+        fields["prompt_tokens"] = info["prompt_tokens"]
+        fields["reference_tokens"] = info["tokens"]
+
+    config = get_model_config()
+    cache_key = _hash([inputs_key, [reference_id(r) for r in references], profile_text, config["model"],
+                       config["generation_config"]])
+    return prefix, suffix, references, cache_key, info
+
+_prefix_token_counts = {}
+
+def _count_prefix_tokens(prefix):
+    if prefix not in _prefix_token_counts:
+        _prefix_token_counts[prefix] = count_tokens(prefix)
+    return _prefix_token_counts[prefix]
+
+def _record_usage(info, usage):
+    """Copies Gemini's token usage into info; cached_tokens shows how much of the prefix was reused."""
+    if usage is None:
+        return
+    info["input_tokens"] = getattr(usage, "prompt_token_count", 0)
+    info["output_tokens"] = getattr(usage, "candidates_token_count", 0)
+    info["cached_tokens"] = getattr(usage, "cached_content_token_count", 0)
+    for name in ("input_tokens", "output_tokens", "cached_tokens"):
+        metrics.inc(name, info[name] or 0)
+
+_prefix_caches = {}  # (model, style) -> (model bound to the cached prefix or None, expires_at)
+_prefix_caches_lock = threading.Lock()
+_prefix_caches_pending = set()  # Keys whose cached content is being created
+
+def _get_prefix_model(registry, style, prefix):
+    """
+    Model bound to server-side cached content holding the static prefix of a
+    style, created on first use and renewed when it expires. Returns None when
+    explicit caching is not available (old SDK, prefix below the model's
+    minimum size, ...). Only the style prefix is cached; the dentist's
+    references change with the topic and stay in the suffix.
+    """
+    import google.generativeai as genai
+
+    caching = getattr(genai, "caching", None)
+    if caching is None:
+        return None
+
+    key = (registry.model_name, style)
+    with _prefix_caches_lock:
+        entry = _prefix_caches.get(key)
+        if entry is not None and entry[1] > time.time() + 60:
+            return entry[0]
+        if key in _prefix_caches_pending:
+            # Another request is creating it; use the old one while it is still alive
+            return entry[0] if entry is not None and entry[1] > time.time() else None
+        _prefix_caches_pending.add(key)
+
+    # Network call, outside the lock so other styles and requests don't wait on it
+    model = None
+    try:
+        cached = caching.CachedContent.create(
+            model=f"models/{registry.model_name}",
+            system_instruction=prefix,
+            ttl=datetime.timedelta(seconds=PROMPT_CACHE_TTL),
+        )
+        model = genai.GenerativeModel.from_cached_content(cached,
+                                                          generation_config=registry.generation_config or None)
+    except Exception as e:
+        # Don't retry on every request; fall back to implicit prefix reuse
+        print(f"Prompt prefix cache unavailable for {style}: {e}")
+    finally:
+        with _prefix_caches_lock:
+            _prefix_caches[key] = (model, time.time() + PROMPT_CACHE_TTL)
+            _prefix_caches_pending.discard(key)
+    return model
+
+def _generate(model, style, prefix, suffix, info, stream=False, limiter=None):
+    """
+    Calls Gemini with the prompt. Without an explicit `model`, the shared
+    registry picks the primary model, or a fallback while it is throttled,
+    and info["model"] records which one answered.
+    """
+    if limiter is not None:
+        limiter.acquire()
+    # With stream=True this covers the request up to the first chunk
+    with metrics.span("generate_content", stream=stream) as fields:
+        if model is not None:
+            return model.generate_content(prefix + suffix, stream=stream)
+
+        registry = get_model_registry()
+        primary = None
+        if PROMPT_CACHE_MODE == "explicit":
+            prefix_model = _get_prefix_model(registry, style, prefix)
+            if prefix_model is not None:
+                # The prefix lives server-side; only the dynamic suffix is sent
+                primary = (prefix_model, suffix)
+        response, info["model"] = registry.generate_content(prefix + suffix, stream=stream, primary=primary)
+        fields["model"] = info["model"]
+        return response
+
+COMPLIANCE_REWRITE_PROMPT = """
+# Task
+아래는 치과 블로그 글의 일부 문단입니다. 각 문단에 의료법 제56조에 어긋나는 표현이 있습니다.
+문단마다 같은 어투와 비슷한 길이로 다시 써주세요.
+- 금지 표현: {banned}
+- 다른 치과/병원과 비교하는 표현 금지: {comparisons}
+- 치료 효과를 보장하지 말고 '도움이 될 수 있습니다'처럼 가능성으로 표현할 것
+- 별표(**)나 샵(##) 같은 마크다운 기호 사용 금지
+
+# Output
+문단 번호 줄([P1] 등)을 그대로 쓰고 그 아래에 고친 문단만 쓰세요. 다른 설명은 쓰지 마세요.
+
+{paragraphs}
+"""
+
+def _rewrite_paragraphs(paragraphs, model=None, limiter=None):
+    """Asks the model to rewrite {number: (paragraph, terms)}; returns {number: new paragraph}."""
+    blocks = "\n\n".join(f"[P{number}] (문제 표현: {', '.join(terms)})\n{paragraph}"
+                          for number, (paragraph, terms) in paragraphs.items())
+    prompt = COMPLIANCE_REWRITE_PROMPT.format(banned=_quoted(BANNED_TERMS), comparisons=_quoted(COMPARISON_PHRASES),
+                                              paragraphs=blocks)
+    if limiter is not None:
+        limiter.acquire()
+    if model is None:
+        response, _ = get_model_registry().generate_content(prompt)
+    else:
         response = model.generate_content(prompt)
-        
-        return response.text, references
+
+    rewrites = {}
+    parts = re.split(r"^\[P(\d+)\][^\n]*$", response.text, flags=re.M)
+    for number, body in zip(parts[1::2], parts[2::2]):
+        number = int(number)
+        if number in paragraphs and body.strip():
+            rewrites[number] = body.strip()
+    return rewrites
+
+def fix_compliance(text, model=None, limiter=None):
+    """
+    Fixes 의료법 violations in a generated post without regenerating it:
+    markdown markers are stripped locally, and only the paragraphs that still
+    contain banned or comparison expressions go back to the model, in one call.
+    `limiter` (e.g. batch.RateLimiter) is acquired before that call.
+    Returns (text, report); report["remaining"] lists terms that are still there.
+    """
+    with metrics.span("compliance") as fields:
+        violations = scan(text)
+        report = {"violations": len(violations), "terms": sorted({v["term"] for v in violations}), "rewritten": 0}
+        if any(v["category"] == "markdown" for v in violations):
+            text = strip_markdown(text)
+            violations = scan(text)
+
+        if violations:
+            spans = paragraph_spans(text)
+            offending = {}
+            for v in violations:
+                if v["paragraph"] is not None:
+                    offending.setdefault(v["paragraph"] + 1, set()).add(v["term"])
+            paragraphs = {number: (text[spans[number - 1][0]:spans[number - 1][1]], sorted(terms))
+                          for number, terms in offending.items()}
+            try:
+                rewrites = _rewrite_paragraphs(paragraphs, model, limiter)
+            except Exception as e:
+                # Keep the post as it is; the remaining terms are reported below
+                print(f"Compliance rewrite failed: {e}")
+                report["error"] = str(e)
+                rewrites = {}
+            # Back to front, so the offsets of earlier paragraphs stay valid
+            for number in sorted(rewrites, reverse=True):
+                start, end = spans[number - 1]
+                text = text[:start] + rewrites[number] + text[end:]
+            report["rewritten"] = len(rewrites)
+
+        report["remaining"] = sorted({v["term"] for v in scan(text)})
+        fields.update(violations=report["violations"], rewritten=report["rewritten"],
+                      remaining=len(report["remaining"]))
+    metrics.inc("compliance", result="clean" if not report["violations"]
+                else "fixed" if not report["remaining"] else "remaining")
+    return text, report
+
+def warm_near_duplicate_index(index=None):
+    """Starts signing the corpus posts not yet in the near-duplicate index on a background thread."""
+    if index is None:
+        index = get_dentist_index()
+    return get_near_duplicate_index().update_async(index.corpus)
+
+def find_similar_posts(text, index=None, k=SIMILAR_POSTS):
+    """
+    Existing posts that `text` overlaps most, best first: dicts with position,
+    dentist, topic and the estimated Jaccard similarity. Only posts already in
+    the near-duplicate index are compared; a corpus that moved on is signed on
+    a background thread (warm_near_duplicate_index) instead of in this call.
+    """
+    if index is None:
+        index = get_dentist_index()
+    duplicates = get_near_duplicate_index()
+    with metrics.span("similarity") as fields:
+        fields["warming"] = duplicates.update_async(index.corpus)
+        corpus, matches = duplicates.lookup(text, k)
+        fields["indexed"] = len(duplicates)
+        fields["max_similarity"] = matches[0][1] if matches else 0.0
+    metrics.inc("near_duplicate", result="flagged" if fields["max_similarity"] >= DUPLICATE_THRESHOLD else "ok")
+    return [{"position": position, "dentist": str(corpus.dentists[position]), "topic": corpus.topic(position),
+             "similarity": similarity} for position, similarity in matches]
+
+def stream_blog_post(dentist_name, topic, keyword, style="Standard", context_input="", model=None, fresh=False, cache=None,
+                     token_budget=None):
+    """
+    Streaming variant of generate_blog_post.
+    Returns a BlogPostStream that yields text chunks as Gemini produces them.
+    `model` can be any object with a Gemini-style generate_content(prompt, stream=True).
+    `fresh=True` skips the cache lookup; the new text replaces the cached one.
+    `token_budget` caps the tokens spent on reference posts (DEFAULT_TOKEN_BUDGET).
+    """
+    try:
+        prefix, suffix, references, cache_key, info = _prepare_generation(dentist_name, topic, keyword, style,
+                                                                          context_input, token_budget=token_budget)
+        if cache is None:
+            cache = get_generation_cache()
+
+        if not fresh:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                metrics.inc("generation_cache", result="hit")
+                return BlogPostStream(iter([cached["text"]]), references, cached=True, info=info)
+        metrics.inc("generation_cache", result="fresh" if fresh else "miss")
+
+        # 3. Call Gemini API (streaming)
+        response = _generate(model, style, prefix, suffix, info, stream=True)
+        return BlogPostStream(response, references, info=info,
+                              on_complete=lambda text: cache.set(cache_key, {"text": text}))
+
+    except Exception as e:
+        metrics.inc("generation_errors")
+        st.error(f"Generation failed: {str(e)}")
+        return BlogPostStream(iter(()), [], error=e)
+
+def generate_post(dentist_name, topic, keyword, style="Standard", context_input="", model=None, fresh=False, cache=None,
+                  index=None, token_budget=None, limiter=None):
+    """
+    Core of generate_blog_post that raises on failure instead of reporting to the UI.
+    Used directly by batch jobs, which retry on rate limits / server errors.
+    `index` lets many calls share one DentistIndex instead of looking it up each time.
+    `limiter` (e.g. batch.RateLimiter) is acquired before each model call.
+    Returns (text, references, info); info has the token budget, actual token counts
+    and the existing posts the text overlaps most (similar, see find_similar_posts).
+    """
+    prefix, suffix, references, cache_key, info = _prepare_generation(dentist_name, topic, keyword, style,
+                                                                      context_input, index, token_budget)
+    if cache is None:
+        cache = get_generation_cache()
+
+    if not fresh:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            metrics.inc("generation_cache", result="hit")
+            info["cached"] = True
+            info["similar"] = find_similar_posts(cached["text"], index)
+            return cached["text"], references, info
+    metrics.inc("generation_cache", result="fresh" if fresh else "miss")
+
+    # 3. Call Gemini API
+    response = _generate(model, style, prefix, suffix, info, limiter=limiter)
+    _record_usage(info, getattr(response, "usage_metadata", None))
+    text = response.text
+    if AUTO_FIX_COMPLIANCE:
+        text, info["compliance"] = fix_compliance(text, model, limiter)
+    cache.set(cache_key, {"text": text})
+    info["similar"] = find_similar_posts(text, index)
+
+    info["cached"] = False
+    return text, references, info
+
+def generate_blog_post(dentist_name, topic, keyword, style="Standard", context_input="", model=None, fresh=False, cache=None):
+    """
+    Generates a blog post using Gemini, based on the dentist's past style and selected content type.
+    """
+    try:
+        text, references, _ = generate_post(dentist_name, topic, keyword, style, context_input, model, fresh, cache)
+        return text, references
 
     except Exception as e:
+        metrics.inc("generation_errors")
         st.error(f"Generation failed: {str(e)}")
         return "", []
@@ -0,0 +1,196 @@
+"""
+Background generation jobs for the app.
+
+Generation runs on a process-wide pool of worker threads instead of inside
+the Streamlit script, so reruns (any widget interaction) and page refreshes
+neither block on Gemini nor throw the work away. A session submits a job,
+keeps its ID and polls the job for status and the text streamed so far.
+
+    queue = JobQueue(stream_job)
+    job_id = queue.submit(session, {"dentist": ..., "topic": ..., "keyword": ...})
+    job = queue.get(job_id, session)   # job.status, job.text, job.references ...
+
+Sessions are limited in how many jobs they may have waiting or running and
+how many they may start per hour, so one user cannot use up the model quota;
+the last HISTORY_SIZE jobs of each session are kept in memory.
+"""
+import time
+import uuid
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+# Generations running at the same time (process-wide)
+JOB_WORKERS = 4
+# Jobs waiting for a worker before new ones are refused
+MAX_QUEUED = 32
+# Per session: jobs waiting or running at once / jobs started in the last hour
+MAX_ACTIVE_PER_SESSION = 2
+MAX_JOBS_PER_HOUR = 30
+# Finished jobs kept per session, and how long an idle session's history is kept
+HISTORY_SIZE = 10
+SESSION_TTL = 24 * 3600
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+class JobLimitError(Exception):
+    """A job was refused; `reason` is "queue_full", "active" or "rate"."""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+class Job:
+    """
+    One generation request. `text` grows while the post is streamed; the
+    other results are filled in when the generate function returns.
+    """
+
+    def __init__(self, session, params):
+        self.id = uuid.uuid4().hex  # Also what a refreshed tab resumes its session with (see app.session_key)
+        self.session = session
+        self.params = dict(params)
+        self.status = QUEUED
+        self.text = ""
+        self.references = []
+        self.info = {}
+        self.cached = False
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED)
+
+class JobQueue:
+    """
+    Bounded pool of worker threads running `generate(job)`, which must return
+    (text, references, info) and may update job.text / job.references while it
+    works. Meant to live for the whole process (see app.get_job_queue); a stub
+    `generate` can be passed in for testing.
+    """
+
+    def __init__(self, generate, workers=JOB_WORKERS, max_queued=MAX_QUEUED, max_active=MAX_ACTIVE_PER_SESSION,
+                 max_per_hour=MAX_JOBS_PER_HOUR, history=HISTORY_SIZE, session_ttl=SESSION_TTL):
+        self.generate = generate
+        self.max_queued = max_queued
+        self.max_active = max_active
+        self.max_per_hour = max_per_hour
+        self.history = history
+        self.session_ttl = session_ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="generation")
+        self._jobs = {}      # job ID -> Job
+        self._sessions = {}  # session -> deque of its job IDs, oldest first
+        self._started = {}   # session -> deque of submit times within the last hour
+        self._lock = threading.Lock()
+
+    def submit(self, session, params):
+        """Queues a job for `session`; returns its ID or raises JobLimitError."""
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            jobs = [self._jobs[job_id] for job_id in self._sessions.get(session, ())]
+            if sum(job.status == QUEUED for job in self._jobs.values()) >= self.max_queued:
+                raise JobLimitError("queue_full", "Too many jobs are waiting")
+            if sum(not job.done for job in jobs) >= self.max_active:
+                raise JobLimitError("active", f"At most {self.max_active} jobs per session at once")
+            started = self._started.setdefault(session, deque())
+            while started and now - started[0] > 3600:
+                started.popleft()
+            if len(started) >= self.max_per_hour:
+                raise JobLimitError("rate", f"At most {self.max_per_hour} jobs per session per hour")
+
+            job = Job(session, params)
+            started.append(now)
+            self._jobs[job.id] = job
+            history = self._sessions.setdefault(session, deque())
+            history.append(job.id)
+            # Forget the oldest finished jobs beyond the history size
+            while len(history) > self.history and self._jobs[history[0]].done:
+                del self._jobs[history.popleft()]
+        metrics.inc("jobs", status=QUEUED)
+        self._executor.submit(self._run, job)
+        return job.id
+
+    def _prune(self, now):
+        """Drops the history of sessions that have been idle longer than session_ttl."""
+        for session, history in list(self._sessions.items()):
+            jobs = [self._jobs[job_id] for job_id in history]
+            if all(job.done and job.finished_at is not None and now - job.finished_at > self.session_ttl
+                   for job in jobs):
+                for job_id in history:
+                    del self._jobs[job_id]
+                del self._sessions[session]
+                self._started.pop(session, None)
+
+    def _run(self, job):
+        job.started_at = time.time()
+        job.status = RUNNING
+        metrics.observe("job_wait", job.started_at - job.created_at)
+        try:
+            with metrics.span("job"):
+                job.text, job.references, job.info = self.generate(job)
+            status = DONE
+        except Exception as e:
+            job.error = str(e) or type(e).__name__
+            status = FAILED
+            print(f"Generation job {job.id} failed: {job.error}")
+        # finished_at before the status: a job counts as done (see _prune) once its status is set
+        job.finished_at = time.time()
+        job.status = status
+        metrics.inc("jobs", status=status)
+
+    def get(self, job_id, session):
+        """The job if it exists and belongs to `session`, else None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job is not None and job.session == session else None
+
+    def owner(self, job_id):
+        """The session that submitted the job, or None if it is unknown (or no longer kept)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job.session if job is not None else None
+
+    def jobs(self, session):
+        """The session's jobs in memory, newest first."""
+        with self._lock:
+            return [self._jobs[job_id] for job_id in reversed(self._sessions.get(session, ()))]
+
+    def position(self, job):
+        """Jobs queued ahead of `job` (0 once it is running)."""
+        if job.status != QUEUED:
+            return 0
+        with self._lock:
+            return sum(other.status == QUEUED and other.created_at < job.created_at for other in self._jobs.values())
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+def stream_job(job):
+    """
+    Default generate function: streams the post with generator.stream_blog_post
+    (job.text grows as chunks arrive), then runs the compliance fix and the
+    near-duplicate check, as the app did inline.
+    """
+    from generator import stream_blog_post
+
+    params = job.params
+    stream = stream_blog_post(params["dentist"], params["topic"], params["keyword"], params.get("style", "Standard"),
+                              params.get("context", ""), fresh=params.get("fresh", False))
+    job.references = stream.references
+    job.info = stream.info
+    job.cached = stream.cached
+    for _ in stream:
+        job.text = stream.text
+    if stream.error is not None:
+        raise stream.error
+    if not stream.text:
+        raise RuntimeError("The model returned an empty post")
+    stream.ensure_compliance()
+    stream.find_similar()
+    return stream.text, stream.references, stream.info
@@ -0,0 +1,100 @@
+import re
+import math
+from collections import Counter
+
+# Query/document terms: Latin words and numbers as-is, Hangul runs as
+# character bigrams so "임플란트" also matches "임플란트는", "치과임플란트" etc.
+_WORD = re.compile(r"[0-9a-z]+|[가-힣]+")
+
+def tokenize(text):
+    tokens = []
+    for word in _WORD.findall(text.lower()):
+        if word[0] < "가" or len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuses several ranked lists of IDs: score = sum of 1 / (k + rank)."""
+    scores = Counter()
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return [doc_id for doc_id, _ in scores.most_common()]
+
+class BM25Index:
+    """
+    In-memory BM25 inverted index with incremental add/remove.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}   # term -> {doc_id: term frequency}
+        self.doc_terms = {}  # doc_id -> Counter of terms (needed for removal)
+        self.doc_length = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def add(self, doc_id, text):
+        if doc_id in self.doc_terms:
+            self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        self.doc_terms[doc_id] = terms
+        self.doc_length[doc_id] = sum(terms.values())
+        self.total_length += self.doc_length[doc_id]
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def remove(self, doc_id):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.doc_length.pop(doc_id)
+        for term in terms:
+            docs = self.postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self.postings[term]
+
+    def search(self, query, k=10):
+        """
+        Returns up to k (doc_id, score) pairs, best first, and the fraction of
+        distinct query terms found in the best document.
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.doc_terms:
+            return [], 0.0
+
+        n = len(self.doc_terms)
+        avg_length = self.total_length / n
+        scores = Counter()
+        for term in terms:
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                length = self.doc_length[doc_id]
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_length))
+
+        results = scores.most_common(k)
+        if not results:
+            return [], 0.0
+        best_terms = self.doc_terms[results[0][0]]
+        coverage = sum(1 for term in terms if term in best_terms) / len(terms)
+        return results, coverage
+
+    def is_confident(self, results, coverage, min_coverage=1.0, min_margin=1.5):
+        """
+        True when the lexical result alone is trustworthy: the best document
+        contains every query term and clearly beats the runner-up.
+        """
+        if not results or coverage < min_coverage:
+            return False
+        if len(results) == 1:
+            return True
+        return results[0][1] >= min_margin * results[1][1]
@@ -0,0 +1,169 @@
+"""
+Lightweight in-process metrics: timed spans and counters.
+
+    from metrics import metrics
+
+    with metrics.span("prompt") as fields:
+        ...
+        fields["tokens"] = 1234       # extra fields go to the JSONL sink
+
+    metrics.inc("generation_cache", result="hit")
+
+Recent span durations are kept for percentiles (admin panel in app.py), and
+everything can be exported as Prometheus text. Set METRICS_LOG to a file path
+to also append every span as one JSON line, and METRICS_PORT to serve the
+Prometheus text over HTTP (see start_http_server).
+"""
+import os
+import json
+import time
+import functools
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Recent durations kept per span for percentiles
+SPAN_HISTORY = 1000
+PROMETHEUS_PREFIX = "blog_"
+
+def _percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+class Metrics:
+    """Thread-safe registry of counters and span timings."""
+
+    def __init__(self, history=SPAN_HISTORY, sink_path=None):
+        self.history = history
+        self.sink_path = sink_path
+        self._counters = {}  # (name, sorted label items) -> value
+        self._spans = {}     # name -> {"recent": deque, "count", "sum", "errors"}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, error=None, **fields):
+        """Records one finished span; `error` is the exception (or its name) if it failed."""
+        with self._lock:
+            span = self._spans.get(name)
+            if span is None:
+                span = {"recent": deque(maxlen=self.history), "count": 0, "sum": 0.0, "errors": 0}
+                self._spans[name] = span
+            span["recent"].append(seconds)
+            span["count"] += 1
+            span["sum"] += seconds
+            if error is not None:
+                span["errors"] += 1
+        if self.sink_path:
+            record = {"ts": round(time.time(), 3), "span": name, "seconds": round(seconds, 6), **fields}
+            if error is not None:
+                record["error"] = error if isinstance(error, str) else type(error).__name__
+            self._write(record)
+
+    @contextmanager
+    def span(self, name, **fields):
+        """Times the block; yields a dict the block can add fields to."""
+        started = time.perf_counter()
+        try:
+            yield fields
+        except BaseException as e:
+            self.observe(name, time.perf_counter() - started, error=e, **fields)
+            raise
+        self.observe(name, time.perf_counter() - started, **fields)
+
+    def timed(self, name):
+        """Decorator form of span()."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        try:
+            with self._lock, open(self.sink_path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            print(f"Metrics sink unavailable: {e}")
+            self.sink_path = None
+
+    def snapshot(self):
+        """Counters and per-span count/errors/percentiles (seconds over the recent history)."""
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            spans = {}
+            for name, span in sorted(self._spans.items()):
+                ordered = sorted(span["recent"])
+                spans[name] = {
+                    "count": span["count"],
+                    "errors": span["errors"],
+                    "sum": span["sum"],
+                    "p50": _percentile(ordered, 50),
+                    "p90": _percentile(ordered, 90),
+                    "p99": _percentile(ordered, 99),
+                }
+        return {"counters": counters, "spans": spans}
+
+    def prometheus_text(self):
+        """All metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for counter in snapshot["counters"]:
+            labels = ",".join(f'{k}="{v}"' for k, v in counter["labels"].items())
+            name = f"{PROMETHEUS_PREFIX}{counter['name']}_total"
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{{{labels}}} {counter['value']}" if labels else f"{name} {counter['value']}")
+        for name, span in snapshot["spans"].items():
+            metric = f"{PROMETHEUS_PREFIX}{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for quantile in ("50", "90", "99"):
+                lines.append(f'{metric}{{quantile="0.{quantile}"}} {span["p" + quantile]:.6f}')
+            lines.append(f"{metric}_sum {span['sum']:.6f}")
+            lines.append(f"{metric}_count {span['count']}")
+        # Span errors are one family labelled by span, so they cannot collide with
+        # counters named after a span (e.g. brain_load_db vs brain_load_db_errors)
+        if snapshot["spans"]:
+            metric = f"{PROMETHEUS_PREFIX}span_errors_total"
+            lines.append(f"# TYPE {metric} counter")
+            for name, span in snapshot["spans"].items():
+                lines.append(f'{metric}{{span="{name}"}} {span["errors"]}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._spans.clear()
+
+metrics = Metrics(sink_path=os.environ.get("METRICS_LOG"))
+
+def start_http_server(port, registry=metrics):
+    """Serves registry.prometheus_text() at http://0.0.0.0:<port>/metrics from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # Scrapes would flood the console
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,135 @@
+"""
+Long-lived Gemini model clients.
+
+The API key is configured once and GenerativeModel objects are created once
+per model name and reused by every request. When the primary model is
+throttled (429 / quota exhausted), requests move on to the configured
+fallback models until the primary has cooled down. The SDK itself is only
+imported when the first registry is created, not when this module is.
+
+Configuration (optional) lives in the [gemini] section of secrets.toml:
+
+    [gemini]
+    model = "gemini-3-flash-preview"
+    fallback_models = ["gemini-2.5-flash"]
+
+    [gemini.generation_config]
+    temperature = 0.9
+"""
+import time
+import threading
+
+DEFAULT_MODEL = "gemini-3-flash-preview"
+# Seconds the list of available models is reused before asking the API again
+MODEL_LIST_TTL = 3600
+# Seconds a throttled model is skipped in favour of the fallbacks
+THROTTLE_COOLDOWN = 60
+
+def _genai():
+    # google.generativeai takes a while to import; only load it when a client is needed
+    import google.generativeai as genai
+    return genai
+
+def model_config(section=None):
+    """Normalizes a [gemini] config section (or None) into model, fallback_models and generation_config."""
+    section = dict(section or {})
+    fallbacks = section.get("fallback_models") or []
+    if isinstance(fallbacks, str):
+        fallbacks = [name.strip() for name in fallbacks.split(",") if name.strip()]
+    return {
+        "model": section.get("model") or DEFAULT_MODEL,
+        "fallback_models": list(fallbacks),
+        "generation_config": dict(section.get("generation_config") or {}),
+    }
+
+def is_throttled(error):
+    """
+    True for rate limit / quota errors, judged by the error's HTTP status code
+    (429) or its google.api_core exception type (ResourceExhausted,
+    TooManyRequests), never by the message.
+    """
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int):
+        return code == 429
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return False
+    return isinstance(error, (exceptions.ResourceExhausted, exceptions.TooManyRequests))
+
+class ModelRegistry:
+    """
+    Thread-safe registry of configured Gemini clients, meant to live for the
+    whole process (see generator.get_model_registry).
+    """
+
+    def __init__(self, api_key, config=None, list_ttl=MODEL_LIST_TTL, cooldown=THROTTLE_COOLDOWN):
+        config = config or model_config()
+        self.model_name = config["model"]
+        self.fallback_models = [name for name in config["fallback_models"] if name != self.model_name]
+        self.generation_config = config["generation_config"]
+        self.list_ttl = list_ttl
+        self.cooldown = cooldown
+        self._models = {}
+        self._throttled_until = {}
+        self._available = None
+        self._available_at = 0
+        self._lock = threading.Lock()
+        if api_key:
+            _genai().configure(api_key=api_key)
+
+    def model(self, name=None):
+        """The shared GenerativeModel for `name` (default: the primary model)."""
+        name = name or self.model_name
+        with self._lock:
+            model = self._models.get(name)
+            if model is None:
+                model = _genai().GenerativeModel(name, generation_config=self.generation_config or None)
+                self._models[name] = model
+            return model
+
+    def list_models(self, refresh=False):
+        """Names of the models that support generateContent, cached for `list_ttl` seconds."""
+        with self._lock:
+            if not refresh and self._available is not None and time.time() - self._available_at < self.list_ttl:
+                return self._available
+        available = [m.name for m in _genai().list_models() if "generateContent" in m.supported_generation_methods]
+        with self._lock:
+            self._available = available
+            self._available_at = time.time()
+        return available
+
+    def mark_throttled(self, name):
+        with self._lock:
+            self._throttled_until[name] = time.time() + self.cooldown
+
+    def candidates(self):
+        """Model names to try, in order: the ones not cooling down first."""
+        names = [self.model_name] + self.fallback_models
+        now = time.time()
+        with self._lock:
+            ready = [name for name in names if self._throttled_until.get(name, 0) <= now]
+        return ready + [name for name in names if name not in ready]
+
+    def generate_content(self, contents, stream=False, primary=None):
+        """
+        Calls the primary model, falling back to the next model whenever one is
+        throttled. `primary` optionally replaces the (model, contents) pair used
+        for the primary model, e.g. a model bound to cached prompt content.
+        Returns (response, name of the model that answered).
+        """
+        error = None
+        for name in self.candidates():
+            if primary is not None and name == self.model_name:
+                model, payload = primary
+            else:
+                model, payload = self.model(name), contents
+            try:
+                return model.generate_content(payload, stream=stream), name
+            except Exception as e:
+                if not is_throttled(e):
+                    raise
+                print(f"{name} throttled, trying the next model: {e}")
+                self.mark_throttled(name)
+                error = e
+        raise error
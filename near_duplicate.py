@@ -0,0 +1,302 @@
+"""
+Near-duplicate detection with MinHash signatures and an LSH index.
+
+Posts are reduced to character shingles (SHINGLE_SIZE syllables, spacing and
+punctuation ignored), and each post to NUM_PERM minimum hash values
+(one-permutation MinHash, see MinHasher). Posts
+whose signatures agree on a whole band of rows land in the same LSH bucket,
+so a new post is only compared with the few posts sharing a bucket instead
+of the whole corpus. Similarities are MinHash estimates of the Jaccard
+similarity of the shingle sets.
+
+Usage (duplicate clusters in the local snapshot of the corpus):
+    python near_duplicate.py [--snapshot .cache/blog_posts.parquet] [--threshold 0.6] [-o clusters.jsonl]
+"""
+import re
+import json
+import argparse
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+# BANDS * rows per band = NUM_PERM; pairs above ~(1 / BANDS) ** (1 / rows) usually share a bucket
+BANDS = 32
+# Estimated Jaccard similarity from which a post counts as a near duplicate
+DUPLICATE_THRESHOLD = 0.5
+# Above this share of the corpus in a query's buckets, every signature is compared instead
+BRUTE_FORCE_SHARE = 0.25
+# Buckets larger than this (shared boilerplate) are only paired with their first member in bulk mode
+MAX_BUCKET_PAIRS = 50
+
+_POLY = np.uint64(1000003)
+_EMPTY = np.iinfo(np.uint32).max
+
+def shingles(text, k=SHINGLE_SIZE):
+    """Distinct 64-bit hashes of the k-character shingles of `text` (letters and digits only)."""
+    normalized = re.sub(r"[^0-9a-z가-힣]+", "", (text or "").lower())
+    if len(normalized) < k:
+        return np.empty(0, dtype=np.uint64)
+    codes = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    n = len(codes) - k + 1
+    hashes = np.zeros(n, dtype=np.uint64)
+    for offset in range(k):  # Polynomial hash of each window, wrapping at 2**64
+        hashes = hashes * _POLY + codes[offset:offset + n]
+    return np.unique(hashes)
+
+def _mix(hashes, seed):
+    """splitmix64 finalizer: spreads the shingle hashes over all 64 bits."""
+    x = hashes ^ seed
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+class MinHasher:
+    """
+    One-permutation MinHash: each shingle is hashed once, the top bits pick
+    one of NUM_PERM bins and the low 32 bits compete for that bin's minimum.
+    Same estimates as NUM_PERM independent hash functions for posts of a few
+    hundred shingles or more, at the cost of one hash per shingle instead of
+    NUM_PERM. Empty bins (short texts) borrow the next filled bin's value.
+    The same seed always gives the same signatures.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        if num_perm & (num_perm - 1):
+            raise ValueError("num_perm must be a power of two")
+        self.num_perm = num_perm
+        self.seed = np.uint64(seed)
+        self._shift = np.uint64(64 - (num_perm.bit_length() - 1))
+
+    def signature(self, text):
+        """uint32 signature of `text`; all _EMPTY when the text is too short to shingle."""
+        signature = np.full(self.num_perm, _EMPTY, dtype=np.uint32)
+        hashes = shingles(text)
+        if not len(hashes):
+            return signature
+        mixed = _mix(hashes, self.seed)
+        np.minimum.at(signature, (mixed >> self._shift).astype(np.intp), (mixed & np.uint64(_EMPTY - 1)).astype(np.uint32))
+        filled = np.flatnonzero(signature != _EMPTY)
+        if len(filled) < self.num_perm:
+            nearest = filled[np.searchsorted(filled, np.arange(self.num_perm)) % len(filled)]
+            signature = signature[nearest]
+        return signature
+
+    def signatures(self, texts):
+        return np.array([self.signature(text) for text in texts], dtype=np.uint32).reshape(-1, self.num_perm)
+
+def similarity(signature, others):
+    """Estimated Jaccard similarity of one signature to each row of `others`."""
+    return (others == signature).sum(axis=1, dtype=np.int32) / len(signature)
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures of every post of a corpus plus the LSH buckets over
+    them, meant to live for the whole process (see generator.get_near_duplicate_index).
+    update() only signs the rows appended since the last call; a different
+    corpus lineage (full reload) is signed again from scratch. Signing runs
+    outside the lock, so queries keep using the previous signatures meanwhile;
+    update_async() does it on a background thread.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.hasher = MinHasher(num_perm, seed)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.lineage = None
+        self.corpus = None  # The corpus the positions refer to (at least as long as signatures)
+        self.signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self._buckets = [defaultdict(list) for _ in range(bands)]  # band -> key -> positions
+        self._mix = np.random.default_rng(seed + 1).integers(1, 2 ** 63, size=self.rows, dtype=np.uint64)
+        self._lock = threading.RLock()
+        self._update_lock = threading.Lock()  # One update signing at a time
+        self._updating = False
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def _band_keys(self, signatures):
+        """(n, bands) hash of each band of each signature."""
+        banded = signatures.astype(np.uint64).reshape(len(signatures), self.bands, self.rows)
+        return (banded * self._mix).sum(axis=2)
+
+    def _append(self, signatures, keys):
+        # Under self._lock. Signatures first: queries running meanwhile may already see the new bucket entries
+        start = len(self.signatures)
+        self.signatures = np.concatenate([self.signatures, signatures])
+        for offset, signature in enumerate(signatures):
+            if signature[0] == _EMPTY:
+                continue  # Too short to compare
+            for band, key in enumerate(keys[offset].tolist()):
+                self._buckets[band][key].append(start + offset)
+
+    def add(self, texts):
+        """Signs `texts` and appends them (positions continue after the current ones)."""
+        signatures = self.hasher.signatures(texts)
+        keys = self._band_keys(signatures)
+        with self._lock:
+            self._append(signatures, keys)
+
+    def is_current(self, corpus):
+        with self._lock:
+            return corpus.lineage == self.lineage and len(self.signatures) == len(corpus)
+
+    def update(self, corpus):
+        """Brings the index up to date with a corpus.CorpusStore. Returns the number of posts signed."""
+        with self._update_lock:
+            with self._lock:
+                rebuild = corpus.lineage != self.lineage or len(corpus) < len(self.signatures)
+                start = 0 if rebuild else len(self.signatures)
+            if start >= len(corpus) and not rebuild:
+                return 0
+            # The expensive part, without blocking queries
+            signatures = self.hasher.signatures(corpus.contents(range(start, len(corpus))))
+            keys = self._band_keys(signatures)
+            with self._lock:
+                if rebuild:
+                    self.lineage = corpus.lineage
+                    self.signatures = self.signatures[:0]
+                    self._buckets = [defaultdict(list) for _ in range(self.bands)]
+                self.corpus = corpus
+                self._append(signatures, keys)
+        return len(corpus) - start
+
+    def update_async(self, corpus):
+        """
+        Starts update(corpus) on a background thread unless the index is
+        current or an update is already running. Returns True if one was started.
+        """
+        with self._lock:
+            if self._updating or (corpus.lineage == self.lineage and len(self.signatures) == len(corpus)):
+                return False
+            self._updating = True
+
+        def run():
+            try:
+                self.update(corpus)
+            except Exception as e:
+                print(f"Near-duplicate index update failed: {e}")
+            finally:
+                self._updating = False
+
+        threading.Thread(target=run, name="near-duplicate-index", daemon=True).start()
+        return True
+
+    def lookup(self, text, k=3):
+        """
+        (corpus, matches): up to k (position, similarity) pairs of the indexed
+        posts most similar to `text`, best first, and the corpus their positions
+        refer to (None while nothing is indexed).
+        """
+        signature = self.hasher.signature(text)
+        with self._lock:
+            corpus, signatures, buckets = self.corpus, self.signatures, self._buckets
+        if signature[0] == _EMPTY or not len(signatures):
+            return corpus, []
+        keys = self._band_keys(signature[None, :])[0].tolist()
+        buckets = [buckets[band].get(key, ()) for band, key in enumerate(keys)]
+        if sum(len(bucket) for bucket in buckets) > len(signatures) * BRUTE_FORCE_SHARE:
+            # Collecting huge buckets costs more than comparing with every signature at once
+            scores = similarity(signature, signatures)
+            positions = np.flatnonzero(scores > 0)
+            scores = scores[positions]
+        else:
+            candidates = set()
+            for bucket in buckets:
+                candidates.update(bucket)
+            # Entries appended after the snapshot above are left for the next query
+            positions = np.fromiter((p for p in candidates if p < len(signatures)), dtype=np.int64)
+            scores = similarity(signature, signatures[positions])
+        if not len(positions):
+            return corpus, []
+        best = np.argsort(-scores, kind="stable")[:k]
+        return corpus, [(int(positions[i]), float(scores[i])) for i in best]
+
+    def query(self, text, k=3):
+        """Up to k (position, similarity) pairs of the indexed posts most similar to `text`, best first."""
+        return self.lookup(text, k)[1]
+
+    def max_similarity(self, text):
+        matches = self.query(text, k=1)
+        return matches[0][1] if matches else 0.0
+
+    def clusters(self, threshold=DUPLICATE_THRESHOLD):
+        """
+        Groups of indexed posts that are near duplicates of each other (bulk
+        mode): LSH candidate pairs at or above `threshold`, joined transitively.
+        Returns lists of positions, largest group first.
+        """
+        pairs = set()
+        with self._lock:  # update() appends to the buckets in place
+            signatures = self.signatures
+            for table in self._buckets:
+                for members in table.values():
+                    if len(members) < 2:
+                        continue
+                    if len(members) > MAX_BUCKET_PAIRS:
+                        pairs.update((members[0], other) for other in members[1:])
+                    else:
+                        pairs.update((a, b) for i, a in enumerate(members) for b in members[i + 1:])
+
+        parent = list(range(len(signatures)))
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        if pairs:
+            left, right = np.array(sorted(pairs), dtype=np.int64).T
+            scores = (signatures[left] == signatures[right]).sum(axis=1, dtype=np.int32) / self.hasher.num_perm
+            for a, b in zip(left[scores >= threshold].tolist(), right[scores >= threshold].tolist()):
+                parent[find(a)] = find(b)
+
+        groups = defaultdict(list)
+        for position in range(len(parent)):
+            groups[find(position)].append(position)
+        return sorted((g for g in groups.values() if len(g) > 1), key=len, reverse=True)
+
+def main():
+    import time
+    import pandas as pd
+    from corpus import CorpusStore
+    from data_loader import SNAPSHOT_DIR, SNAPSHOT_NAME
+
+    parser = argparse.ArgumentParser(description="Find clusters of near-duplicate posts in the corpus.")
+    parser.add_argument("--snapshot", default=f"{SNAPSHOT_DIR}/{SNAPSHOT_NAME}.parquet", help="Parquet snapshot to scan")
+    parser.add_argument("--threshold", type=float, default=DUPLICATE_THRESHOLD, help="Estimated Jaccard similarity")
+    parser.add_argument("-o", "--output", help="Write the clusters as JSONL")
+    args = parser.parse_args()
+
+    frame = pd.read_parquet(args.snapshot)
+    index = NearDuplicateIndex()
+    started = time.perf_counter()
+    index.update(CorpusStore.from_frame(frame))
+    built = time.perf_counter() - started
+    clusters = index.clusters(args.threshold)
+    seconds = time.perf_counter() - started - built
+
+    print(f"{len(frame)} posts signed in {built:.2f} s; "
+          f"{len(clusters)} clusters ({sum(len(c) for c in clusters)} posts) found in {seconds:.2f} s")
+    for cluster in clusters[:10]:
+        rows = frame.iloc[cluster]
+        print(f"  {len(cluster)} posts: " + ", ".join(f"{r.get('DentistName', '')} / {r.get('Topic', '')}"
+                                                 for _, r in rows.head(3).iterrows()))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for cluster in clusters:
+                rows = frame.iloc[cluster]
+                f.write(json.dumps({
+                    "size": len(cluster),
+                    "posts": [{"dentist": str(r.get("DentistName", "")), "topic": str(r.get("Topic", "")),
+                               "link": str(r.get("Link", ""))} for _, r in rows.iterrows()],
+                }, ensure_ascii=False) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -1,64 +1,344 @@
+import os
+import re
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from cache import LRUCache
+from metrics import metrics
+from connections import shared_connection, is_not_found
+from typing import Any
+from langchain_core.retrievers import BaseRetriever
+from langchain_community.vectorstores import FAISS
+from embedding_store import CachedEmbeddings
+from lexical_index import BM25Index, reciprocal_rank_fusion
+
 # --- 2. RAG 두뇌 클래스 (멀티 시트 버전) ---
+# 벡터 DB 저장 위치 (재시작 시 여기서 불러오고, 바뀐 행만 다시 임베딩합니다)
+INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "company_brain")
+MANIFEST_NAME = "manifest.json"
+# 시트를 동시에 읽을 최대 개수
+INGEST_WORKERS = 4
+# 임베딩 배치 크기 / 동시에 보낼 배치 수
+EMBED_BATCH_SIZE = 64
+EMBED_CONCURRENCY = 4
+# 답변 캐시 (같은 질문 반복 시 검색/LLM 호출 생략)
+ANSWER_CACHE_SIZE = 256
+ANSWER_CACHE_TTL = 6 * 3600
+# 서비스 계정 키: 환경변수 GCP_SERVICE_ACCOUNT_FILE (JSON 키 파일) 또는 앱과 같은 secrets.toml
+SECRETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".streamlit", "secrets.toml")
+
+def load_service_account():
+    """구글 서비스 계정 키(dict)를 읽습니다. 키 파일 경로가 환경변수에 있으면 그것을 우선합니다."""
+    key_file = os.environ.get("GCP_SERVICE_ACCOUNT_FILE")
+    if key_file:
+        with open(key_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    import toml
+    with open(SECRETS_PATH, "r", encoding="utf-8") as f:
+        return dict(toml.load(f)["gcp_service_account"])
+
+def normalize_query(query):
+    return re.sub(r"\s+", " ", query).strip().strip("?!. ").lower()
+
+class HybridRetriever(BaseRetriever):
+    """CompanyBrain.retrieve 를 langchain 검색기로 감싼 것 (키워드 + 벡터 검색)."""
+
+    brain: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.brain.retrieve(query, self.k)
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
 class CompanyBrain:
-    def __init__(self):
+    def __init__(self, embeddings=None, client=None, llm=None, index_dir=INDEX_DIR):
+        """
+        embeddings / client / llm 을 넘기면 그것을 사용합니다 (테스트용 가짜 객체 등).
+        """
         self.vector_store = None
-        self.llm = ChatGoogleGenerativeAI(model="gemini-pro", temperature=0)
+        if llm is None or embeddings is None:
+            # 구글 SDK는 불러오는 데 시간이 걸려 실제로 필요할 때만 불러옵니다
+            from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+            llm = llm or ChatGoogleGenerativeAI(model="gemini-pro", temperature=0)
+            embeddings = embeddings or GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+        self.llm = llm
+        # 같은 내용은 다시 임베딩하지 않도록 내용 해시별 벡터 캐시를 거칩니다
+        self.embeddings = CachedEmbeddings(
+            embeddings,
+            os.path.join(index_dir, "vectors"),
+            batch_size=EMBED_BATCH_SIZE,
+            max_concurrency=EMBED_CONCURRENCY,
+        )
+        self.client = client
+        self.index_dir = index_dir
+        self.manifest = {}  # 문서 ID "파일명/탭이름/행번호" -> 내용 해시
+        self.load_report = []  # 마지막 동기화의 파일별 소요 시간 / 행 수
+
+        # 인덱스가 다시 만들어질 때마다 버전이 올라가고, 체인과 답변 캐시가 새로 만들어집니다
+        self.index_version = 0
+        self._chain = None
+        self._chain_version = None
+        self.answer_cache = LRUCache(max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+        self._hit_latencies = deque(maxlen=500)
+
+        # 키워드(BM25) 색인: 병원명/시술명 같은 정확한 단어는 임베딩 없이 바로 찾습니다
+        self.lexical = BM25Index()
+        self.lexical_only = 0  # 임베딩 호출 없이 키워드 검색만으로 답한 횟수
+        self._lexical_hashes = {}
+        self._miss_latencies = deque(maxlen=500)
         self.load_db()
 
+    def _get_client(self):
+        if self.client is None:
+            # 구글 시트 접속 (프로세스 전체가 인증된 클라이언트 하나와 연결 풀을 같이 씁니다)
+            self.client = shared_connection(load_service_account()).client()
+        return self.client
+
+    def _read_spreadsheet(self, client, sheet_name):
+        """
+        파일 하나의 모든 탭을 읽어 {문서 ID: 문서 내용} 으로 돌려줍니다.
+        탭 전체를 values_batch_get 한 번으로 읽고, 안 되면 탭별로 나눠 읽습니다.
+        """
+        from gspread.utils import absolute_range_name  # gspread 는 처음 읽을 때만 불러옵니다
+
+        sh = client.open(sheet_name) # 파일 열기
+        worksheets = sh.worksheets()
+        titles = [worksheet.title for worksheet in worksheets]
+
+        try:
+            # 파일 안의 모든 탭(Worksheet)을 한 번의 요청으로 읽기
+            response = sh.values_batch_get([absolute_range_name(t) for t in titles])
+            tab_values = [value_range.get("values", []) for value_range in response["valueRanges"]]
+        except Exception as e:
+            print(f"ℹ️ '{sheet_name}' 일괄 읽기 실패, 탭별로 읽습니다: {e}")
+            with ThreadPoolExecutor(max_workers=INGEST_WORKERS) as pool:
+                tab_values = list(pool.map(lambda worksheet: worksheet.get_all_values(), worksheets))
+
+        documents = {}
+        for title, values in zip(titles, tab_values):
+            if not values:
+                continue
+            headers = values[0]
+            for row_number, row in enumerate(values[1:], start=2):  # 1행은 헤더
+                row = list(row) + [""] * (len(headers) - len(row))
+                # 출처를 명확히 하기 위해 [파일명-탭이름] 형태로 저장
+                content_str = f"[{sheet_name}-{title}] " + " / ".join([f"{k}: {v}" for k, v in zip(headers, row)])
+                documents[f"{sheet_name}/{title}/{row_number}"] = content_str
+        return documents, len(titles)
+
+    def _collect_documents(self, client, target_spreadsheets):
+        """
+        여러 파일을 동시에 읽어 {문서 ID: 문서 내용} 으로 모읍니다.
+        읽기에 성공한 파일 목록도 함께 돌려줍니다 (못 읽은 파일의 문서는 지우지 않기 위해).
+        파일별 소요 시간과 행 수는 self.load_report 에 남습니다.
+        """
+        def read(sheet_name):
+            started = time.time()
+            print(f"📖 '{sheet_name}' 읽는 중...")
+            try:
+                documents, tabs = self._read_spreadsheet(client, sheet_name)
+                return sheet_name, documents, {"spreadsheet": sheet_name, "worksheets": tabs, "rows": len(documents),
+                                               "seconds": round(time.time() - started, 3), "error": None}
+            except Exception as e:
+                # 한 파일의 실패가 다른 파일 읽기를 막지 않도록 여기서 처리
+                if is_not_found(e):
+                    print(f"⚠️ 경고: '{sheet_name}' 파일을 찾을 수 없습니다. (공유가 되어있나요?)")
+                    error = "not found"
+                else:
+                    print(f"⚠️ 경고: '{sheet_name}' 읽기 실패: {e}")
+                    error = str(e)
+            return sheet_name, None, {"spreadsheet": sheet_name, "worksheets": 0, "rows": 0,
+                                      "seconds": round(time.time() - started, 3), "error": error}
+
+        documents = {}
+        loaded_sheets = set()
+        self.load_report = []
+
+        # 파일 목록을 동시에 읽되, 결과는 목록 순서대로 합칩니다
+        with ThreadPoolExecutor(max_workers=INGEST_WORKERS) as pool:
+            for sheet_name, sheet_documents, report in pool.map(read, target_spreadsheets):
+                self.load_report.append(report)
+                if sheet_documents is not None:
+                    documents.update(sheet_documents)
+                    loaded_sheets.add(sheet_name)
+                    print(f"   '{sheet_name}': 탭 {report['worksheets']}개, {report['rows']}행, {report['seconds']}초")
+
+        return documents, loaded_sheets
+
+    def _load_saved_index(self):
+        """디스크에 저장된 벡터 DB와 매니페스트를 불러옵니다."""
+        manifest_path = os.path.join(self.index_dir, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.vector_store = FAISS.load_local(self.index_dir, self.embeddings) if manifest else None
+            self.manifest = manifest
+            print(f"💾 저장된 벡터 DB를 불러왔습니다. ({len(manifest)}개 문서)")
+        except Exception as e:
+            print(f"⚠️ 저장된 벡터 DB를 읽지 못해 새로 만듭니다: {e}")
+            self.vector_store = None
+            self.manifest = {}
+
+    def _save_index(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        if self.vector_store is not None:
+            self.vector_store.save_local(self.index_dir)
+        manifest_path = os.path.join(self.index_dir, MANIFEST_NAME)
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def sync_index(self, documents, loaded_sheets):
+        """
+        벡터 DB를 documents 와 맞춥니다. 새로 생기거나 바뀐 행만 임베딩하고,
+        사라진 행은 지웁니다. (읽기에 실패한 파일의 행은 그대로 둡니다.)
+        반환값: (추가, 삭제) 개수
+        """
+        hashes = {doc_id: content_hash(text) for doc_id, text in documents.items()}
+
+        removed = [doc_id for doc_id, h in self.manifest.items()
+                   if doc_id.split("/", 1)[0] in loaded_sheets and hashes.get(doc_id) != h]
+        added = [doc_id for doc_id, h in hashes.items() if self.manifest.get(doc_id) != h]
+
+        if removed and self.vector_store is not None:
+            self.vector_store.delete(removed)
+        for doc_id in removed:
+            del self.manifest[doc_id]
+
+        if added:
+            texts = [documents[doc_id] for doc_id in added]
+            metadatas = [{"id": doc_id} for doc_id in added]
+            # 벡터화 (임베딩) - 바뀐 행만
+            if self.vector_store is None:
+                self.vector_store = FAISS.from_texts(texts, self.embeddings, metadatas=metadatas, ids=added)
+            else:
+                self.vector_store.add_texts(texts, metadatas=metadatas, ids=added)
+            for doc_id in added:
+                self.manifest[doc_id] = hashes[doc_id]
+
+        if not self.manifest:
+            # 모든 문서가 지워졌으면 빈 인덱스를 남기지 않습니다
+            self.vector_store = None
+        return len(added), len(removed)
+
+    def _bump_index_version(self):
+        self.index_version += 1
+        self.answer_cache.clear()
+        self._sync_lexical_index()
+
+    def _sync_lexical_index(self):
+        """키워드 색인을 벡터 DB와 같은 문서 집합으로 맞춥니다 (바뀐 문서만 반영)."""
+        for doc_id in list(self.lexical.doc_terms):
+            if doc_id not in self.manifest:
+                self.lexical.remove(doc_id)
+        for doc_id, h in self.manifest.items():
+            if self._lexical_hashes.get(doc_id) != h:
+                self.lexical.add(doc_id, self.vector_store.docstore.search(doc_id).page_content)
+        self._lexical_hashes = dict(self.manifest)
+
+    def retrieve(self, query, k=4):
+        """
+        키워드 검색과 벡터 검색 결과를 RRF(reciprocal rank fusion)로 합칩니다.
+        키워드 검색 결과가 확실하면 임베딩 API 호출 없이 바로 돌려줍니다.
+        """
+        lexical, coverage = self.lexical.search(query, k * 2)
+        if self.lexical.is_confident(lexical, coverage):
+            self.lexical_only += 1
+            doc_ids = [doc_id for doc_id, _ in lexical[:k]]
+        else:
+            vector_docs = self.vector_store.similarity_search(query, k=k * 2)
+            doc_ids = reciprocal_rank_fusion([
+                [doc_id for doc_id, _ in lexical],
+                [doc.metadata["id"] for doc in vector_docs if "id" in doc.metadata],
+            ])[:k]
+        return [self.vector_store.docstore.search(doc_id) for doc_id in doc_ids]
+
+    @metrics.timed("brain_load_db")
     def load_db(self):
         """여러 개의 구글 시트 파일을 모두 읽어서 하나의 지식으로 만듭니다."""
         print("📥 통합 지식 DB 동기화 중...")
-        
+
         # ▼▼▼ 여기에 읽고 싶은 시트 이름을 모두 적으세요 ▼▼▼
         TARGET_SPREADSHEETS = ["사내_매뉴얼_DB", "블로그_포스팅_DB", "또_다른_시트_이름"] 
-        
+
         try:
-            # 구글 시트 접속
-            scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(GCP_KEY_DICT, scope)
-            client = gspread.authorize(creds)
-            
-            documents = []
-            
-            # 파일 목록을 하나씩 돌면서 데이터 수집
-            for sheet_name in TARGET_SPREADSHEETS:
-                try:
-                    print(f"📖 '{sheet_name}' 읽는 중...")
-                    sh = client.open(sheet_name) # 파일 열기
-                    
-                    # 파일 안의 모든 탭(Worksheet) 읽기
-                    for worksheet in sh.worksheets():
-                        title = worksheet.title
-                        records = worksheet.get_all_records()
-                        
-                        for row in records:
-                            # 출처를 명확히 하기 위해 [파일명-탭이름] 형태로 저장
-                            content_str = f"[{sheet_name}-{title}] " + " / ".join([f"{k}: {v}" for k, v in row.items()])
-                            documents.append(Document(page_content=content_str))
-                            
-                except gspread.exceptions.SpreadsheetNotFound:
-                    print(f"⚠️ 경고: '{sheet_name}' 파일을 찾을 수 없습니다. (공유가 되어있나요?)")
-                    continue # 다음 파일로 넘어감
+            if self.vector_store is None and not self.manifest:
+                self._load_saved_index()
+
+            documents, loaded_sheets = self._collect_documents(self._get_client(), TARGET_SPREADSHEETS)
 
-            # 벡터화 (임베딩)
-            if documents:
-                embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-                self.vector_store = FAISS.from_documents(documents, embeddings)
-                print(f"✅ 총 {len(documents)}개의 문서를 학습했습니다.")
+            # 목록에서 빠진 파일의 문서는 지웁니다
+            dropped_sheets = {doc_id.split("/", 1)[0] for doc_id in self.manifest} - set(TARGET_SPREADSHEETS)
+            added, removed = self.sync_index(documents, loaded_sheets | dropped_sheets)
+            if added or removed:
+                self._save_index()
+
+            self._bump_index_version()
+
+            if self.manifest:
+                print(f"✅ 총 {len(self.manifest)}개의 문서를 학습했습니다. (새로 임베딩 {added}개, 삭제 {removed}개)")
             else:
                 print("⚠️ 모든 시트에 데이터가 하나도 없습니다.")
 
         except Exception as e:
+            metrics.inc("brain_load_db_errors")
             print(f"❌ DB 로딩 실패: {e}")
 
+    def _get_chain(self):
+        """검색기와 QA 체인은 인덱스 버전마다 한 번만 만듭니다."""
+        if self._chain is None or self._chain_version != self.index_version:
+            from langchain.chains import RetrievalQA  # langchain.chains 는 불러오는 데 몇 초 걸립니다
+
+            self._chain = RetrievalQA.from_chain_type(
+                llm=self.llm,
+                retriever=HybridRetriever(brain=self, k=4),
+                return_source_documents=True
+            )
+            self._chain_version = self.index_version
+        return self._chain
+
+    @metrics.timed("brain_ask")
     def ask(self, query):
         if not self.vector_store:
             return "지식 DB가 비어있거나 로딩되지 않았습니다.", []
-            
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            retriever=self.vector_store.as_retriever(search_kwargs={"k": 4}),
-            return_source_documents=True
-        )
-        result = qa_chain.invoke({"query": query})
-        return result["result"], result["source_documents"]
+
+        started = time.time()
+        # 같은 질문(공백/대소문자 차이 무시)은 인덱스가 바뀌기 전까지 캐시된 답을 씁니다
+        cache_key = (normalize_query(query), self.index_version)
+        cached = self.answer_cache.get(cache_key)
+        if cached is not None:
+            self._hit_latencies.append(time.time() - started)
+            metrics.inc("answer_cache", result="hit")
+            return cached
+        metrics.inc("answer_cache", result="miss")
+
+        result = self._get_chain().invoke({"query": query})
+        answer = (result["result"], result["source_documents"])
+        self.answer_cache.set(cache_key, answer)
+        self._miss_latencies.append(time.time() - started)
+        return answer
+
+    def stats(self):
+        """캐시 적중률과 응답 시간(p50/p95, 초)을 돌려줍니다. 튜닝용."""
+        def percentiles(values):
+            values = sorted(values)
+            if not values:
+                return {"count": 0, "p50": None, "p95": None}
+            return {"count": len(values),
+                    "p50": round(values[len(values) // 2], 4),
+                    "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 4)}
+
+        return {
+            "index_version": self.index_version,
+            "lexical_only": self.lexical_only,
+            "answer_cache": self.answer_cache.stats(),
+            "query_embedding_cache": self.embeddings.query_cache.stats(),
+            "latency_hit": percentiles(self._hit_latencies),
+            "latency_miss": percentiles(self._miss_latencies),
+        }
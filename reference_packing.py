@@ -0,0 +1,121 @@
+import re
+import statistics
+
+# Token budget for the whole reference block in the prompt
+DEFAULT_TOKEN_BUDGET = 2000
+# Never give a reference less than this; use fewer references instead
+MIN_TOKENS_PER_REFERENCE = 200
+MAX_REFERENCES = 5
+
+_encoding = None
+
+def count_tokens(text):
+    """
+    Counts tokens with tiktoken (cl100k_base). Gemini uses its own tokenizer,
+    so this is an estimate, but it is local and consistent across requests.
+    Falls back to the character count if tiktoken is not installed or cannot
+    fetch its encoding file (it is downloaded on first use).
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"tiktoken unavailable, estimating tokens by characters: {e}")
+            _encoding = False
+    if _encoding is False:
+        return len(text)
+    return len(_encoding.encode(text, disallowed_special=()))
+
+def split_paragraphs(text):
+    return [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+def excerpt(text, max_tokens, counter=count_tokens):
+    """
+    Trims a post to its most style-representative paragraphs within max_tokens.
+    The opening and closing paragraphs carry most of the author's voice
+    (greeting, sign-off), then paragraphs of typical length are preferred over
+    outliers like long lists. Kept paragraphs stay in their original order.
+    """
+    paragraphs = split_paragraphs(text)
+    if not paragraphs:
+        return ""
+    tokens = [counter(p) for p in paragraphs]
+    median = statistics.median(tokens)
+
+    order = [0, len(paragraphs) - 1] if len(paragraphs) > 1 else [0]
+    order += sorted(range(1, len(paragraphs) - 1), key=lambda i: abs(tokens[i] - median))
+
+    # Each kept paragraph may also cost a "(...)" gap marker
+    gap_cost = counter("\n\n(...)\n\n")
+    kept = set()
+    used = 0
+    for i in order:
+        if used + tokens[i] + gap_cost <= max_tokens:
+            kept.add(i)
+            used += tokens[i] + gap_cost
+
+    if not kept:
+        # Even a single paragraph is too long: cut the first one proportionally,
+        # at a line boundary when there is one
+        head = paragraphs[0][:int(len(paragraphs[0]) * max_tokens / tokens[0])]
+        if "\n" in head:
+            head = head[:head.rfind("\n")]
+        return head
+
+    parts = []
+    for i in range(len(paragraphs)):
+        if i in kept:
+            parts.append(paragraphs[i])
+        elif parts and parts[-1] != "(...)":
+            parts.append("(...)")
+    return "\n\n".join(parts)
+
+def pack_references(candidates, budget=DEFAULT_TOKEN_BUDGET, max_references=MAX_REFERENCES, counter=count_tokens,
+                    shortest_first=False):
+    """
+    Fits reference posts into a token budget.
+    Candidates are taken in the caller's order (best first, e.g. by relevance);
+    posts over their share of the budget are excerpted. With shortest_first
+    (candidates in no particular order), shorter posts are taken first, so the
+    prompt gets more (short) style samples rather than fewer long ones.
+    Returns (references, report) where report has the budget and actual token counts.
+    """
+    sized = [(counter(c), c) for c in candidates if c and c.strip()]
+    if shortest_first:
+        sized.sort(key=lambda x: x[0])
+
+    chosen = []
+    for size, text in sized:
+        if len(chosen) == max_references or budget / (len(chosen) + 1) < MIN_TOKENS_PER_REFERENCE:
+            break
+        chosen.append((size, text))
+
+    # Budget shares are handed out shortest first, so what short posts leave over goes
+    # to the long ones; the references themselves keep the order chosen above
+    fitted = [None] * len(chosen)
+    remaining = budget
+    for i, j in enumerate(sorted(range(len(chosen)), key=lambda j: chosen[j][0])):
+        size, text = chosen[j]
+        allowance = remaining // (len(chosen) - i)
+        if size > allowance:
+            text = excerpt(text, allowance, counter)
+            size = counter(text)
+            if not text:
+                continue
+        fitted[j] = (size, text)
+        remaining -= size
+
+    fitted = [f for f in fitted if f is not None]
+    references = [text for _, text in fitted]
+    reference_tokens = [size for size, _ in fitted]
+
+    report = {
+        "budget": budget,
+        "candidates": len(candidates),
+        "candidate_tokens": sum(size for size, _ in sized),
+        "reference_tokens": reference_tokens,
+        "tokens": sum(reference_tokens),
+    }
+    return references, report
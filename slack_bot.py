@@ -0,0 +1,168 @@
+"""
+Slack serving layer for CompanyBrain.
+
+Mention the bot in a channel and it answers in the thread: the question is
+acknowledged right away, and the answer replaces the acknowledgement when
+it is ready. Blocking CompanyBrain.ask calls run on a bounded worker pool,
+so one slow answer does not stall other users.
+
+Usage:
+    SLACK_BOT_TOKEN=xoxb-... SLACK_APP_TOKEN=xapp-... python slack_bot.py
+"""
+import os
+import re
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from rag_bot import CompanyBrain, normalize_query
+
+# Concurrent CompanyBrain.ask calls (retrieval + LLM)
+MAX_WORKERS = 4
+# Questions a single channel may have waiting before new ones are turned away
+MAX_PENDING_PER_CHANNEL = 20
+
+class ChannelBusy(Exception):
+    """Raised when a channel already has too many questions waiting."""
+
+class BrainService:
+    """
+    Runs CompanyBrain.ask off the event loop with:
+    - a bounded worker pool (`max_workers` threads),
+    - coalescing: identical questions already in flight share one answer,
+    - per-channel fairness: channels take turns (round robin), so one busy
+      channel cannot starve the others.
+    """
+
+    def __init__(self, brain, max_workers=MAX_WORKERS, max_pending_per_channel=MAX_PENDING_PER_CHANNEL):
+        self.brain = brain
+        self.max_workers = max_workers
+        self.max_pending_per_channel = max_pending_per_channel
+        self.coalesced = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._queues = {}          # channel -> deque of (question, future)
+        self._ready = deque()      # channels with waiting questions, in turn order
+        self._inflight = {}        # normalized question -> future
+        self._wakeup = None
+        self._workers = []
+
+    async def start(self):
+        self._wakeup = asyncio.Condition()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_workers)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._executor.shutdown(wait=False)
+
+    async def ask(self, channel, question):
+        """Returns (answer, source_documents) for the question."""
+        key = normalize_query(question)
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        queue = self._queues.setdefault(channel, deque())
+        if len(queue) >= self.max_pending_per_channel:
+            raise ChannelBusy(channel)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        queue.append((question, future))
+        async with self._wakeup:
+            if channel not in self._ready:
+                self._ready.append(channel)
+            self._wakeup.notify()
+        return await asyncio.shield(future)
+
+    async def _next_job(self):
+        async with self._wakeup:
+            await self._wakeup.wait_for(lambda: self._ready)
+            channel = self._ready.popleft()
+            queue = self._queues[channel]
+            job = queue.popleft()
+            if queue:
+                self._ready.append(channel)  # Back of the line
+            else:
+                del self._queues[channel]
+            return job
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            question, future = await self._next_job()
+            try:
+                result = await loop.run_in_executor(self._executor, self.brain.ask, question)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+def format_answer(answer, sources):
+    text = answer
+    if sources:
+        # "[파일명-탭이름] ..." 형태의 출처만 짧게 표시
+        origins = []
+        for doc in sources:
+            match = re.match(r"\[([^\]]+)\]", doc.page_content)
+            origin = match.group(1) if match else doc.page_content[:30]
+            if origin not in origins:
+                origins.append(origin)
+        text += "\n\n📚 출처: " + ", ".join(origins)
+    return text
+
+async def handle_mention(service, event, client):
+    """
+    Handles one app_mention event: acknowledges in the thread immediately,
+    then replaces the acknowledgement with the answer. `client` only needs
+    async chat_postMessage / chat_update, so a local mock works for testing.
+    """
+    channel = event["channel"]
+    thread_ts = event.get("thread_ts") or event["ts"]
+    question = re.sub(r"<@[^>]+>", "", event.get("text", "")).strip()
+    if not question:
+        await client.chat_postMessage(channel=channel, thread_ts=thread_ts, text="질문을 함께 적어주세요 🙂")
+        return
+
+    ack = await client.chat_postMessage(channel=channel, thread_ts=thread_ts, text="🔎 확인 중입니다...")
+    try:
+        answer, sources = await service.ask(channel, question)
+        text = format_answer(answer, sources)
+    except ChannelBusy:
+        text = "⏳ 이 채널에 대기 중인 질문이 너무 많습니다. 잠시 후 다시 물어봐 주세요."
+    except Exception as e:
+        print(f"❌ 답변 실패: {e}")
+        text = "❌ 답변을 만드는 중 오류가 발생했습니다. 잠시 후 다시 시도해주세요."
+    await client.chat_update(channel=channel, ts=ack["ts"], text=text)
+
+def create_app(service, token=None):
+    from slack_bolt.async_app import AsyncApp
+
+    app = AsyncApp(token=token or os.environ["SLACK_BOT_TOKEN"])
+
+    @app.event("app_mention")
+    async def on_mention(event, client):
+        # Bolt acknowledges the event to Slack before this listener runs
+        await handle_mention(service, event, client)
+
+    return app
+
+async def main():
+    from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+
+    brain = CompanyBrain()
+    service = BrainService(brain)
+    await service.start()
+    app = create_app(service)
+    try:
+        await AsyncSocketModeHandler(app, os.environ["SLACK_APP_TOKEN"]).start_async()
+    finally:
+        await service.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,151 @@
+"""
+Per-dentist writing style profiles.
+
+Instead of asking the model to analyse the raw reference posts on every
+request, the statistics it was told to extract (line length, paragraph
+rhythm, emoji use, sentence endings, connectives, signature phrases) are
+computed here once per dentist with vectorized pandas string operations and
+rendered into a short profile for the prompt. Profiles are updated
+incrementally: when rows are appended to the corpus, only the new posts of a
+dentist are analysed and merged into the running totals.
+"""
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# Sentence endings, most specific first
+ENDINGS = [
+    ("~습니다/입니다", ("니다",)),
+    ("~까요?/나요?", ("까요", "나요", "가요")),
+    ("~죠", ("죠", "지요")),
+    ("~네요", ("네요",)),
+    ("~에요/예요", ("에요", "예요")),
+    ("~요", ("요",)),
+    ("~다", ("다",)),
+]
+CONNECTIVES = ["그래서", "하지만", "그런데", "그리고", "또한", "특히", "물론", "즉", "따라서", "게다가", "무엇보다", "사실"]
+
+# Last Hangul word of a sentence: followed by sentence punctuation or the end of a line
+_SENTENCE_END = r"[가-힣]+(?=[.!?~]+|[^\S\n]*(?:\n|$))"
+_EMOJI = "[\U0001F300-\U0001FAFF\u2600-\u27BF]"
+_CONNECTIVE = r"(?:^|\s)(" + "|".join(CONNECTIVES) + r")(?=[\s,])"
+# Signature phrases are looked for in the opening and closing paragraphs (greeting, sign-off)
+PHRASE_MIN_SHARE = 0.3
+TOP_N = 5
+
+def _ending_bucket(words):
+    conditions = [words.str.endswith(suffixes) for _, suffixes in ENDINGS]
+    return pd.Series(np.select(conditions, [name for name, _ in ENDINGS], default=""), index=words.index)
+
+def _phrases(text):
+    """Distinct two-word phrases of the first and last paragraph of a post."""
+    paragraphs = [p for p in re.split(r"\n\s*\n", text) if p.strip()]
+    phrases = set()
+    for paragraph in paragraphs[:1] + paragraphs[-1:]:
+        words = re.findall(r"[0-9A-Za-z가-힣]+", paragraph)
+        phrases.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return phrases
+
+def post_stats(texts):
+    """Summable statistics of a batch of posts (one dentist)."""
+    posts = pd.Series(list(texts), dtype=object).fillna("")
+    lines = posts.str.split("\n").explode().str.strip()
+    lines = lines[lines.str.len() > 0]
+    words = posts.str.findall(_SENTENCE_END, flags=re.M).explode().dropna()
+    buckets = _ending_bucket(words.astype(str))
+
+    phrases = Counter()
+    for text in posts:
+        phrases.update(_phrases(text))
+
+    return {
+        "posts": len(posts),
+        "chars": int(posts.str.len().sum()),
+        "lines": len(lines),
+        "line_chars": int(lines.str.len().sum()),
+        "paragraphs": int((posts.str.count(r"\n\s*\n") + (posts.str.strip().str.len() > 0)).sum()),
+        "emoji": Counter(posts.str.findall(_EMOJI).explode().dropna().tolist()),
+        "endings": Counter(buckets[buckets != ""].tolist()),
+        "connectives": Counter(posts.str.findall(_CONNECTIVE).explode().dropna().tolist()),
+        "phrases": phrases,
+    }
+
+def merge_stats(total, stats):
+    if total is None:
+        return stats
+    merged = {}
+    for key, value in stats.items():
+        merged[key] = total[key] + value  # ints add, Counters merge
+    return merged
+
+def summarize(stats):
+    """Compact profile (plain dict) from accumulated statistics."""
+    posts = stats["posts"]
+    endings_total = sum(stats["endings"].values())
+    min_posts = max(2, int(posts * PHRASE_MIN_SHARE))
+    return {
+        "posts": posts,
+        "avg_line_chars": round(stats["line_chars"] / stats["lines"], 1) if stats["lines"] else 0,
+        "lines_per_paragraph": round(stats["lines"] / stats["paragraphs"], 1) if stats["paragraphs"] else 0,
+        "emoji_per_1k_chars": round(sum(stats["emoji"].values()) / stats["chars"] * 1000, 2) if stats["chars"] else 0,
+        "top_emoji": [e for e, _ in stats["emoji"].most_common(TOP_N)],
+        "endings": {name: round(count / endings_total * 100) for name, count in stats["endings"].most_common(TOP_N)}
+        if endings_total else {},
+        "connectives": [c for c, _ in stats["connectives"].most_common(TOP_N)],
+        "phrases": [p for p, n in stats["phrases"].most_common(TOP_N) if n >= min_posts],
+    }
+
+def format_profile(profile):
+    """Renders a profile as the prompt block that replaces the model's own style analysis."""
+    lines = [f"- 분석한 글: {profile['posts']}편"]
+    lines.append(f"- 한 줄 평균 {profile['avg_line_chars']}자, 문단당 평균 {profile['lines_per_paragraph']}줄")
+    if profile["endings"]:
+        lines.append("- 종결 어미 비율: " + ", ".join(f"{name} {pct}%" for name, pct in profile["endings"].items()))
+    emoji = f"- 이모지: 1000자당 {profile['emoji_per_1k_chars']}개"
+    if profile["top_emoji"]:
+        emoji += " (자주 쓰는 이모지: " + " ".join(profile["top_emoji"]) + ")"
+    lines.append(emoji)
+    if profile["connectives"]:
+        lines.append("- 자주 쓰는 접속사: " + ", ".join(profile["connectives"]))
+    if profile["phrases"]:
+        lines.append("- 인사말/맺음말에 반복되는 표현: " + ", ".join(f"'{p}'" for p in profile["phrases"]))
+    return "\n".join(lines)
+
+class StyleProfiles:
+    """
+    Process-wide profile store. Statistics are accumulated per dentist and
+    only posts past the last analysed row are processed, so appended rows
+    update a profile incrementally. A different corpus lineage (full reload)
+    starts over.
+    """
+
+    def __init__(self):
+        self.lineage = None
+        self._stats = {}     # dentist -> (accumulated stats, last analysed position)
+        self._profiles = {}  # dentist -> summarized profile
+        self._lock = threading.Lock()
+
+    def profile_for(self, index, dentist_name):
+        """Profile of a dentist over `index` (a DentistIndex), or None without posts."""
+        corpus = index.corpus
+        positions = np.asarray(index.rows_for(dentist_name), dtype=np.int64)
+        with self._lock:
+            if corpus.lineage != self.lineage:
+                self.lineage = corpus.lineage
+                self._stats.clear()
+                self._profiles.clear()
+
+            stats, last = self._stats.get(dentist_name, (None, -1))
+            new = positions[positions > last]
+            if len(new):
+                stats = merge_stats(stats, post_stats(corpus.contents(new)))
+                self._stats[dentist_name] = (stats, int(new.max()))
+                self._profiles.pop(dentist_name, None)
+            if stats is None:
+                return None
+            if dentist_name not in self._profiles:
+                self._profiles[dentist_name] = summarize(stats)
+            return self._profiles[dentist_name]
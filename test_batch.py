@@ -0,0 +1,89 @@
+"""
+Tests for batch.run_batch with a stub generate function (no model calls).
+
+    python -m pytest -q test_batch.py
+"""
+import json
+import threading
+
+import batch
+from batch import read_jobs, run_batch
+
+class HttpError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+class FlakyGenerate:
+    """Fails each job's first `failures[id]` attempts with `error`, then returns a post."""
+
+    def __init__(self, failures=None, error=None):
+        self.failures = dict(failures or {})
+        self.error = error or HttpError("429 Resource has been exhausted", 429)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, job):
+        with self._lock:
+            self.calls.append(job["id"])
+            if self.failures.get(job["id"], 0) > 0:
+                self.failures[job["id"]] -= 1
+                raise self.error
+        return f"{job['topic']} 글", ["참고"], {"tokens": 1}
+
+def write_jobs(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(json.dumps({"id": f"job{i}", "dentist": "행복치과", "topic": f"주제 {i}", "keyword": "임플란트"},
+                               ensure_ascii=False) + "\n")
+    return read_jobs(str(path))
+
+def read_results(path):
+    """Result lines of the output file, skipping the ones cut off by a crash."""
+    results = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                results.append(json.loads(line))
+            except ValueError:
+                pass
+    return results
+
+def test_a_rerun_skips_jobs_that_already_succeeded(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch.time, "sleep", lambda seconds: None)
+    jobs = write_jobs(tmp_path / "jobs.jsonl", 4)
+    output = tmp_path / "results.jsonl"
+
+    first = FlakyGenerate({"job1": 10}, error=ValueError("bad prompt"))
+    summary = run_batch(jobs, str(output), workers=2, generate=first)
+    assert summary == {"total": 4, "skipped": 0, "ok": 3, "failed": 1}
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"id": "job2", "content": "잘린')  # Line cut off by a crash
+
+    second = FlakyGenerate()
+    summary = run_batch(jobs, str(output), workers=2, generate=second)
+    assert summary == {"total": 4, "skipped": 3, "ok": 1, "failed": 0}
+    assert second.calls == ["job1"]
+    results = [r for r in read_results(output) if not r["error"]]
+    assert sorted(r["id"] for r in results) == ["job0", "job1", "job2", "job3"]
+
+def test_rate_limit_errors_are_retried_and_others_are_not(tmp_path, monkeypatch):
+    slept = []
+    monkeypatch.setattr(batch.time, "sleep", slept.append)
+    jobs = write_jobs(tmp_path / "jobs.jsonl", 2)
+
+    generate = FlakyGenerate({"job0": 2})
+    summary = run_batch(jobs, str(tmp_path / "out.jsonl"), workers=1, retries=3, generate=generate)
+    assert summary["ok"] == 2 and generate.calls.count("job0") == 3
+    assert len(slept) == 2 and slept[1] > slept[0]  # Exponential backoff
+
+    exhausted = FlakyGenerate({"job0": 10})
+    summary = run_batch(jobs, str(tmp_path / "exhausted.jsonl"), workers=1, retries=2, generate=exhausted)
+    assert summary["failed"] == 1 and exhausted.calls.count("job0") == 3
+    failed = [r for r in read_results(tmp_path / "exhausted.jsonl") if r["error"]]
+    assert failed[0]["id"] == "job0" and "429" in failed[0]["error"]
+
+    # A number in the message is not a status code
+    not_retryable = FlakyGenerate({"job0": 10}, error=HttpError("prompt has 5000 tokens", 400))
+    run_batch(jobs, str(tmp_path / "invalid.jsonl"), workers=1, retries=3, generate=not_retryable)
+    assert not_retryable.calls.count("job0") == 1
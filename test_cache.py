@@ -0,0 +1,66 @@
+"""
+Tests for the in-memory and SQLite caches (TTL expiry and eviction).
+
+    python -m pytest -q test_cache.py
+"""
+import cache
+from cache import LRUCache, SQLiteCache, TieredCache
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_lru_cache_evicts_least_recently_used():
+    lru = LRUCache(max_entries=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1  # "b" is now the least recently used
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+    assert lru.stats() == {"hits": 3, "misses": 1, "size": 2}
+
+def test_lru_cache_expires_entries(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    lru = LRUCache(ttl=60)
+    lru.set("a", 1)
+    clock.now += 59
+    assert lru.get("a") == 1
+    clock.now += 2
+    assert lru.get("a") is None
+    assert lru.stats()["size"] == 0
+
+def test_sqlite_cache_expires_entries(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    disk = SQLiteCache(str(tmp_path / "cache.sqlite"), ttl=60)
+    disk.set("a", {"text": "글"})
+    assert disk.get("a") == {"text": "글"}
+    clock.now += 61
+    assert disk.get("a") is None
+    assert disk.stats()["size"] == 0
+
+def test_sqlite_cache_evicts_least_recently_used_over_max_bytes(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    value = "x" * 100
+    disk = SQLiteCache(str(tmp_path / "cache.sqlite"), max_bytes=250)
+    for key in ("a", "b"):
+        disk.set(key, value)
+        clock.now += 1
+    disk.get("a")  # "b" is now the least recently used
+    clock.now += 1
+    disk.set("c", value)
+    assert disk.get("b") is None
+    assert disk.get("a") == value and disk.get("c") == value
+
+def test_tiered_cache_promotes_disk_hits_to_memory(tmp_path):
+    disk = SQLiteCache(str(tmp_path / "cache.sqlite"))
+    disk.set("a", {"text": "글"})
+    tiered = TieredCache(LRUCache(), disk)
+    assert tiered.get("a") == {"text": "글"}
+    assert tiered.memory.get("a") == {"text": "글"}
@@ -0,0 +1,57 @@
+"""
+Tests for the 의료법 scanner and the paragraph-level compliance fix.
+
+    python -m pytest -q test_compliance.py
+"""
+import re
+
+import fakes
+from compliance import scan, audit_corpus
+from generator import fix_compliance
+
+def test_scan_reports_terms_with_their_paragraph():
+    violations = scan("첫 문단입니다.\n\n재발없음을 약속합니다.")
+    assert [(v["term"], v["category"], v["paragraph"]) for v in violations] == [
+        ("재발 없음", "banned", 1), ("약속합니다", "banned", 1)]
+    assert violations[0]["match"] == "재발없음"  # Spaces inside a term are optional
+
+def test_audit_corpus_counts_flagged_posts():
+    report = audit_corpus(["최고의 치과", "괜찮은 글", "타 치과와 달리 최고"])
+    assert report["flagged"] == 2
+    assert report["by_term"] == {"최고": 2, "타 치과": 1}
+
+class RewriteModel:
+    """Answers the compliance rewrite prompt with a fixed text per paragraph number."""
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt, stream=False):
+        self.prompts.append(prompt)
+        numbers = re.findall(r"^\[P(\d+)\]", prompt, flags=re.M)
+        return fakes.FakeChunk("\n\n".join(f"[P{n}]\n고친 문단 {n}입니다." for n in numbers))
+
+def test_fix_compliance_splices_only_offending_paragraphs():
+    text = "제목\n\n평범한 첫 문단입니다.\n\n저희는 최고의 치과입니다.\n\n중간 문단입니다.\n\n다른 치과보다 저렴합니다."
+    model = RewriteModel()
+    fixed, report = fix_compliance(text, model)
+
+    assert len(model.prompts) == 1  # Every offending paragraph in one call
+    assert fixed == "제목\n\n평범한 첫 문단입니다.\n\n고친 문단 3입니다.\n\n중간 문단입니다.\n\n고친 문단 5입니다."
+    assert report["rewritten"] == 2 and report["remaining"] == []
+
+def test_fix_compliance_strips_markdown_without_calling_the_model():
+    model = RewriteModel()
+    fixed, report = fix_compliance("## 제목\n\n**중요한** 내용입니다.", model)
+    assert fixed == "제목\n\n중요한 내용입니다."
+    assert model.prompts == [] and report["remaining"] == []
+
+def test_fix_compliance_keeps_the_post_when_the_rewrite_fails():
+    class FailingModel:
+        def generate_content(self, prompt, stream=False):
+            raise RuntimeError("429")
+
+    text = "최고의 치과입니다.\n\n괜찮은 문단"
+    fixed, report = fix_compliance(text, FailingModel())
+    assert fixed == text
+    assert report["remaining"] == ["최고"] and report["error"] == "429"
@@ -0,0 +1,150 @@
+"""
+Tests for the incremental sheet sync and the shared sync state, using the fake worksheet
+instead of Google.
+
+    python -m pytest -q test_data_loader.py
+"""
+import os
+import types
+import threading
+
+import pytest
+
+import fakes
+import data_loader
+
+# ---- data_loader.sync_sheet ----
+
+def test_sync_sheet_appends_new_rows_incrementally():
+    rows = fakes.make_corpus(30, dentists=5)
+    state = data_loader.SheetSyncState()
+    assert data_loader.sync_sheet(fakes.FakeWorksheet(rows[:21]), state) == "full"
+    corpus, version = state.corpus, state.version
+
+    assert data_loader.sync_sheet(fakes.FakeWorksheet(rows), state) == "incremental"
+    assert state.row_count == 30 and len(state.frame) == 30 and len(state.corpus) == 30
+    assert state.version == version + 1
+    assert state.corpus.lineage == corpus.lineage  # Derived data can be extended
+    assert state.corpus.content(29) == rows[30][5]
+
+    assert data_loader.sync_sheet(fakes.FakeWorksheet(rows), state) == "unchanged"
+    assert state.version == version + 1
+
+def test_sync_sheet_reloads_when_the_anchor_row_changed():
+    rows = fakes.make_corpus(20, dentists=5)
+    state = data_loader.SheetSyncState()
+    data_loader.sync_sheet(fakes.FakeWorksheet(rows), state)
+    lineage = state.corpus.lineage
+
+    # The last synced row was deleted: the rows before it can no longer be trusted
+    assert data_loader.sync_sheet(fakes.FakeWorksheet(rows[:-1]), state) == "full"
+    assert state.row_count == 19 and len(state.corpus) == 19
+    assert state.corpus.lineage != lineage
+
+def test_sync_sheet_reloads_when_the_header_changed():
+    rows = fakes.make_corpus(10, dentists=5)
+    state = data_loader.SheetSyncState()
+    data_loader.sync_sheet(fakes.FakeWorksheet(rows), state)
+
+    renamed = [rows[0][:-1] + ["본문"]] + rows[1:]
+    assert data_loader.sync_sheet(fakes.FakeWorksheet(renamed), state) == "full"
+    assert state.headers == renamed[0]
+
+def test_full_reload_keeps_the_corpus_when_rows_are_unchanged():
+    rows = fakes.make_corpus(20, dentists=5)
+    state = data_loader.SheetSyncState()
+    data_loader.sync_sheet(fakes.FakeWorksheet(rows[:15]), state)
+    data_loader.sync_sheet(fakes.FakeWorksheet(rows), state)
+    corpus, version = state.corpus, state.version
+
+    state.full_synced_at = 0  # Due for the periodic full reload
+    assert data_loader.sync_sheet(fakes.FakeWorksheet(rows), state) == "unchanged"
+    assert state.corpus is corpus and state.version == version
+    assert state.full_synced_at > 0
+
+    # An edit in the middle is only seen by the full reload
+    edited = [list(row) for row in rows]
+    edited[5][5] += " 수정"
+    state.full_synced_at = 0
+    assert data_loader.sync_sheet(fakes.FakeWorksheet(edited), state) == "full"
+    assert state.version == version + 1
+    assert state.corpus.content(4) == edited[5][5]
+
+def test_snapshot_round_trip_keeps_the_row_checksums(tmp_path):
+    rows = fakes.make_corpus(10, dentists=5)
+    state = data_loader.SheetSyncState()
+    data_loader.sync_sheet(fakes.FakeWorksheet(rows), state)
+    data_loader.save_snapshot(state, str(tmp_path))
+
+    loaded = data_loader.SheetSyncState()
+    assert data_loader.load_snapshot(loaded, str(tmp_path))
+    assert list(loaded.frame.columns) == list(state.frame.columns)
+    loaded.full_synced_at = 0
+    assert data_loader.sync_sheet(fakes.FakeWorksheet(rows), loaded) == "unchanged"
+
+# ---- refresh_data / load_data ----
+
+def run_in_threads(target, count):
+    errors = []
+
+    def run():
+        try:
+            target()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+def test_concurrent_refreshes_do_not_collide_on_the_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, "SNAPSHOT_DIR", str(tmp_path))
+    rows = fakes.make_corpus(50, dentists=5)
+    for _ in range(10):
+        state = data_loader.SheetSyncState()
+        sheet = fakes.FakeWorksheet(rows, latency=0.01)
+        errors = run_in_threads(lambda: data_loader.refresh_data(state, open_sheet=lambda: sheet), 3)
+        assert errors == [] and not state.offline
+        assert state.row_count == 50 and len(state.corpus) == 50
+    assert sorted(os.listdir(tmp_path)) == ["blog_posts.json", "blog_posts.parquet"]  # No temp files left
+
+    loaded = data_loader.SheetSyncState()
+    assert data_loader.load_snapshot(loaded)
+    assert loaded.row_count == 50
+
+def test_first_load_is_done_once_for_concurrent_sessions(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, "SNAPSHOT_DIR", str(tmp_path))
+    state = data_loader.SheetSyncState()
+    sheet = fakes.FakeWorksheet(fakes.make_corpus(50, dentists=5), latency=0.05)
+    monkeypatch.setattr(data_loader, "_get_sync_state", lambda: state)
+    monkeypatch.setattr(data_loader, "_open_sheet", lambda: sheet)
+    monkeypatch.setattr(data_loader, "st", types.SimpleNamespace(secrets={"gcp_service_account": {}}, error=print))
+
+    frames = []
+    errors = run_in_threads(lambda: frames.append(data_loader.load_data()), 4)
+    assert errors == []
+    assert sheet.calls == 1  # One full read; the other sessions waited for it
+    assert [len(frame) for frame in frames] == [50] * 4
+
+def test_failed_refresh_backs_off_before_the_next_attempt(monkeypatch):
+    state = data_loader.SheetSyncState()
+    data_loader.sync_sheet(fakes.FakeWorksheet(fakes.make_corpus(5, dentists=2)), state)
+    started = []
+    monkeypatch.setattr(data_loader, "_get_sync_state", lambda: state)
+    monkeypatch.setattr(data_loader, "_start_background_refresh", started.append)
+    monkeypatch.setattr(data_loader, "st", types.SimpleNamespace(secrets={"gcp_service_account": {}}, error=print))
+
+    def unreachable():
+        raise ConnectionError("offline")
+
+    with pytest.raises(ConnectionError):
+        data_loader.refresh_data(state, open_sheet=unreachable)
+    assert state.offline
+    data_loader.load_data()
+    assert started == []  # Stale, but the last attempt was just now
+    state.attempted_at -= data_loader.RETRY_SECONDS + 1
+    data_loader.load_data()
+    assert started == [state]
@@ -0,0 +1,51 @@
+"""
+Tests for the streaming generation path with a fake Gemini model.
+
+    python -m pytest -q test_generator.py
+"""
+import fakes
+import generator
+from cache import LRUCache
+from data_loader import DentistIndex, build_dataframe
+
+DENTIST = "행복0치과"
+
+def use_corpus(monkeypatch, posts=40):
+    rows = fakes.make_corpus(posts, dentists=3)
+    index = DentistIndex(build_dataframe(rows[0], rows[1:]), version=1)
+    monkeypatch.setattr(generator, "get_dentist_index", lambda: index)
+    monkeypatch.setattr(generator, "STYLE_PROFILE_MODE", "off")
+    return index
+
+def test_stream_yields_chunks_and_keeps_the_references(monkeypatch):
+    use_corpus(monkeypatch)
+    model = fakes.FakeModel(latency=0.05, chunks=6)
+    cache = LRUCache()
+    stream = generator.stream_blog_post(DENTIST, "임플란트", "임플란트 관리", model=model, cache=cache)
+    assert stream.references and stream.error is None  # Known before the first chunk
+
+    chunks = list(stream)
+    assert len(chunks) == 6 and stream.text == "".join(chunks)
+    assert stream.info["output_tokens"] == len(stream.text)  # Usage comes with the last chunk
+    assert model.calls == 1
+
+    # The finished post is cached and streamed again in one piece
+    again = generator.stream_blog_post(DENTIST, "임플란트", "임플란트 관리", model=model, cache=cache)
+    assert again.cached and list(again) == [stream.text] and model.calls == 1
+
+    fresh = generator.stream_blog_post(DENTIST, "임플란트", "임플란트 관리", model=model, cache=cache, fresh=True)
+    assert not fresh.cached and "".join(fresh) == fresh.text and model.calls == 2
+
+def test_a_failing_stream_records_the_error_and_caches_nothing(monkeypatch):
+    use_corpus(monkeypatch)
+
+    class BrokenModel(fakes.FakeModel):
+        def _stream(self, delay, text, usage):
+            yield fakes.FakeChunk(text[:10], None)
+            raise RuntimeError("connection reset")
+
+    monkeypatch.setattr(generator.st, "error", lambda message: None)
+    cache = LRUCache()
+    stream = generator.stream_blog_post(DENTIST, "스케일링", "스케일링", model=BrokenModel(latency=0), cache=cache)
+    assert len(list(stream)) == 1
+    assert isinstance(stream.error, RuntimeError) and not cache._data
@@ -0,0 +1,103 @@
+"""
+Tests for the background generation queue and its per-session limits.
+
+    python -m pytest -q test_jobs.py
+"""
+import time
+import threading
+
+import pytest
+
+from jobs import JobQueue, JobLimitError, DONE, FAILED
+
+class BlockingGenerate:
+    """generate function whose jobs run until release() is called."""
+
+    def __init__(self):
+        self.release_event = threading.Event()
+
+    def __call__(self, job):
+        self.release_event.wait(5)
+        return "글", [], {}
+
+    def release(self):
+        self.release_event.set()
+
+def wait_done(queue, job_id, session):
+    deadline = time.time() + 5
+    while not queue.get(job_id, session).done:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    return queue.get(job_id, session)
+
+def test_job_queue_limits_active_jobs_per_session():
+    generate = BlockingGenerate()
+    queue = JobQueue(generate, workers=1, max_active=2)
+    try:
+        first = queue.submit("s1", {})
+        queue.submit("s1", {})
+        with pytest.raises(JobLimitError) as error:
+            queue.submit("s1", {})
+        assert error.value.reason == "active"
+        queue.submit("s2", {})  # Other sessions are not affected
+
+        generate.release()
+        job = wait_done(queue, first, "s1")
+        assert job.status == DONE and job.text == "글" and job.finished_at is not None
+        assert queue.get(first, "s2") is None  # Jobs are only visible to their session
+        assert queue.owner(first) == "s1" and queue.owner("unknown") is None and queue.owner(None) is None
+    finally:
+        generate.release()
+        queue.shutdown()
+
+def test_job_queue_limits_jobs_per_hour():
+    queue = JobQueue(lambda job: ("글", [], {}), max_per_hour=2)
+    try:
+        for _ in range(2):
+            wait_done(queue, queue.submit("s1", {}), "s1")
+        with pytest.raises(JobLimitError) as error:
+            queue.submit("s1", {})
+        assert error.value.reason == "rate"
+    finally:
+        queue.shutdown()
+
+def test_job_queue_refuses_jobs_when_the_queue_is_full():
+    generate = BlockingGenerate()
+    queue = JobQueue(generate, workers=1, max_queued=1, max_active=5)
+    try:
+        running = queue.submit("s1", {})
+        deadline = time.time() + 5
+        while queue.get(running, "s1").started_at is None:
+            assert time.time() < deadline
+            time.sleep(0.01)
+        queue.submit("s2", {})
+        with pytest.raises(JobLimitError) as error:
+            queue.submit("s3", {})
+        assert error.value.reason == "queue_full"
+    finally:
+        generate.release()
+        queue.shutdown()
+
+def test_job_queue_forgets_idle_sessions():
+    queue = JobQueue(lambda job: ("글", [], {}), session_ttl=0)
+    try:
+        job_id = queue.submit("s1", {})
+        wait_done(queue, job_id, "s1")
+        time.sleep(0.01)
+        queue.submit("s2", {})
+        assert queue.get(job_id, "s1") is None
+        assert queue.jobs("s1") == []
+    finally:
+        queue.shutdown()
+
+def test_failed_jobs_keep_their_error():
+    def generate(job):
+        raise RuntimeError("model unavailable")
+
+    queue = JobQueue(generate)
+    try:
+        job = wait_done(queue, queue.submit("s1", {}), "s1")
+        assert job.status == FAILED and job.error == "model unavailable"
+        assert job.finished_at is not None
+    finally:
+        queue.shutdown()
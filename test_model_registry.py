@@ -0,0 +1,23 @@
+"""
+Tests for model_registry.is_throttled.
+
+    python -m pytest -q test_model_registry.py
+"""
+from google.api_core import exceptions
+
+from model_registry import is_throttled
+
+class HttpError(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+def test_throttling_is_judged_by_status_code_or_exception_type():
+    assert is_throttled(exceptions.ResourceExhausted("quota exceeded"))
+    assert is_throttled(exceptions.TooManyRequests("slow down"))
+    assert is_throttled(HttpError("rate limited", 429))
+
+def test_numbers_in_the_message_are_not_a_status_code():
+    assert not is_throttled(exceptions.InvalidArgument("prompt is 4290 tokens, limit 429"))
+    assert not is_throttled(HttpError("429 retries left", 500))
+    assert not is_throttled(ValueError("ResourceExhausted: 429"))
@@ -0,0 +1,104 @@
+"""
+Tests for near_duplicate.NearDuplicateIndex on posts of random syllables.
+
+    python -m pytest -q test_near_duplicate.py
+"""
+import random
+import threading
+
+import pandas as pd
+
+from corpus import CorpusStore
+from near_duplicate import DUPLICATE_THRESHOLD, NearDuplicateIndex
+
+def random_post(rng, chars=600):
+    return "".join(chr(rng.randint(0xAC00, 0xD7A3)) for _ in range(chars))
+
+def edit(rng, text, share=0.05):
+    """`text` with about `share` of its characters replaced."""
+    chars = list(text)
+    for position in rng.sample(range(len(chars)), int(len(chars) * share)):
+        chars[position] = chr(rng.randint(0xAC00, 0xD7A3))
+    return "".join(chars)
+
+def make_store(contents):
+    return CorpusStore.from_frame(pd.DataFrame({
+        "DentistName": [f"행복{i % 3}치과" for i in range(len(contents))],
+        "Topic": [f"주제 {i}" for i in range(len(contents))],
+        "Content": contents,
+    }))
+
+def test_near_duplicates_score_high_and_unrelated_posts_do_not_match():
+    rng = random.Random(0)
+    posts = [random_post(rng) for _ in range(20)]
+    index = NearDuplicateIndex()
+    assert index.update(make_store(posts)) == 20
+
+    matches = index.query(edit(rng, posts[7]), k=3)
+    assert matches[0][0] == 7 and matches[0][1] >= DUPLICATE_THRESHOLD
+    assert all(similarity < DUPLICATE_THRESHOLD for _, similarity in matches[1:])
+    assert index.max_similarity(random_post(rng)) < DUPLICATE_THRESHOLD
+    assert index.query("짧은 글") == []  # Too short to shingle
+
+def test_clusters_join_near_duplicates_transitively():
+    rng = random.Random(1)
+    posts = [random_post(rng) for _ in range(10)]
+    posts.append(edit(rng, posts[2]))
+    posts.append(edit(rng, posts[-1]))
+    posts.append(edit(rng, posts[5]))
+    index = NearDuplicateIndex()
+    index.update(make_store(posts))
+    assert [sorted(cluster) for cluster in index.clusters()] == [[2, 10, 11], [5, 12]]
+
+def test_update_signs_only_appended_rows_and_rebuilds_for_a_new_lineage():
+    rng = random.Random(2)
+    posts = [random_post(rng) for _ in range(12)]
+    store = make_store(posts[:8])
+    index = NearDuplicateIndex()
+    assert index.update(store) == 8
+    assert index.update(store) == 0
+
+    extended = store.extend(pd.DataFrame({"DentistName": ["새치과"] * 4, "Topic": ["새 주제"] * 4,
+                                          "Content": posts[8:]}))
+    assert index.update(extended) == 4 and len(index) == 12
+    assert index.query(posts[10], k=1)[0][0] == 10
+
+    reloaded = make_store(posts[4:])  # Full reload: different lineage
+    assert index.update(reloaded) == 8 and len(index) == 8
+    corpus, matches = index.lookup(posts[10], k=1)
+    assert corpus is reloaded and matches[0][0] == 6
+
+def test_queries_use_the_indexed_posts_while_a_background_update_signs():
+    rng = random.Random(3)
+    posts = [random_post(rng) for _ in range(10)]
+    store = make_store(posts[:5])
+    index = NearDuplicateIndex()
+    index.update(store)
+
+    signing, release = threading.Event(), threading.Event()
+    signatures = index.hasher.signatures
+
+    def slow_signatures(texts):
+        signing.set()
+        release.wait(5)
+        return signatures(texts)
+
+    index.hasher.signatures = slow_signatures
+    extended = store.extend(pd.DataFrame({"DentistName": ["새치과"] * 5, "Topic": ["새 주제"] * 5,
+                                          "Content": posts[5:]}))
+    assert index.update_async(extended)
+    assert signing.wait(5)
+    assert not index.update_async(extended)  # Already running
+
+    # Signing is in progress: queries are answered from the posts indexed so far
+    corpus, matches = index.lookup(posts[2], k=1)
+    assert corpus is store and matches[0][0] == 2
+    assert index.query(posts[8]) == [] and not index.is_current(extended)
+
+    release.set()
+    for _ in range(100):
+        if index.is_current(extended):
+            break
+        threading.Event().wait(0.05)
+    corpus, matches = index.lookup(posts[8], k=1)
+    assert corpus is extended and matches[0][0] == 8
@@ -0,0 +1,85 @@
+"""
+Tests for rag_bot.CompanyBrain with a fake Sheets client, embedding model and LLM.
+
+    python -m pytest -q test_rag_bot.py
+"""
+import time
+
+import fakes
+from rag_bot import CompanyBrain
+
+HEADERS = ["질문", "답변"]
+
+def manual(rows):
+    return fakes.FakeSpreadsheet({"FAQ": [HEADERS] + rows})
+
+def make_brain(client, embeddings, index_dir):
+    return CompanyBrain(embeddings=embeddings, client=client, llm=object(), index_dir=str(index_dir))
+
+def test_load_db_only_embeds_changed_rows_and_removes_deleted_ones(tmp_path, monkeypatch):
+    rows = [["임플란트 가격", "상담 후 안내"], ["진료 시간", "평일 9시-6시"], ["주차", "건물 지하 2층"]]
+    client = fakes.FakeSheetsClient({"사내_매뉴얼_DB": manual(rows)})
+    embeddings = fakes.FakeEmbeddings()
+    brain = make_brain(client, embeddings, tmp_path)
+    assert len(brain.manifest) == 3 and len(embeddings.embedded) == 3
+    assert brain.vector_store.index.ntotal == 3
+
+    synced = []
+    sync_index = brain.sync_index
+    monkeypatch.setattr(brain, "sync_index", lambda *args: synced.append(sync_index(*args)) or synced[-1])
+
+    # Unchanged sheet: nothing is embedded or removed
+    brain.load_db()
+    assert synced[-1] == (0, 0) and len(embeddings.embedded) == 3
+
+    # One row edited, one deleted
+    client.spreadsheets["사내_매뉴얼_DB"] = manual([rows[0], ["진료 시간", "평일 9시-7시"]])
+    brain.load_db()
+    assert synced[-1] == (1, 2)  # The edited row is removed and added again, the deleted one removed
+    assert embeddings.embedded[3:] == ["[사내_매뉴얼_DB-FAQ] 질문: 진료 시간 / 답변: 평일 9시-7시"]
+    assert sorted(brain.manifest) == ["사내_매뉴얼_DB/FAQ/2", "사내_매뉴얼_DB/FAQ/3"]
+    assert brain.vector_store.index.ntotal == 2
+    assert "평일 9시-7시" in brain.vector_store.docstore.search("사내_매뉴얼_DB/FAQ/3").page_content
+
+def test_saved_index_is_reused_after_a_restart(tmp_path):
+    rows = [["임플란트 가격", "상담 후 안내"], ["진료 시간", "평일 9시-6시"]]
+    client = fakes.FakeSheetsClient({"사내_매뉴얼_DB": manual(rows)})
+    make_brain(client, fakes.FakeEmbeddings(), tmp_path)
+
+    embeddings = fakes.FakeEmbeddings()
+    brain = make_brain(client, embeddings, tmp_path)
+    assert embeddings.embedded == []
+    assert len(brain.manifest) == 2 and brain.vector_store.index.ntotal == 2
+
+def test_rows_of_an_unreadable_spreadsheet_are_kept(tmp_path):
+    client = fakes.FakeSheetsClient({"사내_매뉴얼_DB": manual([["주차", "지하 2층"]]),
+                                     "블로그_포스팅_DB": manual([["휴진", "일요일"]])})
+    brain = make_brain(client, fakes.FakeEmbeddings(), tmp_path)
+    assert len(brain.manifest) == 2
+
+    del client.spreadsheets["블로그_포스팅_DB"]  # Not found (e.g. sharing removed) this time
+    brain.load_db()
+    assert len(brain.manifest) == 2
+    report = {r["spreadsheet"]: r["error"] for r in brain.load_report}
+    assert report["블로그_포스팅_DB"] == "not found"
+
+def test_spreadsheets_are_read_concurrently_with_one_request_each(tmp_path):
+    spreadsheets = {name: fakes.FakeSpreadsheet({"탭1": [HEADERS, [name, "1"]], "탭2": [HEADERS, [name, "2"]]},
+                                                latency=0.3)
+                    for name in ("사내_매뉴얼_DB", "블로그_포스팅_DB", "또_다른_시트_이름")}
+    started = time.time()
+    brain = make_brain(fakes.FakeSheetsClient(spreadsheets), fakes.FakeEmbeddings(), tmp_path)
+    assert time.time() - started < 0.75  # Three 0.3 s reads side by side
+    assert len(brain.manifest) == 6
+    # All tabs came from values_batch_get, not from a request per tab
+    assert all(worksheet.calls == 0 for s in spreadsheets.values() for worksheet in s.worksheets())
+
+def test_tabs_are_read_one_by_one_when_the_batch_read_fails(tmp_path):
+    class NoBatchSpreadsheet(fakes.FakeSpreadsheet):
+        def values_batch_get(self, ranges):
+            raise RuntimeError("400 range too large")
+
+    spreadsheet = NoBatchSpreadsheet({"탭1": [HEADERS, ["주차", "지하"]], "빈 탭": []})
+    brain = make_brain(fakes.FakeSheetsClient({"사내_매뉴얼_DB": spreadsheet}), fakes.FakeEmbeddings(), tmp_path)
+    assert sorted(brain.manifest) == ["사내_매뉴얼_DB/탭1/2"]
+    assert [worksheet.calls for worksheet in spreadsheet.worksheets()] == [1, 1]
@@ -0,0 +1,58 @@
+"""
+Tests for the reference selection: relevance ranking and token budget packing.
+
+    python -m pytest -q test_references.py
+"""
+import pandas as pd
+
+import generator
+from data_loader import DentistIndex
+from generator import get_dentist_references
+from reference_packing import pack_references
+
+POSTS = [
+    ("행복치과", "임플란트 수술 후 관리", "임플란트 수술 후에는 딱딱한 음식을 피하고 임플란트 주변을 깨끗하게 관리해야 합니다."),
+    ("행복치과", "스케일링 주기", "스케일링은 일 년에 한 번 받는 것이 좋습니다. 치석이 쌓이면 잇몸이 붓습니다."),
+    ("행복치과", "사랑니 발치", "사랑니 발치 후에는 거즈를 꽉 물고 계셔야 합니다."),
+    ("행복치과", "치아교정 기간", "치아교정 기간은 치아 상태에 따라 다르지만 보통 이 년 정도 걸립니다."),
+    ("미소치과", "임플란트 가격", "임플란트 가격은 재료와 뼈 이식 여부에 따라 달라집니다."),
+]
+
+def make_index():
+    frame = pd.DataFrame(POSTS, columns=["DentistName", "Topic", "Content"])
+    return DentistIndex(frame, version=1)
+
+def test_search_ranks_the_dentists_posts_by_relevance():
+    index = make_index()
+    assert index.search("행복치과", "임플란트 관리", k=3)[0] == 0
+    assert index.search("행복치과", "스케일링 치석", k=1) == [1]
+    assert 4 not in index.search("행복치과", "임플란트 가격", k=4)  # Another dentist's post
+    assert index.search("행복치과", "우주선 발사", k=3) == []
+
+def test_relevant_posts_come_first_and_the_rest_is_sampled():
+    index = make_index()
+    references = get_dentist_references("행복치과", n=3, index=index, seed="a", query="임플란트 수술 관리")
+    assert references[0] == POSTS[0][2]
+    assert len(set(references)) == 3 and all(r in [p[2] for p in POSTS[:4]] for r in references)
+    assert references == get_dentist_references("행복치과", n=3, index=index, seed="a", query="임플란트 수술 관리")
+    assert get_dentist_references("없는치과", index=index, query="임플란트") == []
+
+def test_selection_mode_is_read_when_called(monkeypatch):
+    index = make_index()
+    searched = []
+    monkeypatch.setattr(index, "search", lambda *args: searched.append(args) or [3])
+    monkeypatch.setattr(generator, "REFERENCE_SELECTION", "random")
+    assert len(get_dentist_references("행복치과", n=2, index=index, seed="b", query="교정")) == 2
+    assert searched == []
+
+    monkeypatch.setattr(generator, "REFERENCE_SELECTION", "relevance")
+    assert get_dentist_references("행복치과", n=2, index=index, seed="b", query="교정")[0] == POSTS[3][2]
+    assert len(searched) == 1
+
+def test_packing_keeps_the_relevance_order_unless_shortest_first():
+    counter = len
+    candidates = ["가" * 300, "나" * 100, "다" * 200]
+    references, _ = pack_references(candidates, budget=1000, counter=counter)
+    assert references == candidates
+    references, _ = pack_references(candidates, budget=1000, counter=counter, shortest_first=True)
+    assert references == ["나" * 100, "다" * 200, "가" * 300]
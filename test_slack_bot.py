@@ -0,0 +1,135 @@
+"""
+Tests for the Slack serving layer, with a fake brain and a mock Slack client.
+
+    python -m pytest -q test_slack_bot.py
+"""
+import time
+import asyncio
+import threading
+
+from langchain_core.documents import Document
+
+from slack_bot import BrainService, ChannelBusy, handle_mention
+
+class RecordingBrain:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.questions = []
+        self._lock = threading.Lock()
+
+    def ask(self, question):
+        with self._lock:
+            self.questions.append(question)
+        time.sleep(self.delay)
+        return f"답: {question}", []
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_brain_service_coalesces_identical_questions():
+    async def main():
+        brain = RecordingBrain()
+        service = BrainService(brain, max_workers=2)
+        await service.start()
+        try:
+            answers = await asyncio.gather(service.ask("A", "임플란트 가격?"), service.ask("B", "임플란트   가격"),
+                                           service.ask("A", "교정 기간"))
+        finally:
+            await service.stop()
+        return brain, service, answers
+
+    brain, service, answers = run(main())
+    assert sorted(brain.questions) == ["교정 기간", "임플란트 가격?"]
+    assert service.coalesced == 1
+    assert answers[0] == answers[1] == ("답: 임플란트 가격?", [])
+
+def test_brain_service_lets_channels_take_turns():
+    async def main():
+        brain = RecordingBrain(delay=0.01)
+        service = BrainService(brain, max_workers=1)
+        await service.start()
+        try:
+            # All queued before the single worker picks the first one
+            await asyncio.gather(*[service.ask("busy", f"질문 {i}") for i in range(3)],
+                                 service.ask("quiet", "다른 질문"))
+        finally:
+            await service.stop()
+        return brain
+
+    brain = run(main())
+    assert brain.questions == ["질문 0", "다른 질문", "질문 1", "질문 2"]
+
+def test_brain_service_limits_pending_questions_per_channel():
+    async def main():
+        service = BrainService(RecordingBrain(), max_workers=1, max_pending_per_channel=1)
+        await service.start()
+        try:
+            return await asyncio.gather(service.ask("A", "질문 1"), service.ask("A", "질문 2"),
+                                        return_exceptions=True)
+        finally:
+            await service.stop()
+
+    first, second = run(main())
+    assert first == ("답: 질문 1", [])
+    assert isinstance(second, ChannelBusy)
+
+class MockSlackClient:
+    """Records the chat_postMessage / chat_update calls handle_mention makes."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def chat_postMessage(self, **kwargs):
+        self.calls.append(("post", kwargs))
+        return {"ts": f"ack{len(self.calls)}"}
+
+    async def chat_update(self, **kwargs):
+        self.calls.append(("update", kwargs))
+
+class SourcedBrain(RecordingBrain):
+    def ask(self, question):
+        answer, _ = super().ask(question)
+        return answer, [Document(page_content="[사내_매뉴얼_DB-FAQ] 질문: 주차 / 답변: 지하 2층"),
+                        Document(page_content="[사내_매뉴얼_DB-FAQ] 질문: 휴진 / 답변: 일요일")]
+
+def mention(brain, event):
+    async def main():
+        service = BrainService(brain, max_workers=1)
+        await service.start()
+        client = MockSlackClient()
+        try:
+            await handle_mention(service, event, client)
+        finally:
+            await service.stop()
+        return client.calls
+
+    return run(main())
+
+def test_handle_mention_acknowledges_then_updates_with_the_answer():
+    calls = mention(SourcedBrain(), {"channel": "C1", "ts": "100.1", "text": "<@U123> 주차는 어디에 하나요?"})
+
+    assert [kind for kind, _ in calls] == ["post", "update"]
+    ack, update = calls[0][1], calls[1][1]
+    assert ack["channel"] == "C1" and ack["thread_ts"] == "100.1" and "확인 중" in ack["text"]
+    assert update["channel"] == "C1" and update["ts"] == "ack1"
+    assert update["text"] == "답: 주차는 어디에 하나요?\n\n📚 출처: 사내_매뉴얼_DB-FAQ"
+
+def test_handle_mention_answers_in_the_existing_thread():
+    calls = mention(RecordingBrain(), {"channel": "C1", "ts": "200.2", "thread_ts": "100.1", "text": "<@U1> 휴진일?"})
+    assert calls[0][1]["thread_ts"] == "100.1"
+    assert calls[1][1]["text"] == "답: 휴진일?"
+
+def test_handle_mention_without_a_question_asks_for_one():
+    brain = RecordingBrain()
+    calls = mention(brain, {"channel": "C1", "ts": "100.1", "text": "<@U123>  "})
+    assert [kind for kind, _ in calls] == ["post"]
+    assert "질문" in calls[0][1]["text"] and brain.questions == []
+
+def test_handle_mention_reports_a_failed_answer():
+    class FailingBrain:
+        def ask(self, question):
+            raise RuntimeError("LLM down")
+
+    calls = mention(FailingBrain(), {"channel": "C1", "ts": "100.1", "text": "<@U1> 주차?"})
+    assert [kind for kind, _ in calls] == ["post", "update"]
+    assert calls[1][1]["text"].startswith("❌")